@@ -0,0 +1,136 @@
+"""
+    Description: Benchmarks the vectorized Point filtering ("filterPoints") and
+    enrichment ("improveReadability") steps of "homogenizeEvents.py" against
+    the original row-by-row lambda versions, which are kept here for
+    comparison only. Synthetic Events are made by repeating the features of
+    "./homogenize/data/events.geojson" with unique event ids.
+
+    Before timing, the output of both versions is checked to be byte-identical
+    (as written by GeoDataFrame.to_json) for the smallest size.
+
+    Input: Optional list of feature counts to benchmark, 10k, 100k and 1M by
+    default (e.g. "py ./benchmark/benchmarkVectorized.py 10000 50000")
+
+    Output: Table of timings and speedups printed to the console
+"""
+
+## IMPORTS
+import copy # For making unique synthetic features
+import json # For reading the bundled EONET data
+from pathlib import Path # For locating the homogenize folder
+import sys # For script arguments and importing homogenizeEvents
+import time # For timing each step
+
+repoRoot = Path(__file__).resolve().parent.parent
+sys.path.append(str(repoRoot / "homogenize"))
+import geopandas as gpd # For building the synthetic GeoDataFrames
+import homogenizeEvents # Functions being benchmarked
+
+## CONSTANTS
+defaultSizes = [10_000, 100_000, 1_000_000]
+dataLocation = repoRoot / "homogenize" / "data"
+
+## HELPER FUNCTIONS
+
+def legacyFilterPoints(eventsGDF):
+    """
+        Original row-by-row Point filter of "homogenizeData".
+
+        Input: GeoDataFrame eventsGDF
+
+        Output: GeoDataFrame with only the Point rows of eventsGDF
+    """
+    return eventsGDF[eventsGDF['geometry'].apply(lambda x : x.geom_type == 'Point')]
+
+def legacyImproveReadability(homogenizedEvents, parsedEONETData):
+    """
+        Original row-by-row version of "improveReadability".
+
+        Input: GeoDataFrame homogenizedEvents to alter, dict of dicts
+        parsedEONETData for creating the two new columns
+
+        Output: Modded GeoDataFrame homogenizedEvents
+    """
+    categories = parsedEONETData['Categories']
+    getCategory = lambda e : categories[e[0]['id']]['title']
+    homogenizedEvents['simpleCategory'] = homogenizedEvents.categories.apply(getCategory)
+
+    sources = parsedEONETData['Sources']
+    getSources = lambda e : ', '.join([sources[d['id']]['title'] for d in e])
+    homogenizedEvents['simpleSources'] = homogenizedEvents.sources.apply(getSources)
+
+    return homogenizedEvents
+
+def makeSyntheticEvents(numFeatures, features):
+    """
+        Makes a GeoDataFrame of numFeatures events by cycling through features,
+        giving every repeated feature a unique event id.
+
+        Input: Positive integer numFeatures, list of GeoJSON feature dicts
+
+        Output: GeoDataFrame of synthetic events
+    """
+    syntheticFeatures = []
+    for index in range(numFeatures):
+        feature = copy.copy(features[index % len(features)])
+        feature["properties"] = dict(feature["properties"],
+                                     id=f"SYNTH_{index}")
+        syntheticFeatures.append(feature)
+    return gpd.GeoDataFrame.from_features(syntheticFeatures,
+                                          crs=homogenizeEvents.geo_crs)
+
+def timeCall(function, *arguments):
+    """
+        Times a single call of function.
+
+        Input: Callable function and the arguments to call it with
+
+        Output: Tuple of (seconds taken, value returned)
+    """
+    startTime = time.perf_counter()
+    result = function(*arguments)
+    return time.perf_counter() - startTime, result
+
+## MAIN
+if __name__ == "__main__":
+
+    sizes = [int(size) for size in sys.argv[1:]] or defaultSizes
+
+    # Read the bundled data once
+    with open(dataLocation / "events.geojson", "r") as inFile:
+        features = json.load(inFile)["features"]
+    with open(dataLocation / "categories.json", "r") as inFile:
+        categories = json.load(inFile)
+    with open(dataLocation / "sources.json", "r") as inFile:
+        sources = json.load(inFile)
+    parsedEONETData = homogenizeEvents.parseData(
+        {"Events": None, "Categories": categories, "Sources": sources})
+
+    print(f"{'features':>10} {'step':<20} {'legacy (s)':>11} "
+          f"{'vectorized (s)':>15} {'speedup':>8}")
+    for size in sizes:
+        eventsGDF = makeSyntheticEvents(size, features)
+
+        # Point filtering
+        legacyFilterTime, legacyPoints = timeCall(legacyFilterPoints, eventsGDF)
+        filterTime, points = timeCall(homogenizeEvents.filterPoints, eventsGDF)
+
+        # Enrichment
+        legacyPoints = legacyPoints.drop(columns=['geometryDates'])
+        points = points.drop(columns=['geometryDates'])
+        legacyReadabilityTime, legacyPoints = timeCall(
+            legacyImproveReadability, legacyPoints, parsedEONETData)
+        readabilityTime, points = timeCall(
+            homogenizeEvents.improveReadability, points, parsedEONETData)
+
+        # Outputs must not change; checking the smallest size is enough
+        if size == min(sizes):
+            legacyJSON = legacyPoints.to_json(drop_id = True, indent = 4)
+            vectorizedJSON = points.to_json(drop_id = True, indent = 4)
+            assert legacyJSON == vectorizedJSON, "Outputs differ"
+
+        for step, legacyTime, newTime in [
+                ("filterPoints", legacyFilterTime, filterTime),
+                ("improveReadability", legacyReadabilityTime, readabilityTime)]:
+            print(f"{size:>10} {step:<20} {legacyTime:>11.3f} {newTime:>15.3f}"
+                  f" {legacyTime / newTime:>7.1f}x")
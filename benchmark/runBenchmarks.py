@@ -0,0 +1,345 @@
+"""
+    Description: End-to-end benchmark suite of the pull + homogenize pipeline.
+    For every size, synthetic EONET data is made with "syntheticEONET.py" and
+    served by the local stub API ("stubServer.py", with optional latency and
+    429s), then the pipeline is run stage by stage in a fresh process (so peak
+    memory is measured cleanly per size):
+
+    - "pullData.requestEONETData" from the stub
+    - "snapshotStore.saveSnapshot", pullData.py's write stage
+    - "homogenizeEvents.readData", "parseData", "homogenizeData" and
+      "improveReadability"
+    - "homogenizeEvents.writeEONETData"
+    - "homogenizeEvents.homogenizeFeatures" and "writeFeatureCollection", the
+      default light engine's homogenize + write stages
+
+    Wall time, CPU time, and peak RSS are recorded for each stage; on Linux the
+    peak is reset when a stage starts, so it is the stage's own (elsewhere it
+    is the peak of the process so far).
+    Results are written as JSON together with the environment they were
+    measured in (Python, platform, CPUs, git commit, package versions), so
+    runs of different versions can be compared with "--compare".
+
+    Input: Optional script arguments (see "parseArguments"), e.g.
+    "py ./benchmark/runBenchmarks.py --sizes 1000 100000 --latency 0.05
+    --compare ./benchmark/results/old.json"
+
+    Output: Table of timings printed to the console and JSON results in
+    "./benchmark/results"; exits with status 1 if "--compare" found a stage
+    that got slower than the threshold
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+from datetime import datetime, timezone # For naming results
+from importlib import metadata # For recording package versions
+import json # For reading + writing results
+import os # For counting CPUs
+from pathlib import Path # For locating the repo and output folders
+import platform # For recording the environment
+import socket # For finding a free port + waiting for the stub
+import subprocess # For running the stub and each size in its own process
+import sys # For the Python executable and importing the pipeline
+import tempfile # For the pipeline's scratch folder
+import time # For timing each stage
+
+repoRoot = Path(__file__).resolve().parent.parent
+sys.path.append(str(repoRoot))
+sys.path.append(str(repoRoot / "homogenize"))
+import pipelineMetrics # For resetting + reading the peak RSS of each stage
+import syntheticEONET # For making the data served by the stub
+
+## CONSTANTS
+defaultSizes = [1_000, 10_000, 100_000]
+defaultDataLocation = repoRoot / "benchmark" / "data" # Cached synthetic data
+defaultResultsLocation = repoRoot / "benchmark" / "results"
+regressionThreshold = 1.2 # Slowdown ratio "--compare" flags
+packages = ["geopandas", "numpy", "orjson", "pandas", "pyarrow", "requests",
+            "shapely"]
+stubStartTimeout = 10.0 # Seconds to wait for the stub to accept connections
+
+## HELPER FUNCTIONS
+
+def compareResults(previousResults, results, threshold=regressionThreshold):
+    """
+        Compares the wall time of every stage of every size in both results.
+
+        Input: Dict previousResults and dict results (as written by this
+        script), float threshold ratio above which a stage counts as slower
+
+        Output: List of strings, one per stage that got slower
+    """
+    regressions = []
+    for size, sizeResults in results["sizes"].items():
+        previousStages = previousResults["sizes"].get(size, {}).get("stages",
+                                                                   {})
+        for stage, timings in sizeResults["stages"].items():
+            if stage not in previousStages or \
+               previousStages[stage]["wall"] <= 0:
+                continue
+            ratio = timings["wall"] / previousStages[stage]["wall"]
+            if ratio > threshold:
+                regressions.append(
+                    f"{stage} at {size} features: {ratio:.2f}x slower "
+                    f"({previousStages[stage]['wall']:.3f}s -> "
+                    f"{timings['wall']:.3f}s)")
+    return regressions
+
+def describeEnvironment():
+    """
+        Describes the environment results are measured in.
+
+        Input: None
+
+        Output: Dict of Python version, platform, CPU count, git commit, and
+        package versions (None if not installed)
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                cwd=repoRoot, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {"python": platform.python_version(),
+            "platform": platform.platform(), "processor": platform.machine(),
+            "cpus": os.cpu_count(), "commit": commit, "packages": versions}
+
+def findFreePort():
+    """
+        Finds a port on localhost nothing listens on.
+
+        Input: None
+
+        Output: Integer port
+    """
+    with socket.socket() as freeSocket:
+        freeSocket.bind(("127.0.0.1", 0))
+        return freeSocket.getsockname()[1]
+
+def measureStage(stages, stageName, function, *args):
+    """
+        Runs function(*args) and records its wall time, CPU time, and peak RSS
+        in stages. The peak is reset first where the OS allows it (see 
+        "pipelineMetrics.resetPeakRSS"), so later stages do not inherit the
+        peak of earlier ones.
+
+        Input: Dict stages to record in, string stageName, function to run and
+        its arguments
+
+        Output: Whatever function returned
+    """
+    pipelineMetrics.resetPeakRSS()
+    wallStart, cpuStart = time.perf_counter(), time.process_time()
+    result = function(*args)
+    wall, cpu = time.perf_counter() - wallStart, time.process_time() - cpuStart
+    peakRSS = pipelineMetrics.readPeakRSS()
+    stages[stageName] = {"wall": wall, "cpu": cpu, "peakRSSMB": 
+                         None if peakRSS is None else peakRSS / 1024 / 1024}
+    return result
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks the pull + "
+                                     "homogenize pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=defaultSizes,
+                        help="numbers of features to benchmark (default: "
+                        "%(default)s)")
+    parser.add_argument("--lines", type=float, default=0.03,
+                        help="share of features that are LineStrings "
+                        "(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the synthetic data (default: "
+                        "%(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the stub waits before answering "
+                        "(default: %(default)s)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="share of requests the stub answers with a 429 "
+                        "(default: %(default)s)")
+    parser.add_argument("--format", default="geojson",
+                        choices=["geojson", "parquet", "feather"],
+                        help="output format of the homogenized events "
+                        "(default: %(default)s)")
+    parser.add_argument("--data", default=str(defaultDataLocation),
+                        help="folder synthetic data is cached in (default: "
+                        "%(default)s)")
+    parser.add_argument("--output", default=str(defaultResultsLocation),
+                        help="folder results are written to (default: "
+                        "%(default)s)")
+    parser.add_argument("--compare", metavar="RESULTS",
+                        help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float,
+                        default=regressionThreshold,
+                        help="slowdown ratio flagged by --compare (default: "
+                        "%(default)s)")
+    parser.add_argument("--pipeline", nargs=3,
+                        metavar=("BASE_URL", "DATA", "FORMAT"),
+                        help=argparse.SUPPRESS) # Internal: one size's run
+    return parser.parse_args(arguments)
+
+def runPipeline(baseURL, dataFolder, eventsFormat):
+    """
+        Runs every stage of the pipeline once against the stub at baseURL.
+        Imports happen here so they are not counted towards the stages.
+
+        Input: String baseURL of the stub, string dataFolder it serves, string
+        eventsFormat of the homogenized events
+
+        Output: Dict of stage name to its timings (see "measureStage")
+    """
+    import geopandas # Otherwise imported lazily by the first geopandas stage
+    import homogenizeEvents
+    import pullData
+    import snapshotStore
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as workFolder:
+        EONETData = measureStage(stages, "requestEONETData",
+                                 pullData.requestEONETData, 5, 0.1, baseURL)
+        measureStage(stages, "saveSnapshot", snapshotStore.saveSnapshot,
+                     f"{workFolder}/snapshots", EONETData, "benchmark")
+        del EONETData
+
+        EONETData = measureStage(stages, "readData",
+                                 homogenizeEvents.readData, dataFolder)
+        parsedEONETData = measureStage(stages, "parseData",
+                                       homogenizeEvents.parseData, EONETData)
+        homogenizedEvents = measureStage(stages, "homogenizeData",
+                                         homogenizeEvents.homogenizeData,
+                                         parsedEONETData)
+        homogenizedEvents = measureStage(stages, "improveReadability",
+                                         homogenizeEvents.improveReadability,
+                                         homogenizedEvents, parsedEONETData)
+        fileLocations = homogenizeEvents.createOutputFiles(workFolder,
+                                                           eventsFormat)
+        measureStage(stages, "writeEONETData", homogenizeEvents.writeEONETData,
+                     fileLocations, parsedEONETData, homogenizedEvents,
+                     eventsFormat)
+        del homogenizedEvents
+
+        homogenizedFeatures = measureStage(
+            stages, "homogenizeFeatures", homogenizeEvents.homogenizeFeatures,
+            parsedEONETData)
+        measureStage(stages, "writeFeatureCollection",
+                     homogenizeEvents.writeFeatureCollection,
+                     f"{workFolder}/lightEvents.geojson", homogenizedFeatures)
+    return stages
+
+def runSize(numFeatures, arguments):
+    """
+        Benchmarks one size: makes (or reuses) its synthetic data, serves it
+        with the stub, and runs "runPipeline" in a new process.
+
+        Input: Positive integer numFeatures, argparse Namespace arguments from
+        "parseArguments"
+
+        Output: Dict with the data's size and every stage's timings
+    """
+    dataFolder = Path(arguments.data,
+                      f"{numFeatures}-{arguments.lines}-{arguments.seed}")
+    if not (dataFolder / "sources.json").exists():
+        print(f"Generating {numFeatures} features in {dataFolder}")
+        syntheticEONET.writeSyntheticData(str(dataFolder), numFeatures,
+                                          arguments.lines, arguments.seed)
+
+    port = findFreePort()
+    stub = startStub(port, dataFolder, arguments)
+    try:
+        run = subprocess.run(
+            [sys.executable, __file__, "--pipeline",
+             f"http://127.0.0.1:{port}", str(dataFolder), arguments.format],
+            capture_output=True, text=True)
+    finally:
+        stub.terminate()
+        stub.wait()
+    if run.returncode != 0:
+        raise RuntimeError(f"Benchmark of {numFeatures} features failed:\n"
+                           f"{run.stderr}")
+    return {"features": numFeatures,
+            "eventsBytes": (dataFolder / "events.geojson").stat().st_size,
+            "stages": json.loads(run.stdout.splitlines()[-1])}
+
+def startStub(port, dataFolder, arguments):
+    """
+        Starts the stub API serving dataFolder and waits until it accepts
+        connections.
+
+        Input: Integer port, Path dataFolder, argparse Namespace arguments
+        from "parseArguments"
+
+        Output: subprocess.Popen of the stub
+    """
+    stub = subprocess.Popen(
+        [sys.executable, str(repoRoot / "benchmark" / "stubServer.py"),
+         str(port), "--data", str(dataFolder), "--quiet",
+         "--latency", str(arguments.latency),
+         "--throttle-rate", str(arguments.throttle_rate)],
+        stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + stubStartTimeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return stub
+        except OSError:
+            if stub.poll() is not None or time.monotonic() > deadline:
+                stub.kill()
+                raise RuntimeError(f"Stub API did not start on port {port}")
+            time.sleep(0.05)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    if arguments.pipeline: # Runs one size and reports back to the parent
+        print(json.dumps(runPipeline(*arguments.pipeline)))
+        sys.exit(0)
+
+    results = {"createdAt": datetime.now(timezone.utc).isoformat(),
+               "environment": describeEnvironment(),
+               "settings": {"lines": arguments.lines, "seed": arguments.seed,
+                            "latency": arguments.latency,
+                            "throttleRate": arguments.throttle_rate,
+                            "format": arguments.format},
+               "sizes": {}}
+    for numFeatures in arguments.sizes:
+        sizeResults = runSize(numFeatures, arguments)
+        results["sizes"][str(numFeatures)] = sizeResults
+        print(f"\n{numFeatures} features "
+              f"({sizeResults['eventsBytes'] / 1024 / 1024:.1f} MB of events)")
+        print(f"{'stage':<24}{'wall (s)':>10}{'cpu (s)':>10}"
+              f"{'peak RSS (MB)':>15}")
+        for stage, timings in sizeResults["stages"].items():
+            peak = timings["peakRSSMB"]
+            print(f"{stage:<24}{timings['wall']:>10.3f}{timings['cpu']:>10.3f}"
+                  f"{peak if peak is None else round(peak, 1):>15}")
+
+    Path(arguments.output).mkdir(parents=True, exist_ok=True)
+    commit = results["environment"]["commit"] or "unknown"
+    resultsFile = Path(arguments.output, datetime.now().strftime(
+        f"%Y-%m-%d_%H-%M-%S_{commit}.json"))
+    resultsFile.write_text(json.dumps(results, indent=4))
+    print(f"\nResults written to {resultsFile}")
+
+    if arguments.compare:
+        previousResults = json.loads(Path(arguments.compare).read_text())
+        regressions = compareResults(previousResults, results,
+                                     arguments.threshold)
+        print(f"\nCompared against {arguments.compare} "
+              f"(commit {previousResults['environment']['commit']}):")
+        for regression in regressions:
+            print(f"  SLOWER: {regression}")
+        if not regressions:
+            print(f"  no stage more than {arguments.threshold}x slower")
+        sys.exit(1 if regressions else 0)
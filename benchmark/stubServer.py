@@ -0,0 +1,238 @@
+"""
+    Description: Local stub of the EONET API for testing and benchmarking
+    "pullData.py" without touching NASA's servers. Serves the bundled data in
+    "./homogenize/data" (or "--data", e.g. made by "syntheticEONET.py") at
+    "/events/geojson", "/categories" and "/sources" with ETags (answering
+    If-None-Match with 304s); unfiltered files are streamed from disk however
+    large. Events honor EONET's "start", "end", "category", "status" and
+    "limit" parameters.
+
+    The stub can also misbehave on purpose: every response carries
+    api.nasa.gov style "X-RateLimit-Limit" + "X-RateLimit-Remaining" headers
+    (plus "X-RateLimit-Reset", seconds until the window resets) for a fixed
+    quota per window, requests over the quota get a 429 with "Retry-After", a
+    share of requests can be answered with 429s or 503s regardless of the
+    quota, every response can be delayed ("--latency"), and streamed files
+    can be cut off partway through ("--cut-off"), without a Content-Length so
+    only the client's own checks can tell.
+
+    Input: Port and optional misbehaviour settings, e.g.
+    "py ./benchmark/stubServer.py 8000 --quota 5 --window 10 --throttle-rate
+    0.2", then "py pullData.py --base-url http://127.0.0.1:8000"
+
+    Output: Stub server running until interrupted; each request is printed
+    with the status it got
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+import hashlib # For ETags
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Server
+import json # For filtering events by the request's parameters
+from pathlib import Path # For locating the bundled data
+import random # For randomly throttling/failing requests
+import shutil # For streaming large files
+import sys # For printing requests
+import threading # For counting requests across server threads
+import time # For quota windows and latency
+from urllib.parse import parse_qs, urlparse # For reading request paths
+
+## CONSTANTS
+dataLocation = Path(__file__).resolve().parent.parent / "homogenize" / "data"
+routes = {"/events/geojson": "events.geojson", "/categories": "categories.json",
+          "/sources": "sources.json"}
+streamChunkSize = 1024 * 1024 # Bytes sent at a time when streaming files
+
+## HELPER FUNCTIONS
+
+def createHandler(settings):
+    """
+        Creates a request handler class bound to the stub's settings and
+        shared quota state.
+
+        Input: argparse Namespace settings from "parseArguments"
+
+        Output: BaseHTTPRequestHandler subclass
+    """
+    quota = {"lock": threading.Lock(), "windowStart": time.monotonic(),
+             "used": 0}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(settings.latency)
+            requestURL = urlparse(self.path)
+            if requestURL.path not in routes:
+                self.sendBody(404, b"{}")
+                return
+
+            # Quota per window, api.nasa.gov style
+            with quota["lock"]:
+                now = time.monotonic()
+                if now - quota["windowStart"] >= settings.window:
+                    quota["windowStart"], quota["used"] = now, 0
+                quota["used"] += 1
+                remaining = settings.quota - quota["used"]
+                resetIn = settings.window - (now - quota["windowStart"])
+            rateHeaders = {"X-RateLimit-Limit": str(settings.quota),
+                           "X-RateLimit-Remaining": str(max(0, remaining)),
+                           "X-RateLimit-Reset": str(max(1, round(resetIn)))}
+            if remaining < 0:
+                rateHeaders["Retry-After"] = str(max(1, round(resetIn)))
+                self.sendBody(429, b'{"error": "OVER_RATE_LIMIT"}',
+                              rateHeaders)
+                return
+
+            # Random misbehaviour
+            roll = random.random()
+            if roll < settings.throttle_rate:
+                rateHeaders["Retry-After"] = str(settings.retry_after)
+                self.sendBody(429, b'{"error": "OVER_RATE_LIMIT"}',
+                              rateHeaders)
+                return
+            if roll < settings.throttle_rate + settings.error_rate:
+                self.sendBody(503, b"{}", rateHeaders)
+                return
+
+            dataFile = Path(settings.data, routes[requestURL.path])
+            query = parse_qs(requestURL.query)
+            if requestURL.path == "/events/geojson" and query:
+                with open(dataFile, "rb") as inFile:
+                    events = filterEvents(json.load(inFile), query)
+                body = json.dumps(events).encode()
+                rateHeaders["ETag"] = f'"{hashlib.md5(body).hexdigest()}"'
+            else: # Unfiltered files are streamed from disk, however large
+                body = None
+                fileStats = dataFile.stat()
+                rateHeaders["ETag"] = \
+                    f'"{fileStats.st_size}-{fileStats.st_mtime_ns}"'
+            if self.headers.get("If-None-Match") == rateHeaders["ETag"]:
+                self.sendBody(304, b"", rateHeaders)
+            elif body is None:
+                self.sendFile(dataFile, rateHeaders)
+            else:
+                self.sendBody(200, body, rateHeaders)
+
+        def sendBody(self, status, body, headers=None):
+            self.send_response(status)
+            for header, value in (headers or {}).items():
+                self.send_header(header, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def sendFile(self, dataFile, headers):
+            self.send_response(200)
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.send_header("Content-Type", "application/json")
+            fileSize = dataFile.stat().st_size
+            if settings.cut_off is None:
+                self.send_header("Content-Length", str(fileSize))
+            else: # The body then ends when the connection is dropped
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            self.end_headers()
+            with open(dataFile, "rb") as inFile:
+                if settings.cut_off is None:
+                    shutil.copyfileobj(inFile, self.wfile, streamChunkSize)
+                else:
+                    self.wfile.write(inFile.read(int(fileSize *
+                                                     settings.cut_off)))
+
+        def log_message(self, format, *args):
+            if not settings.quiet:
+                sys.stdout.write(f"{self.path} {args[1]}\n")
+
+    return StubHandler
+
+def filterEvents(events, query):
+    """
+        Filters events like EONET does: events with any geometry dated within
+        "start" to "end" (inclusive days), of a "category", with a "status"
+        ("open" by default, "closed", or "all"), capped at "limit" events. All
+        features of a matching event are kept.
+
+        Input: GeoJSON FeatureCollection dict events, dict query from
+        parse_qs
+
+        Output: Filtered GeoJSON FeatureCollection dict
+    """
+    start = query.get("start", [""])[0]
+    end = query.get("end", ["9999"])[0] + "T23:59:59Z"
+    categories = set(query["category"][0].split(",")) \
+                 if "category" in query else None
+    status = query.get("status", ["open"])[0]
+    limit = int(query["limit"][0]) if "limit" in query else None
+
+    matchingIds = {} # Ordered set of event ids
+    for feature in events["features"]:
+        properties = feature["properties"]
+        dates = [properties["date"]] if properties.get("date") else \
+                [date.replace(" ", "T") + "Z"
+                 for date in properties.get("geometryDates") or []]
+        isClosed = properties["closed"] is not None
+        if any(start <= date <= end for date in dates) and \
+           (categories is None or properties["categories"][0]["id"]
+            in categories) and \
+           (status == "all" or isClosed == (status == "closed")):
+            matchingIds[properties["id"]] = None
+    matchingIds = set(list(matchingIds)[:limit])
+
+    return dict(events, features=[feature for feature in events["features"]
+                                  if feature["properties"]["id"]
+                                  in matchingIds])
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Runs a local stub of the "
+                                     "EONET API")
+    parser.add_argument("port", type=int, help="port to listen on")
+    parser.add_argument("--data", default=str(dataLocation),
+                        help="folder with the events.geojson, "
+                        "categories.json, and sources.json files to serve, "
+                        "e.g. from syntheticEONET.py (default: the bundled "
+                        "data)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not print requests")
+    parser.add_argument("--quota", type=int, default=1000,
+                        help="requests allowed per window (default: "
+                        "%(default)s)")
+    parser.add_argument("--window", type=float, default=3600.0,
+                        help="quota window in seconds (default: %(default)s)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="share of requests answered with a 429 "
+                        "(default: %(default)s)")
+    parser.add_argument("--retry-after", type=int, default=1,
+                        help="Retry-After seconds of random 429s (default: "
+                        "%(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with a 503 "
+                        "(default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering (default: "
+                        "%(default)s)")
+    parser.add_argument("--cut-off", type=float, metavar="SHARE",
+                        help="drop the connection after this share of every "
+                        "streamed file, e.g. 0.5 for half")
+    return parser.parse_args(arguments)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    server = ThreadingHTTPServer(("127.0.0.1", arguments.port),
+                                 createHandler(arguments))
+    print(f"Stub EONET API listening on http://127.0.0.1:{arguments.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,198 @@
+"""
+    Description: Generates realistic synthetic EONET data for benchmarks: an
+    Events FeatureCollection of any size (1k to 10M+ features) plus the
+    Categories and Sources it refers to, written with the same file names and
+    formatting as pullData.py output.
+
+    Events mimic the real feed ("./homogenize/data/events.geojson"): most are
+    a single Point, some are tracked over several dated Points (a random walk,
+    e.g. an iceberg or storm), categories + sources + magnitudes follow the
+    real mix, and a configurable share of features are LineStrings whose
+    vertices (and 'geometryDates') repeat the event's Points, like EONET's own
+    LineStrings. Events are generated and written one at a time, so memory
+    stays flat however many features are asked for. The same seed always
+    gives the same data.
+
+    Input: Number of features and optional settings, e.g.
+    "py ./benchmark/syntheticEONET.py 100000 ./benchmark/data --lines 0.05"
+
+    Output: "events.geojson", "categories.json", and "sources.json" in the
+    given folder
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+from datetime import datetime, timedelta # For dating geometries
+from pathlib import Path # For locating the bundled data and output folder
+import random # For generating events
+import shutil # For copying Categories and Sources
+import sys # For importing homogenizeEvents
+
+repoRoot = Path(__file__).resolve().parent.parent
+sys.path.append(str(repoRoot / "homogenize"))
+import homogenizeEvents # For writing the FeatureCollection like EONET does
+
+## CONSTANTS
+dataLocation = repoRoot / "homogenize" / "data"
+# Category id -> (title, weight, source id choices, magnitude unit + range)
+categoryMix = {
+    "seaLakeIce": ("Sea and Lake Ice", 0.55,
+                   [("NATICE",), ("EO", "NATICE"), ("BYU_ICE", "NATICE")],
+                   ("NM^2", 10.0, 2000.0)),
+    "wildfires": ("Wildfires", 0.35,
+                  [("InciWeb",), ("MBFIRE",), ("PDC",), ("InciWeb", "PDC")],
+                  None),
+    "volcanoes": ("Volcanoes", 0.04, [("SIVolcano",)], None),
+    "severeStorms": ("Severe Storms", 0.04, [("GDACS", "JTWC")],
+                     ("kts", 30.0, 150.0)),
+    "floods": ("Floods", 0.02, [("GDACS",)], None)}
+trackedShare = 0.1 # Share of events tracked over several Points
+closedShare = 0.3 # Share of events that are closed
+maxTrackLength = 40 # Most Points a tracked event has
+firstDate = datetime(2000, 1, 1)
+dateRangeDays = 24 * 365
+
+## HELPER FUNCTIONS
+
+def generateEvent(eventNumber, numPoints, withLine, generator):
+    """
+        Generates the features of one event: numPoints dated Points along a
+        random walk and, if withLine, a LineString through the same vertices.
+
+        Input: Integer eventNumber (makes the id), positive integer numPoints
+        (at least 2 if withLine), boolean withLine, random.Random generator
+
+        Output: List of feature dicts
+    """
+    eventId = f"EONET_{eventNumber}"
+    categoryIds = list(categoryMix)
+    categoryId = generator.choices(
+        categoryIds, [categoryMix[category][1] for category in categoryIds])[0]
+    title, _, sourceChoices, magnitude = categoryMix[categoryId]
+    properties = {
+        "id": eventId, "title": f"{title} {eventNumber}", "description": None,
+        "link": f"https://eonet.gsfc.nasa.gov/api/v3/events/{eventId}/geojson",
+        "closed": None, "categories": [{"id": categoryId, "title": title}]}
+    sources = [{"id": sourceId, "url": f"https://example.org/{sourceId}/"
+                                       f"{eventNumber}"}
+               for sourceId in generator.choice(sourceChoices)]
+
+    # Random walk of dated Points
+    longitude = generator.uniform(-180, 180)
+    latitude = generator.uniform(-80, 80)
+    pointDate = firstDate + timedelta(days=generator.randrange(dateRangeDays))
+    features = []
+    for _ in range(numPoints):
+        magnitudeValue, magnitudeUnit = None, None
+        if magnitude is not None:
+            magnitudeUnit, low, high = magnitude
+            magnitudeValue = round(generator.uniform(low, high), 1)
+        pointProperties = {
+            key: properties[key]
+            for key in ("id", "title", "description", "link", "closed")}
+        pointProperties.update(
+            date=pointDate.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            magnitudeValue=magnitudeValue, magnitudeUnit=magnitudeUnit,
+            categories=properties["categories"], sources=sources)
+        features.append({"type": "Feature", "properties": pointProperties,
+                         "geometry": {"type": "Point", "coordinates": [
+                             round(longitude, 2), round(latitude, 2)]}})
+        longitude = max(-180, min(180, longitude + generator.uniform(-1, 1)))
+        latitude = max(-85, min(85, latitude + generator.uniform(-1, 1)))
+        pointDate += timedelta(days=generator.randint(1, 14))
+
+    # LineString repeating the Points, like EONET's
+    if withLine:
+        features.append({"type": "Feature", "properties": dict(
+            properties, geometryDates=[
+                feature["properties"]["date"].replace("T", " ").rstrip("Z")
+                for feature in features]),
+            "geometry": {"type": "LineString", "coordinates": [
+                feature["geometry"]["coordinates"] for feature in features]}})
+    if generator.random() < closedShare: # Closed on its last Point's date
+        closedDate = features[numPoints - 1]["properties"]["date"]
+        for feature in features:
+            feature["properties"]["closed"] = closedDate
+    return features
+
+def generateFeatures(numFeatures, lineShare=0.03, seed=0):
+    """
+        Generates exactly numFeatures features, one event at a time. Events
+        get a LineString whenever the share of LineStrings so far is below
+        lineShare.
+
+        Input: Positive integer numFeatures, float lineShare of features that
+        should be LineStrings (0 to 0.5), integer seed
+
+        Output: Generator of feature dicts
+    """
+    generator = random.Random(seed)
+    numGenerated = 0
+    numLines = 0
+    eventNumber = 1
+    while numGenerated < numFeatures:
+        numPoints = 1
+        if generator.random() < trackedShare:
+            numPoints = generator.randint(2, maxTrackLength)
+        withLine = numLines < lineShare * (numGenerated + 1)
+        if withLine:
+            numPoints = max(numPoints, 2)
+        numPoints = min(numPoints, numFeatures - numGenerated - withLine)
+        withLine = withLine and numPoints >= 2
+
+        for feature in generateEvent(eventNumber, max(numPoints, 1),
+                                     withLine, generator):
+            yield feature
+        numGenerated += max(numPoints, 1) + withLine
+        numLines += withLine
+        eventNumber += 1
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Generates synthetic EONET "
+                                     "data")
+    parser.add_argument("features", type=int, help="number of features")
+    parser.add_argument("folder", help="folder to write the files to")
+    parser.add_argument("--lines", type=float, default=0.03,
+                        help="share of features that are LineStrings "
+                        "(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: %(default)s)")
+    return parser.parse_args(arguments)
+
+def writeSyntheticData(folder, numFeatures, lineShare=0.03, seed=0):
+    """
+        Writes synthetic Events plus the real Categories and Sources (which
+        every synthetic category and source is taken from) to folder.
+
+        Input: String folder (created if needed), positive integer
+        numFeatures, float lineShare, integer seed
+
+        Output: Dict of type of EONET data to its file location
+    """
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    fileLocations = {"Events": f"{folder}/events.geojson",
+                     "Categories": f"{folder}/categories.json",
+                     "Sources": f"{folder}/sources.json"}
+    homogenizeEvents.writeFeatureCollection(
+        fileLocations["Events"], generateFeatures(numFeatures, lineShare,
+                                                  seed))
+    shutil.copyfile(dataLocation / "categories.json",
+                    fileLocations["Categories"])
+    shutil.copyfile(dataLocation / "sources.json", fileLocations["Sources"])
+    return fileLocations
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    fileLocations = writeSyntheticData(arguments.folder, arguments.features,
+                                       arguments.lines, arguments.seed)
+    print(f"Wrote {arguments.features} features to "
+          f"{fileLocations['Events']}")
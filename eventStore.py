@@ -0,0 +1,273 @@
+"""
+    Description: Persistent local store of EONET events in a SQLite database.
+    Instead of every run leaving behind another full snapshot, events are
+    upserted into one "events" table keyed by EONET event id + geometry date
+    (+ geometry type, since an event's LineString can share a date with one of
+    its Points). The table has indexes on category, date and closed status and
+    an R-tree virtual table ("eventsIndex") over every geometry's bounding box,
+    so spatial and temporal queries such as "all open wildfires in this
+    bounding box" take milliseconds instead of re-parsing snapshots.
+
+    Tableau can connect to the database as a live data source (e.g. through a
+    SQLite ODBC driver); "longitude"/"latitude" hold each Point's coordinates.
+
+    pullData.py upserts into the store when run with "--store [database]". The
+    store can also be queried from the command line.
+
+    Input: Database location and optional query filters, e.g.
+    "py eventStore.py events.sqlite --bbox -125 32 -114 42 --category wildfires
+    --open"
+
+    Output: Matching events printed as JSON, one per line
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+from datetime import datetime, timezone # For recording when rows were updated
+import json # For storing geometries + properties and printing query results
+from pathlib import Path # For locating homogenizeEvents.py
+import sqlite3 # For the event store itself
+import sys # For importing homogenizeEvents
+
+sys.path.append(str(Path(__file__).resolve().parent / "homogenize"))
+import homogenizeEvents # For normalizing LineString dates like Point dates
+
+## CONSTANTS
+defaultStoreLocation = "./output/events.sqlite"
+schemaStatements = [
+    """CREATE TABLE IF NOT EXISTS events (
+           rowId INTEGER PRIMARY KEY,
+           eventId TEXT NOT NULL,
+           geometryDate TEXT NOT NULL,
+           geometryType TEXT NOT NULL,
+           title TEXT,
+           category TEXT,
+           sources TEXT,
+           closed TEXT,
+           isClosed INTEGER NOT NULL,
+           magnitudeValue REAL,
+           magnitudeUnit TEXT,
+           longitude REAL,
+           latitude REAL,
+           minLongitude REAL NOT NULL,
+           maxLongitude REAL NOT NULL,
+           minLatitude REAL NOT NULL,
+           maxLatitude REAL NOT NULL,
+           geometry TEXT NOT NULL,
+           properties TEXT NOT NULL,
+           updatedAt TEXT NOT NULL,
+           UNIQUE (eventId, geometryDate, geometryType)
+       )""",
+    "CREATE INDEX IF NOT EXISTS eventsCategory ON events (category)",
+    "CREATE INDEX IF NOT EXISTS eventsDate ON events (geometryDate)",
+    "CREATE INDEX IF NOT EXISTS eventsClosed ON events (isClosed)",
+    "CREATE INDEX IF NOT EXISTS eventsUpdated ON events (updatedAt)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS eventsIndex USING rtree (
+           rowId, minLongitude, maxLongitude, minLatitude, maxLatitude
+       )""",
+    # Stores written before dates were normalized kept LineStrings' dates as
+    # "YYYY-MM-DD HH:MM:SS"
+    """UPDATE OR IGNORE events
+       SET geometryDate = replace(geometryDate, ' ', 'T') || 'Z'
+       WHERE geometryDate LIKE '% %'""",
+]
+upsertStatement = """
+    INSERT INTO events (eventId, geometryDate, geometryType, title, category,
+                        sources, closed, isClosed, magnitudeValue,
+                        magnitudeUnit, longitude, latitude, minLongitude,
+                        maxLongitude, minLatitude, maxLatitude, geometry,
+                        properties, updatedAt)
+    VALUES (:eventId, :geometryDate, :geometryType, :title, :category,
+            :sources, :closed, :isClosed, :magnitudeValue, :magnitudeUnit,
+            :longitude, :latitude, :minLongitude, :maxLongitude, :minLatitude,
+            :maxLatitude, :geometry, :properties, :updatedAt)
+    ON CONFLICT (eventId, geometryDate, geometryType) DO UPDATE SET
+        title = excluded.title, category = excluded.category,
+        sources = excluded.sources, closed = excluded.closed,
+        isClosed = excluded.isClosed, magnitudeValue = excluded.magnitudeValue,
+        magnitudeUnit = excluded.magnitudeUnit, longitude = excluded.longitude,
+        latitude = excluded.latitude, minLongitude = excluded.minLongitude,
+        maxLongitude = excluded.maxLongitude,
+        minLatitude = excluded.minLatitude, maxLatitude = excluded.maxLatitude,
+        geometry = excluded.geometry, properties = excluded.properties,
+        updatedAt = excluded.updatedAt
+"""
+indexStatement = """
+    INSERT OR REPLACE INTO eventsIndex
+    SELECT rowId, minLongitude, maxLongitude, minLatitude, maxLatitude
+    FROM events WHERE updatedAt = ?
+"""
+
+## HELPER FUNCTIONS
+
+def geometryBounds(geometry):
+    """
+        Determines the bounding box of a GeoJSON geometry of any type by
+        flattening its (possibly nested) coordinates.
+
+        Input: GeoJSON geometry dict
+
+        Output: Tuple of (minLongitude, maxLongitude, minLatitude, maxLatitude)
+    """
+    positions = [geometry["coordinates"]]
+    while not isinstance(positions[0][0], (int, float)):
+        positions = [position for part in positions for position in part]
+    longitudes = [position[0] for position in positions]
+    latitudes = [position[1] for position in positions]
+    return min(longitudes), max(longitudes), min(latitudes), max(latitudes)
+
+def openEventStore(storeLocation=defaultStoreLocation):
+    """
+        Opens (creating if needed) the SQLite event store at storeLocation and
+        makes sure its tables and indexes exist.
+
+        Input: String storeLocation of the database file
+
+        Output: sqlite3 Connection to the store; rows are returned as
+        sqlite3.Row
+    """
+    connection = sqlite3.connect(storeLocation)
+    connection.row_factory = sqlite3.Row
+    with connection:
+        for statement in schemaStatements:
+            connection.execute(statement)
+    return connection
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments for querying the store.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Queries the EONET event "
+                                     "store")
+    parser.add_argument("store", nargs="?", default=defaultStoreLocation,
+                        help="database location (default: %(default)s)")
+    parser.add_argument("--bbox", nargs=4, type=float,
+                        metavar=("MINLON", "MINLAT", "MAXLON", "MAXLAT"),
+                        help="only events intersecting this bounding box")
+    parser.add_argument("--start", help="only geometries dated on or after "
+                        "this ISO date")
+    parser.add_argument("--end", help="only geometries dated before this ISO "
+                        "date")
+    parser.add_argument("--category", help="only events of this category id")
+    status = parser.add_mutually_exclusive_group()
+    status.add_argument("--open", dest="closed", action="store_false",
+                        default=None, help="only open events")
+    status.add_argument("--closed", dest="closed", action="store_true",
+                        default=None, help="only closed events")
+    parser.add_argument("--limit", type=int, help="maximum number of rows")
+    return parser.parse_args(arguments)
+
+def queryEvents(connection, bbox=None, start=None, end=None, category=None,
+                closed=None, limit=None):
+    """
+        Queries the event store. Every filter is optional; the bounding box
+        goes through the R-tree index, the others through the column indexes.
+
+        Input: sqlite3 Connection from "openEventStore", optional tuple bbox of
+        (minLongitude, minLatitude, maxLongitude, maxLatitude), optional ISO
+        date strings start (inclusive) and end (exclusive), optional string
+        category id, optional boolean closed, optional integer limit
+
+        Output: List of sqlite3.Row, newest geometry first
+    """
+    query = "SELECT events.* FROM events"
+    conditions = []
+    parameters = []
+    if bbox is not None:
+        minLongitude, minLatitude, maxLongitude, maxLatitude = bbox
+        query += " JOIN eventsIndex ON eventsIndex.rowId = events.rowId"
+        conditions += ["eventsIndex.maxLongitude >= ?",
+                       "eventsIndex.minLongitude <= ?",
+                       "eventsIndex.maxLatitude >= ?",
+                       "eventsIndex.minLatitude <= ?"]
+        parameters += [minLongitude, maxLongitude, minLatitude, maxLatitude]
+    if start is not None:
+        conditions.append("events.geometryDate >= ?")
+        parameters.append(start)
+    if end is not None:
+        conditions.append("events.geometryDate < ?")
+        parameters.append(end)
+    if category is not None:
+        conditions.append("events.category = ?")
+        parameters.append(category)
+    if closed is not None:
+        conditions.append("events.isClosed = ?")
+        parameters.append(int(closed))
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY events.geometryDate DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    return connection.execute(query, parameters).fetchall()
+
+def toRow(feature, updatedAt):
+    """
+        Flattens an EONET Events feature into a row of the "events" table.
+        LineStrings (which carry 'geometryDates' instead of 'date', and no 
+        sources or magnitude) are dated by their first geometry date, in the
+        same "YYYY-MM-DDTHH:MM:SSZ" format as Points, so dates compare and
+        sort correctly across geometry types.
+
+        Input: GeoJSON feature dict, ISO string updatedAt of the upsert
+
+        Output: Dict of column name to value
+    """
+    properties = feature["properties"]
+    geometry = feature["geometry"]
+    geometryDate = homogenizeEvents.normalizeDate(
+        properties.get("date") or properties["geometryDates"][0])
+    minLongitude, maxLongitude, minLatitude, maxLatitude = \
+        geometryBounds(geometry)
+    isPoint = geometry["type"] == "Point"
+
+    return {"eventId": properties["id"], "geometryDate": geometryDate,
+            "geometryType": geometry["type"], "title": properties["title"],
+            "category": properties["categories"][0]["id"],
+            "sources": ",".join(source["id"]
+                                for source in properties.get("sources", [])),
+            "closed": properties["closed"],
+            "isClosed": int(properties["closed"] is not None),
+            "magnitudeValue": properties.get("magnitudeValue"),
+            "magnitudeUnit": properties.get("magnitudeUnit"),
+            "longitude": minLongitude if isPoint else None,
+            "latitude": minLatitude if isPoint else None,
+            "minLongitude": minLongitude, "maxLongitude": maxLongitude,
+            "minLatitude": minLatitude, "maxLatitude": maxLatitude,
+            "geometry": json.dumps(geometry),
+            "properties": json.dumps(properties), "updatedAt": updatedAt}
+
+def upsertEvents(connection, events):
+    """
+        Upserts every feature of an EONET Events FeatureCollection into the
+        store in one transaction, then refreshes the R-tree entries of the
+        upserted rows.
+
+        Input: sqlite3 Connection from "openEventStore", GeoJSON
+        FeatureCollection dict events
+
+        Output: Integer number of features upserted
+    """
+    updatedAt = datetime.now(timezone.utc).isoformat()
+    rows = [toRow(feature, updatedAt) for feature in events["features"]]
+    with connection:
+        connection.executemany(upsertStatement, rows)
+        connection.execute(indexStatement, (updatedAt,))
+    return len(rows)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    with openEventStore(arguments.store) as connection:
+        rows = queryEvents(connection, arguments.bbox, arguments.start,
+                           arguments.end, arguments.category,
+                           arguments.closed, arguments.limit)
+        for row in rows:
+            print(json.dumps({key: row[key] for key in row.keys()
+                              if key not in ("geometry", "properties")}))
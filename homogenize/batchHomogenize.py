@@ -0,0 +1,312 @@
+"""
+    Description: Re-homogenizes a whole history of EONET snapshots in one go
+    and merges the results into one time-indexed event history. Snapshots are
+    pullData.py output folders (e.g. "../output/[time-based name]") and/or the
+    runs of the snapshot store (see "../snapshotStore.py").
+
+    Snapshots are spread over a pool of worker processes, one per core by
+    default. Each worker homogenizes one snapshot at a time, writing its
+    result to disk instead of sending it back, and is replaced after a few
+    snapshots, so memory per worker stays bounded by a single snapshot.
+    Replacing workers makes the pool start them with "spawn", so every new
+    worker imports geopandas again; a worker handles several snapshots
+    before it is replaced to spread that cost. A snapshot's result is cached
+    under the hash of its inputs (and settings), so snapshots whose inputs
+    did not change since the last batch run, or that are identical to
+    another snapshot, are skipped.
+
+    The history has one Point per event id, date, and (rounded) coordinates
+    with the properties of the latest snapshot it was in, plus when it was
+    first and last seen ('firstSeen'/'lastSeen'), sorted by date.
+
+    Input: Snapshot folders and/or "--store", e.g.
+    "py batchHomogenize.py ../output/*-2023_T* --store ../output/snapshots"
+
+    Output: "[output]/history.geojson", cached results in "[output]/results",
+    and a log in "[output]/batch.log"; "./output/batch" by default
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+from concurrent.futures import ProcessPoolExecutor, as_completed # For workers
+from datetime import datetime # For ordering snapshots in time
+import gzip # For compressing cached results
+import hashlib # For keying results by their inputs
+import homogenizeEvents # For homogenizing each snapshot
+import json # For reading + writing results and the batch index
+import logging # For logging purposes
+import os # For counting cores and atomically replacing files
+from pathlib import Path # For making directories, files, and parsing names
+import sys # For importing snapshotStore
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+import snapshotStore # For reading runs of the snapshot store
+
+## CONSTANTS
+defaultOutputLocation = "./output/batch"
+snapshotsPerWorker = 8 # Snapshots a worker handles before it is replaced
+folderNameFormat = "%d-%m-%Y_T%H-%M-%S" # See "determineFolderName"
+indexFileName = "index.json" # Snapshot -> input hash of its cached result
+
+## HELPER FUNCTIONS
+
+def findSnapshots(folders, storeLocation=None):
+    """
+        Lists the snapshots to homogenize: every given folder holding EONET
+        data and every run of the snapshot store. Folders that are missing,
+        are not folders, or do not hold exactly one Events, Categories, and
+        Sources file are skipped (and logged).
+
+        Input: List of string folders, optional string storeLocation
+
+        Output: List of snapshot dicts with "name", "kind" ("folder" or
+        "store"), "location", and "time" (datetime), oldest first
+    """
+    snapshots = []
+    for folder in folders:
+        try:
+            homogenizeEvents.locateData(folder)
+        except Exception as error: # locateData raises on repeated files
+            logging.warning(f"Skipping {folder}; not a snapshot folder "
+                            f"({type(error).__name__}: {error})")
+            continue
+        snapshots.append({"name": f"folder:{Path(folder).resolve()}",
+                          "kind": "folder", "location": folder,
+                          "time": snapshotTime(Path(folder).name, folder)})
+    if storeLocation is not None:
+        for manifest in snapshotStore.listRuns(storeLocation):
+            snapshots.append({"name": f"store:{manifest['runId']}",
+                              "kind": "store", "location": storeLocation,
+                              "runId": manifest["runId"],
+                              "time": snapshotTime(manifest["runId"])})
+    return sorted(snapshots, key=lambda snapshot: snapshot["time"])
+
+def hashInputs(snapshot, explodeLines):
+    """
+        Hashes a snapshot's inputs and the settings that affect its result.
+        Folders are hashed by their files' bytes; runs of the snapshot store
+        by the blob hashes they (and the deltas they build on) point at.
+
+        Input: Snapshot dict from "findSnapshots", boolean explodeLines
+
+        Output: String hex digest
+    """
+    digest = hashlib.sha256(f"explodeLines={explodeLines}".encode())
+    if snapshot["kind"] == "folder":
+        fileLocations = homogenizeEvents.locateData(snapshot["location"])
+        for typeFile in homogenizeEvents.dataTypes:
+            with open(fileLocations[typeFile], "rb") as inFile:
+                for chunk in iter(lambda: inFile.read(1024 * 1024), b""):
+                    digest.update(chunk)
+    else:
+        manifest = snapshotStore.readManifest(snapshot["location"],
+                                              snapshot["runId"])
+        digest.update(manifest["blobs"]["Categories"].encode())
+        digest.update(manifest["blobs"]["Sources"].encode())
+        while manifest is not None:
+            digest.update(manifest["blobs"]["Events"].encode())
+            manifest = manifest["eventsBase"] and snapshotStore.readManifest(
+                snapshot["location"], manifest["eventsBase"])
+    return digest.hexdigest()
+
+def homogenizeSnapshot(snapshot, resultFile, explodeLines):
+    """
+        Worker task: reads, parses, homogenizes, and improves the readability
+        of one snapshot, then writes the result to resultFile as gzipped
+        GeoJSON (through a temporary file).
+
+        Input: Snapshot dict from "findSnapshots", string resultFile, boolean
+        explodeLines
+
+        Output: Integer number of homogenized events
+    """
+    if snapshot["kind"] == "folder":
+        EONETData = homogenizeEvents.readData(snapshot["location"])
+    else:
+        EONETData = snapshotStore.loadSnapshot(snapshot["location"],
+                                               snapshot["runId"])
+    parsedEONETData = homogenizeEvents.parseData(EONETData)
+    del EONETData
+    homogenizedEvents = homogenizeEvents.homogenizeData(parsedEONETData,
+                                                        explodeLines)
+    homogenizedEvents = homogenizeEvents.improveReadability(homogenizedEvents,
+                                                            parsedEONETData)
+
+    tempFile = f"{resultFile}.tmp"
+    with gzip.open(tempFile, "wt") as outFile:
+        outFile.write(homogenizedEvents.to_json(drop_id = True))
+    os.replace(tempFile, resultFile)
+    return len(homogenizedEvents)
+
+def homogenizeSnapshots(snapshots, outputLocation, workers, explodeLines):
+    """
+        Homogenizes every snapshot whose inputs have no cached result yet
+        across a pool of worker processes, then records every snapshot's
+        input hash in the batch index.
+
+        Input: List of snapshot dicts from "findSnapshots", string
+        outputLocation, positive integer workers, boolean explodeLines
+
+        Output: Tuple of (dict of snapshot name to input hash, dict of counts
+        "homogenized", "skipped", and "failed")
+    """
+    resultsFolder = Path(outputLocation, "results")
+    resultsFolder.mkdir(parents=True, exist_ok=True)
+
+    # Work out which inputs still need homogenizing
+    index = {}
+    pending = {}
+    for snapshot in snapshots:
+        inputHash = hashInputs(snapshot, explodeLines)
+        index[snapshot["name"]] = inputHash
+        resultFile = resultsFolder / f"{inputHash}.geojson.gz"
+        if not resultFile.is_file() and inputHash not in pending:
+            pending[inputHash] = (snapshot, str(resultFile))
+    counts = {"homogenized": 0, "skipped": len(snapshots) - len(pending),
+              "failed": 0}
+    logging.info(f"{len(pending)} of {len(snapshots)} snapshots to homogenize"
+                 f" with {workers} workers")
+
+    # Spread them over the pool; workers are replaced to bound their memory
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 max_tasks_per_child=snapshotsPerWorker) \
+             as executor:
+            futures = {executor.submit(homogenizeSnapshot, snapshot,
+                                       resultFile, explodeLines): snapshot
+                       for snapshot, resultFile in pending.values()}
+            for future in as_completed(futures):
+                snapshot = futures[future]
+                try:
+                    numEvents = future.result()
+                except Exception:
+                    logging.exception(f"Failed to homogenize "
+                                      f"{snapshot['name']}:")
+                    counts["failed"] += 1
+                    continue
+                logging.info(f"Homogenized {snapshot['name']} into "
+                             f"{numEvents} events")
+                counts["homogenized"] += 1
+
+    # Leave failed snapshots out of the index (and so the history)
+    index = {name: inputHash for name, inputHash in index.items()
+             if (resultsFolder / f"{inputHash}.geojson.gz").is_file()}
+    tempFile = Path(outputLocation, f"{indexFileName}.tmp")
+    tempFile.write_text(json.dumps(index, indent=4))
+    os.replace(tempFile, Path(outputLocation, indexFileName))
+    return index, counts
+
+def mergeHistory(snapshots, index, resultsFolder):
+    """
+        Merges the results of every snapshot, oldest first, into one history
+        keyed by event id, date, and rounded coordinates (see
+        "homogenizeEvents.vertexKey"). Each Point keeps the properties of the
+        latest snapshot it was in, plus 'firstSeen' and 'lastSeen'.
+
+        Input: List of snapshot dicts from "findSnapshots", dict index of
+        snapshot name to its input hash, string resultsFolder
+
+        Output: List of feature dicts sorted by date, then event id
+    """
+    history = {}
+    for snapshot in snapshots:
+        snapshotISO = snapshot["time"].isoformat()
+        resultFile = Path(resultsFolder, f"{index[snapshot['name']]}.geojson.gz")
+        with gzip.open(resultFile, "rt") as inFile:
+            features = json.load(inFile)["features"]
+        for feature in features:
+            key = homogenizeEvents.vertexKey(feature)
+            firstSeen = history[key]["properties"]["firstSeen"] \
+                        if key in history else snapshotISO
+            feature["properties"]["firstSeen"] = firstSeen
+            feature["properties"]["lastSeen"] = snapshotISO
+            history[key] = feature
+
+    return sorted(history.values(),
+                  key=lambda feature: (feature["properties"]["date"],
+                                       feature["properties"]["id"]))
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Re-homogenizes a history of"
+                                     " EONET snapshots into one event history")
+    parser.add_argument("folders", nargs="*", help="snapshot folders holding "
+                        "Events, Categories, and Sources files")
+    parser.add_argument("--store", nargs="?",
+                        const=f"../{snapshotStore.defaultStoreLocation}",
+                        help="also homogenize every run of this snapshot "
+                        "store (default when given without a location: "
+                        "%(const)s)")
+    parser.add_argument("--output", default=defaultOutputLocation,
+                        help="folder for results + history (default: "
+                        "%(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: %(default)s)")
+    parser.add_argument("--drop-lines", action="store_true",
+                        help="drop non-Point geometries instead of exploding "
+                        "their new vertices into Points")
+    parsedArguments = parser.parse_args(arguments)
+    if not parsedArguments.folders and parsedArguments.store is None:
+        parser.error("give snapshot folders and/or --store")
+    return parsedArguments
+
+def snapshotTime(name, folder=None):
+    """
+        Determines when a snapshot was taken from its name (see
+        "determineFolderName"), falling back on the folder's modification
+        time.
+
+        Input: String name of the folder or run, optional string folder
+
+        Output: datetime of the snapshot
+    """
+    try:
+        return datetime.strptime(name, folderNameFormat)
+    except ValueError:
+        modifiedTime = Path(folder).stat().st_mtime if folder else 0
+        return datetime.fromtimestamp(modifiedTime)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    Path(arguments.output).mkdir(parents=True, exist_ok=True)
+    homogenizeEvents.setupLogging(f"{arguments.output}/batch.log")
+    logging.info('Main logger initialized')
+
+    try:
+
+        # Find and homogenize the snapshots
+        snapshots = findSnapshots(arguments.folders, arguments.store)
+        print(f"\nHomogenizing {len(snapshots)} snapshots...")
+        index, counts = homogenizeSnapshots(snapshots, arguments.output,
+                                            arguments.workers,
+                                            not arguments.drop_lines)
+        logging.info(f"Snapshots: {counts}")
+
+        # Merge every snapshot into one history
+        logging.info('Merging results into the event history')
+        historyFile = f"{arguments.output}/history.geojson"
+        features = mergeHistory([snapshot for snapshot in snapshots
+                                 if snapshot["name"] in index], index,
+                                f"{arguments.output}/results")
+        homogenizeEvents.writeFeatureCollection(f"{historyFile}.tmp", features)
+        os.replace(f"{historyFile}.tmp", historyFile)
+        logging.info(f"Wrote {len(features)} events to {historyFile}")
+
+        # Successful run
+        print(f"Homogenized {counts['homogenized']}, skipped "
+              f"{counts['skipped']} unchanged and failed {counts['failed']} "
+              f"snapshots; {len(features)} events written to "
+              f"'{historyFile}'.\n\nExiting script")
+
+    except Exception as error:
+        logging.exception("Traceback of error:")
+        print("Error! Script failed to execute properly. Refer to log for more"
+              " details")
@@ -0,0 +1,267 @@
+"""
+    Description: Pre-aggregates homogenized (Point only) EONET Events into a
+    pyramid of spatial grids, so dashboards can draw dense event maps from
+    small summary layers and only drill down to the raw Points when zoomed in.
+
+    Grids follow the web map ("slippy map") tiling scheme: at zoom level z the
+    world is 2^z x 2^z Web Mercator tiles, and every tile is split into a
+    2^cellBits x 2^cellBits grid of cells. Events are binned by cell, category
+    ("simpleCategory") and time bucket (year, month, week, or day), keeping the
+    count and the max 'magnitudeValue' of each bin. The finest zoom is binned
+    once; every coarser zoom is made from the one below it by merging 2 x 2
+    cells, so the whole pyramid costs little more than one level.
+
+    Layers are written as one small CSV per zoom level (with each cell's
+    center longitude/latitude, ready for Tableau), and optionally as Mapbox
+    Vector Tiles ("[z]/[x]/[y].mvt", one Point feature per bin at its cell's
+    center) encoded here without extra dependencies.
+
+    Input: GeoDataFrame of homogenized Events after "improveReadability" (see
+    "aggregateEvents")
+
+    Output: Dict of zoom level to its aggregated DataFrame; files written by
+    "writeAggregates"
+"""
+
+## IMPORTS
+import json # For the layers' metadata file
+import numpy as np # For projecting events onto the grids
+import pandas as pd # For binning events
+from pathlib import Path # For the layers' folder
+import struct # For encoding doubles in vector tiles
+
+## CONSTANTS
+defaultMinZoom = 0
+defaultMaxZoom = 8 # Beyond this, dashboards draw the raw Points
+defaultCellBits = 6 # Tiles are split into 2^6 x 2^6 = 64 x 64 cells
+defaultTimeBucket = "month"
+timeBuckets = {"year": "Y", "month": "M", "week": "W", "day": "D"} # Periods
+maxLatitude = 85.0511287798 # Web Mercator's latitude limit
+binKeys = ["cellX", "cellY", "category", "timeBucket"]
+tileExtent = 4096 # Vector tile coordinate range
+tileLayerName = "events"
+metadataFileName = "metadata.json"
+
+## HELPER FUNCTIONS
+
+def aggregateEvents(homogenizedEvents, minZoom=defaultMinZoom,
+                    maxZoom=defaultMaxZoom, cellBits=defaultCellBits,
+                    timeBucket=defaultTimeBucket):
+    """
+        Bins homogenized events into a pyramid of grids, from maxZoom down to
+        minZoom, by cell, category and time bucket.
+
+        Input: GeoDataFrame homogenizedEvents with Point geometries and
+        'date', 'simpleCategory' and (optionally) 'magnitudeValue' columns,
+        integers minZoom <= maxZoom, integer cellBits of cells per tile side
+        (as a power of 2), string timeBucket (a key of timeBuckets)
+
+        Output: Dict of zoom level to DataFrame with one row per bin:
+        'tileX' + 'tileY' of its tile, 'cellX' + 'cellY' of its cell (on the
+        grid of zoom + cellBits), its center 'longitude' + 'latitude',
+        'category', 'timeBucket', 'count', and 'maxMagnitude' (NaN if no event
+        of the bin has a magnitude)
+    """
+    cellZoom = maxZoom + cellBits
+    cellXs, cellYs = projectToGrid(
+        homogenizedEvents.geometry.x.to_numpy(dtype=np.float64),
+        homogenizedEvents.geometry.y.to_numpy(dtype=np.float64), cellZoom)
+    dates = pd.to_datetime(homogenizedEvents['date'], utc=True) \
+              .dt.tz_convert(None)
+    if 'magnitudeValue' in homogenizedEvents:
+        magnitudes = pd.to_numeric(homogenizedEvents['magnitudeValue'],
+                                   errors='coerce').to_numpy(np.float64)
+    else:
+        magnitudes = np.full(len(homogenizedEvents), np.nan)
+    events = pd.DataFrame({
+        "cellX": cellXs, "cellY": cellYs,
+        "category": homogenizedEvents['simpleCategory'].to_numpy(),
+        "timeBucket": dates.dt.to_period(timeBuckets[timeBucket])
+                           .astype(str).to_numpy(),
+        "maxMagnitude": magnitudes})
+
+    # Finest zoom from the events, then each coarser one from the one below
+    level = events.groupby(binKeys, sort=True).agg(
+        count=("maxMagnitude", "size"),
+        maxMagnitude=("maxMagnitude", "max")).reset_index()
+    aggregates = {}
+    for zoom in range(maxZoom, minZoom - 1, -1):
+        if zoom < maxZoom:
+            level = level.assign(cellX=level["cellX"].to_numpy() >> 1,
+                                 cellY=level["cellY"].to_numpy() >> 1) \
+                         .groupby(binKeys, sort=True).agg(
+                             count=("count", "sum"),
+                             maxMagnitude=("maxMagnitude", "max")) \
+                         .reset_index()
+        longitudes, latitudes = cellCenters(level["cellX"].to_numpy(),
+                                            level["cellY"].to_numpy(),
+                                            zoom + cellBits)
+        aggregates[zoom] = pd.DataFrame({
+            "tileX": level["cellX"].to_numpy() >> cellBits,
+            "tileY": level["cellY"].to_numpy() >> cellBits,
+            "cellX": level["cellX"].to_numpy(),
+            "cellY": level["cellY"].to_numpy(),
+            "longitude": longitudes, "latitude": latitudes,
+            "category": level["category"].to_numpy(),
+            "timeBucket": level["timeBucket"].to_numpy(),
+            "count": level["count"].to_numpy(np.int64),
+            "maxMagnitude": level["maxMagnitude"].to_numpy(np.float64)})
+    return aggregates
+
+def cellCenters(cellXs, cellYs, zoom):
+    """
+        Determines the longitude/latitude of the centers of grid cells.
+
+        Input: Integer arrays cellXs and cellYs of cells on the grid of zoom,
+        integer zoom
+
+        Output: Tuple of float arrays (longitudes, latitudes)
+    """
+    numCells = 2 ** zoom
+    longitudes = (cellXs + 0.5) / numCells * 360 - 180
+    mercatorYs = np.pi * (1 - 2 * (cellYs + 0.5) / numCells)
+    latitudes = np.degrees(np.arctan(np.sinh(mercatorYs)))
+    return longitudes, latitudes
+
+def encodeField(fieldNumber, value):
+    """
+        Encodes one protocol buffers field: integers as varints, floats as
+        doubles, and bytes/strings (e.g. nested messages) length-delimited.
+
+        Input: Integer fieldNumber, integer, float, bytes or string value
+
+        Output: Bytes of the field
+    """
+    if isinstance(value, float):
+        return encodeVarint(fieldNumber << 3 | 1) + struct.pack("<d", value)
+    if isinstance(value, int):
+        return encodeVarint(fieldNumber << 3) + encodeVarint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return encodeVarint(fieldNumber << 3 | 2) + encodeVarint(len(value)) + \
+           value
+
+def encodeVarint(value):
+    """
+        Encodes a non-negative integer as a protocol buffers varint.
+
+        Input: Non-negative integer value
+
+        Output: Bytes of the varint
+    """
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+def encodeVectorTile(tileRows, tileX, tileY, cellBits=defaultCellBits):
+    """
+        Encodes the bins of one tile as a Mapbox Vector Tile (version 2) with
+        a single "events" layer: one Point feature per bin at its cell's
+        center, with 'category', 'timeBucket', 'count' and (if known)
+        'maxMagnitude' properties.
+
+        Input: DataFrame tileRows of the tile's bins (from "aggregateEvents"),
+        integers tileX and tileY of the tile, integer cellBits
+
+        Output: Bytes of the vector tile
+    """
+    keys = ["category", "timeBucket", "count", "maxMagnitude"]
+    values = {} # Value -> its index in the layer's value table
+    cellSize = tileExtent / 2 ** cellBits
+    features = []
+    for cellX, cellY, category, timeBucket, count, maxMagnitude in zip(
+            tileRows["cellX"], tileRows["cellY"], tileRows["category"],
+            tileRows["timeBucket"], tileRows["count"],
+            tileRows["maxMagnitude"]):
+        properties = [str(category), str(timeBucket), int(count)]
+        if not np.isnan(maxMagnitude):
+            properties.append(float(maxMagnitude))
+        tags = []
+        for keyIndex, value in enumerate(properties):
+            valueKey = (type(value), value)
+            tags += [keyIndex, values.setdefault(valueKey, len(values))]
+
+        # MoveTo the cell's center in tile coordinates (zigzag encoded)
+        pointX = int((cellX - (tileX << cellBits) + 0.5) * cellSize)
+        pointY = int((cellY - (tileY << cellBits) + 0.5) * cellSize)
+        geometry = [1 | 1 << 3, pointX << 1, pointY << 1]
+        features.append(
+            encodeField(2, b"".join(map(encodeVarint, tags))) +
+            encodeField(3, 1) + # POINT
+            encodeField(4, b"".join(map(encodeVarint, geometry))))
+
+    valueFields = []
+    for valueType, value in values:
+        if valueType is str:
+            valueFields.append(encodeField(1, value))
+        elif valueType is float:
+            valueFields.append(encodeField(3, value))
+        else:
+            valueFields.append(encodeField(5, value)) # uint
+    layer = encodeField(15, 2) + encodeField(1, tileLayerName) + \
+            b"".join(encodeField(2, feature) for feature in features) + \
+            b"".join(encodeField(3, key) for key in keys) + \
+            b"".join(encodeField(4, valueField)
+                     for valueField in valueFields) + \
+            encodeField(5, tileExtent)
+    return encodeField(3, layer)
+
+def projectToGrid(longitudes, latitudes, zoom):
+    """
+        Projects longitudes/latitudes onto the Web Mercator grid of zoom, the
+        same grid web map tiles of that zoom use.
+
+        Input: Float arrays longitudes and latitudes, integer zoom
+
+        Output: Tuple of integer arrays (cellXs, cellYs), 0 to 2^zoom - 1
+    """
+    numCells = 2 ** zoom
+    latitudes = np.radians(np.clip(latitudes, -maxLatitude, maxLatitude))
+    xs = (longitudes + 180) / 360 * numCells
+    ys = (1 - np.log(np.tan(latitudes) + 1 / np.cos(latitudes)) / np.pi) / 2 \
+         * numCells
+    cellXs = np.clip(np.floor(xs), 0, numCells - 1).astype(np.int64)
+    cellYs = np.clip(np.floor(ys), 0, numCells - 1).astype(np.int64)
+    return cellXs, cellYs
+
+def writeAggregates(aggregates, outputLocation, cellBits=defaultCellBits,
+                    timeBucket=defaultTimeBucket, tiles=False):
+    """
+        Writes aggregated layers to outputLocation: "z[zoom].csv" per zoom
+        level, a metadata file, and optionally vector tiles
+        ("tiles/[z]/[x]/[y].mvt").
+
+        Input: Dict aggregates from "aggregateEvents", string outputLocation
+        folder (created if needed), integer cellBits and string timeBucket
+        they were made with, boolean tiles to also write vector tiles
+
+        Output: Integer number of vector tiles written
+    """
+    outputPath = Path(outputLocation)
+    outputPath.mkdir(parents=True, exist_ok=True)
+    for zoom, layer in aggregates.items():
+        layer.to_csv(outputPath / f"z{zoom}.csv", index=False)
+
+    numTiles = 0
+    if tiles:
+        for zoom, layer in aggregates.items():
+            for (tileX, tileY), tileRows in layer.groupby(["tileX", "tileY"],
+                                                          sort=False):
+                tileFile = outputPath / "tiles" / str(zoom) / str(tileX) / \
+                           f"{tileY}.mvt"
+                tileFile.parent.mkdir(parents=True, exist_ok=True)
+                tileFile.write_bytes(encodeVectorTile(tileRows, tileX, tileY,
+                                                      cellBits))
+                numTiles += 1
+
+    metadata = {"zooms": sorted(aggregates), "cellBits": cellBits,
+                "timeBucket": timeBucket, "tileExtent": tileExtent,
+                "tileLayer": tileLayerName, "tiles": numTiles,
+                "bins": {zoom: len(aggregates[zoom])
+                         for zoom in sorted(aggregates)}}
+    with open(outputPath / metadataFileName, "w") as outFile:
+        outFile.write(json.dumps(metadata, indent=4))
+    return numTiles
@@ -0,0 +1,359 @@
+"""
+    Description: In-memory spatio-temporal query index over the homogenized
+    (Point only) EONET Events produced by "homogenizeData" +
+    "improveReadability" in homogenizeEvents.py.
+
+    The index is a plain dict of NumPy arrays:
+    - a uniform longitude/latitude grid; row numbers sorted by grid cell plus
+      the offset of every cell ("cellOrder" + "cellStarts"), so a bounding box
+      only visits the rows of the cells it overlaps
+    - row numbers sorted by date ("dateOrder" + "sortedDates"), so a time
+      window is two binary searches
+    - one packed bitmap per category ("categoryBitmaps")
+    Bounding box + time window + category queries and k-nearest-event lookups
+    therefore only touch a fraction of the events.
+
+    Indexes can be saved to a folder of ".npy" files and loaded back as
+    memory-mapped arrays, so e.g. a dashboard backend can answer queries right
+    away without rebuilding the index on every start.
+
+    Input: GeoDataFrame of homogenized Events (see "buildEventIndex"), or
+    their coordinate and property arrays (see "buildEventIndexFromArrays")
+
+    Output: Query results as arrays of row numbers (positions, as used by
+    ".iloc") into the indexed events; the index's "eventIds", "titles" and
+    "dates" arrays map them back without the GeoDataFrame
+"""
+
+## IMPORTS
+import json # For the index's metadata file
+import math # For grid sizes
+import numpy as np # For the index's arrays
+import pandas as pd # For parsing event dates
+from pathlib import Path # For the index's folder
+
+## CONSTANTS
+defaultCellSize = 1.0 # Degrees per grid cell, both longitude and latitude
+earthRadiusKm = 6371.0088 # Mean Earth radius for great-circle distances
+metadataFileName = "metadata.json"
+arrayNames = ["longitudes", "latitudes", "dates", "categoryCodes", "eventIds",
+              "titles", "cellOrder", "cellStarts", "dateOrder", "sortedDates",
+              "categoryBitmaps"]
+
+## HELPER FUNCTIONS
+
+def buildEventIndex(homogenizedEvents, cellSize=defaultCellSize):
+    """
+        Builds the query index of homogenized (Point only) Events.
+
+        Input: GeoDataFrame homogenizedEvents with Point geometries and 'id',
+        'title', 'date' and 'categories' columns, float cellSize of the grid
+        in degrees
+
+        Output: Dict of the index's arrays and metadata
+    """
+    return buildEventIndexFromArrays(
+        homogenizedEvents.geometry.x.to_numpy(dtype=np.float64),
+        homogenizedEvents.geometry.y.to_numpy(dtype=np.float64),
+        homogenizedEvents['date'], 
+        [categories[0]['id'] for categories in homogenizedEvents['categories']],
+        homogenizedEvents['id'], homogenizedEvents['title'], cellSize)
+
+def buildEventIndexFromArrays(longitudes, latitudes, dates, firstCategoryIds,
+                              eventIds, titles, cellSize=defaultCellSize):
+    """
+        Builds the query index from the events' coordinates and properties,
+        e.g. straight from parsed GeoJSON features without building a 
+        GeoDataFrame (see "buildEventIndex").
+
+        Input: Float arrays longitudes and latitudes, sequences of string 
+        dates, first category ids, event ids and titles (all aligned by 
+        row), float cellSize of the grid in degrees
+
+        Output: Dict of the index's arrays and metadata
+    """
+    numEvents = len(longitudes)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    dates = pd.to_datetime(pd.Series(dates, dtype=object), utc=True) \
+              .dt.tz_convert(None).astype("datetime64[ns]") \
+              .to_numpy().astype(np.int64)
+
+    # Category of every event as a code into categoryNames
+    categoryNames, categoryCodes = np.unique(np.array(firstCategoryIds,
+                                                      dtype=str),
+                                             return_inverse=True)
+    categoryBitmaps = np.array([np.packbits(categoryCodes == code)
+                                for code in range(len(categoryNames))],
+                               dtype=np.uint8).reshape(len(categoryNames),
+                                                       (numEvents + 7) // 8)
+
+    # Rows sorted by grid cell, plus where each cell starts in that order
+    numCellsX = math.ceil(360 / cellSize)
+    numCellsY = math.ceil(180 / cellSize)
+    cells = determineCells(longitudes, latitudes, cellSize, numCellsX,
+                           numCellsY)
+    cellOrder = np.argsort(cells, kind="stable")
+    cellStarts = np.searchsorted(cells[cellOrder],
+                                 np.arange(numCellsX * numCellsY + 1))
+
+    # Rows sorted by date
+    dateOrder = np.argsort(dates, kind="stable")
+
+    return {"longitudes": longitudes, "latitudes": latitudes, "dates": dates,
+            "categoryCodes": categoryCodes.astype(np.int32),
+            "eventIds": np.asarray(eventIds, dtype=str),
+            "titles": np.asarray(titles, dtype=str),
+            "cellOrder": cellOrder, "cellStarts": cellStarts,
+            "dateOrder": dateOrder, "sortedDates": dates[dateOrder],
+            "categoryBitmaps": categoryBitmaps,
+            "metadata": {"numEvents": numEvents, "cellSize": cellSize,
+                         "numCellsX": numCellsX, "numCellsY": numCellsY,
+                         "categoryNames": categoryNames.tolist()}}
+
+def cellRows(index, cellXs, cellY):
+    """
+        Gathers the rows in the given cells of one grid row.
+
+        Input: Dict index, iterable of integer cellXs (wrapped around the
+        antimeridian), integer cellY
+
+        Output: Array of row numbers
+    """
+    numCellsX = index["metadata"]["numCellsX"]
+    cellStarts = index["cellStarts"]
+    rows = [np.empty(0, dtype=np.int64)]
+    for cellX in cellXs:
+        cell = cellY * numCellsX + cellX % numCellsX
+        rows.append(index["cellOrder"][cellStarts[cell]:cellStarts[cell + 1]])
+    return np.concatenate(rows)
+
+def determineCells(longitudes, latitudes, cellSize, numCellsX, numCellsY):
+    """
+        Determines the grid cell of every position.
+
+        Input: Arrays of longitudes and latitudes, float cellSize in degrees,
+        integer numCellsX and numCellsY of the grid
+
+        Output: Array of integer cell numbers (row-major, from -180, -90)
+    """
+    cellXs = np.clip(((longitudes + 180) // cellSize).astype(np.int64), 0,
+                     numCellsX - 1)
+    cellYs = np.clip(((latitudes + 90) // cellSize).astype(np.int64), 0,
+                     numCellsY - 1)
+    return cellYs * numCellsX + cellXs
+
+def greatCircleDistances(longitudes, latitudes, longitude, latitude):
+    """
+        Great-circle (haversine) distances between many positions and one.
+
+        Input: Arrays of longitudes and latitudes, floats longitude and
+        latitude of the other position, all in degrees
+
+        Output: Array of distances in km
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (longitudes, latitudes,
+                                              longitude, latitude))
+    haversine = np.sin((lat2 - lat1) / 2) ** 2 + \
+                np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earthRadiusKm * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
+
+def hasCategory(index, rows, category):
+    """
+        Checks which rows belong to category using its packed bitmap, without
+        unpacking the whole bitmap.
+
+        Input: Dict index, array of row numbers, string category id
+
+        Output: Boolean array aligned with rows
+    """
+    categoryNames = index["metadata"]["categoryNames"]
+    if category not in categoryNames:
+        return np.zeros(len(rows), dtype=bool)
+    bitmap = index["categoryBitmaps"][categoryNames.index(category)]
+    return ((bitmap[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+def loadEventIndex(indexLocation, memoryMap=True):
+    """
+        Loads an index saved by "saveEventIndex". Arrays are memory-mapped by
+        default, so loading is near instant and pages are only read from disk
+        when a query touches them.
+
+        Input: String indexLocation folder, boolean memoryMap
+
+        Output: Dict index usable by the query functions
+    """
+    indexPath = Path(indexLocation)
+    with open(indexPath / metadataFileName, "r") as inFile:
+        index = {"metadata": json.load(inFile)}
+    for arrayName in arrayNames:
+        index[arrayName] = np.load(indexPath / f"{arrayName}.npy",
+                                   mmap_mode="r" if memoryMap else None)
+    return index
+
+def nearestEvents(index, longitude, latitude, k=1, category=None):
+    """
+        Finds the k events nearest (great-circle distance) to a position by
+        searching rings of grid cells outwards until no unsearched cell can
+        hold anything closer than the k-th nearest event found.
+
+        Input: Dict index, floats longitude and latitude in degrees, positive
+        integer k, optional string category id to restrict the search to
+
+        Output: Tuple of (array of row numbers, array of distances in km),
+        nearest first
+    """
+    metadata = index["metadata"]
+    cellSize = metadata["cellSize"]
+    numCellsX = metadata["numCellsX"]
+    numCellsY = metadata["numCellsY"]
+    centerCell = determineCells(np.array([longitude]), np.array([latitude]),
+                                cellSize, numCellsX, numCellsY)[0]
+    centerX, centerY = centerCell % numCellsX, centerCell // numCellsX
+
+    rows = np.empty(0, dtype=np.int64)
+    distances = np.empty(0)
+    visitedCells = set()
+    for ring in range(max(numCellsX, numCellsY) + 1):
+
+        # Gather the rows of the not yet visited cells on this ring
+        ringRows = []
+        for cellY in range(max(centerY - ring, 0),
+                           min(centerY + ring, numCellsY - 1) + 1):
+            onEdge = abs(cellY - centerY) == ring
+            cellXs = range(centerX - ring, centerX + ring + 1) if onEdge \
+                     else (centerX - ring, centerX + ring)
+            newCellXs = {cellX % numCellsX for cellX in cellXs
+                         if (cellX % numCellsX, cellY) not in visitedCells}
+            visitedCells.update((cellX, cellY) for cellX in newCellXs)
+            ringRows.append(cellRows(index, newCellXs, cellY))
+        newRows = np.concatenate(ringRows)
+        if category is not None:
+            newRows = newRows[hasCategory(index, newRows, category)]
+        if len(newRows):
+            newDistances = greatCircleDistances(index["longitudes"][newRows],
+                                                index["latitudes"][newRows],
+                                                longitude, latitude)
+            rows = np.concatenate([rows, newRows])
+            distances = np.concatenate([distances, newDistances])
+        if len(visitedCells) == numCellsX * numCellsY:
+            break # Searched everything
+
+        # Unvisited cells are at least ring cells away in longitude or 
+        # latitude; the longitude bound is the smaller one, taken at the 
+        # highest latitude the next ring reaches
+        if len(rows) >= k:
+            kthDistance = np.partition(distances, k - 1)[k - 1]
+            bandEdge = min(abs(latitude) + (ring + 1) * cellSize, 90)
+            halfGap = math.radians(min(ring * cellSize, 180)) / 2
+            ringDistance = 2 * earthRadiusKm * math.asin(
+                math.cos(math.radians(bandEdge)) * math.sin(halfGap))
+            if ringDistance >= kthDistance:
+                break
+
+    nearest = np.argsort(distances, kind="stable")[:k]
+    return rows[nearest], distances[nearest]
+
+def queryEventIndex(index, bbox=None, start=None, end=None, category=None):
+    """
+        Finds the events inside a bounding box and time window that belong to
+        a category. Every filter is optional. The most selective of the grid
+        (bbox) and the sorted dates (time window) picks the candidate rows;
+        the remaining filters are then checked on those candidates only.
+
+        Input: Dict index, optional tuple bbox of (minLongitude, minLatitude,
+        maxLongitude, maxLatitude) with minLongitude <= maxLongitude, optional
+        start (inclusive) and end (exclusive) dates as ISO strings or
+        datetimes, optional string category id
+
+        Output: Sorted array of row numbers of matching events
+    """
+    numEvents = index["metadata"]["numEvents"]
+
+    # Rows within the time window; two binary searches on the sorted dates
+    dateRange = None
+    if start is not None or end is not None:
+        sortedDates = index["sortedDates"]
+        startPosition = 0 if start is None else \
+            np.searchsorted(sortedDates, toNanoseconds(start), side="left")
+        endPosition = len(sortedDates) if end is None else \
+            np.searchsorted(sortedDates, toNanoseconds(end), side="left")
+        dateRange = (startPosition, endPosition)
+
+    # Rows in the cells the bbox overlaps
+    bboxRows = None
+    if bbox is not None:
+        minLongitude, minLatitude, maxLongitude, maxLatitude = bbox
+        metadata = index["metadata"]
+        corners = determineCells(np.array([minLongitude, maxLongitude]),
+                                 np.array([minLatitude, maxLatitude]),
+                                 metadata["cellSize"], metadata["numCellsX"],
+                                 metadata["numCellsY"])
+        numCellsX = metadata["numCellsX"]
+        cellXs = range(corners[0] % numCellsX, corners[1] % numCellsX + 1)
+        bboxRows = np.concatenate(
+            [cellRows(index, cellXs, cellY) for cellY in
+             range(corners[0] // numCellsX, corners[1] // numCellsX + 1)])
+
+    # Start from the smaller candidate set, then filter exactly
+    if dateRange is not None and (bboxRows is None or
+                                  dateRange[1] - dateRange[0] < len(bboxRows)):
+        rows = np.asarray(index["dateOrder"][dateRange[0]:dateRange[1]])
+    elif bboxRows is not None:
+        rows = bboxRows
+    elif category is not None:
+        categoryNames = index["metadata"]["categoryNames"]
+        if category not in categoryNames:
+            return np.empty(0, dtype=np.int64)
+        bitmap = index["categoryBitmaps"][categoryNames.index(category)]
+        return np.flatnonzero(np.unpackbits(bitmap, count=numEvents))
+    else:
+        return np.arange(numEvents)
+
+    keep = np.ones(len(rows), dtype=bool)
+    if bbox is not None:
+        longitudes = index["longitudes"][rows]
+        latitudes = index["latitudes"][rows]
+        keep &= (longitudes >= minLongitude) & (longitudes <= maxLongitude) & \
+                (latitudes >= minLatitude) & (latitudes <= maxLatitude)
+    if dateRange is not None:
+        dates = index["dates"][rows]
+        if start is not None:
+            keep &= dates >= toNanoseconds(start)
+        if end is not None:
+            keep &= dates < toNanoseconds(end)
+    if category is not None:
+        keep &= hasCategory(index, rows, category)
+
+    return np.sort(rows[keep])
+
+def saveEventIndex(index, indexLocation):
+    """
+        Saves an index to a folder of ".npy" files + a metadata JSON file, so
+        it can be memory-mapped back with "loadEventIndex".
+
+        Input: Dict index from "buildEventIndex", string indexLocation folder
+        (created if needed)
+
+        Output: None
+    """
+    indexPath = Path(indexLocation)
+    indexPath.mkdir(parents=True, exist_ok=True)
+    for arrayName in arrayNames:
+        np.save(indexPath / f"{arrayName}.npy", np.asarray(index[arrayName]))
+    with open(indexPath / metadataFileName, "w") as outFile:
+        outFile.write(json.dumps(index["metadata"], indent=4))
+
+def toNanoseconds(date):
+    """
+        Converts a date to UTC nanoseconds since the epoch, the unit dates are
+        indexed in.
+
+        Input: ISO date string, datetime or Timestamp; naive dates are UTC
+
+        Output: Integer nanoseconds
+    """
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return timestamp.value
@@ -3,38 +3,79 @@
     Categories and Sources JSON files are also parsed for useful info only that 
     will later be used for Tableau (added after data has been homogenized).
     
-    Data is read from "./data" by default, though this can later be changed to
-    be a script argument or configuration instead. Only 3 files should be in
-    the data folder; Events, Categories, and Sources, each following filename
-    convention as stated in pullData.py. This may be changed in the future to be
-    more intelligent.
+    Data is read from "./data" by default ("--input" reads another folder, such
+    as a pullData.py output folder). The folder should hold 3 files; Events, 
+    Categories, and Sources, each following filename convention as stated in 
+    pullData.py. Other files in the folder are ignored.
     
     Any errors are written to a log file for post review, stored where processed 
     data is in ("./output/[time-based name]", where the time-based folder name 
-    is determined in determineFolderName and "." is used by default).
+    is determined in determineFolderName and "." is used by default). Metrics
+    of each run (wall time, CPU time and peak memory of each stage, and how 
+    many features were dropped as non-Point) are written next to the log as 
+    "metrics.json" (see "../pipelineMetrics.py").
 
-    Input: None (Assumes data is from a folder called 'data', same location as 
-    this script. This could be changed to accept a script argument or config
-    file that specifies where to read data from)
+    Events are homogenized as plain dicts by default (the light engine, see
+    "homogenizeFeatures"), so short runs start without importing geopandas;
+    "--engine geopandas" goes through a GeoDataFrame instead, with the same
+    output. Options that need a GeoDataFrame ("--format", "--index", and 
+    "--aggregate") use the geopandas engine, which is then imported lazily.
 
-    Output: Homogenized GeoJSON file of type Point, log, and parsed JSON files; 
-    files located in "./output/[time-based name]" folder by default
+    With "--stream" Events are instead read, homogenized, and written one 
+    feature at a time with an incremental JSON parser, so memory stays bounded
+    however large the Events file (e.g. a historical dump) is.
+
+    Input: Optional script arguments (see "parseArguments"). Assumes data is 
+    from a folder called 'data', same location as this script, unless 
+    "--input" is given.
+
+    Output: Homogenized GeoJSON file of type Point (or, with "--format", a 
+    GeoParquet or Arrow IPC/Feather file), log, and parsed JSON files; files 
+    located in "./output/[time-based name]" folder by default
 """
 
 ## IMPORTS
+import argparse # For parsing script arguments
 from datetime import datetime # For standardizing filenames
-import geopandas as gpd # For exporting GeoJSON files + manipulating them
+from itertools import chain # For exploding every event's sources at once
+import gzip # For reading files streamed by pullData.py with "--gzip"
 import json # For reading EONET, Sources, and Categories files
 import logging # For logging purposes
+from operator import itemgetter # For pulling ids out of categories + sources
 from pathlib import Path # For making directories, files, and parsing file names
+import re # For finding the start of the features array when streaming
+import sys # For importing pipelineMetrics from the repo's root
+import tempfile # For spilling exploded vertices to disk when streaming
+
+# geopandas, numpy, and shapely (and eventIndex + eventAggregates, which need
+# numpy + pandas) are only imported by the functions that use them, so runs 
+# with the light engine start without loading them
+
+try:
+    import orjson # For faster reading of EONET, Sources, and Categories files
+except ImportError:
+    orjson = None
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+import pipelineMetrics # For per-stage metrics and feature counts of each run
 
 ## CONSTANTS
-numDataFiles = 3 # Currently only 3 data files are supported from EONET
+dataTypes = ("Events", "Categories", "Sources") # Only data files supported
 geo_crs = "EPSG:4326" # WGS84 coordinate system
+streamChunkSize = 64 * 1024 # Characters read at a time when streaming features
+featuresArrayPattern = re.compile(r'"features"\s*:\s*\[')
+explodedTypes = ("LineString", "Polygon") # Exploded into dated Points
+vertexPrecision = 5 # Decimal places coordinates are matched on when deduping
+eventsFormats = {"geojson": "geojson", "parquet": "parquet", 
+                 "feather": "feather"} # Output format to file extension
+# Compression of GeoParquet + Feather output; Feather is left uncompressed 
+# so memory-mapped reads are zero-copy
+columnarCompression = {"parquet": "zstd", "feather": None}
+engines = ("auto", "light", "geopandas") # "auto": light unless a GDF is needed
 
 ## HELPER FUNCTIONS 
 
-def createOutputFiles(outputLocation="."):
+def createOutputFiles(outputLocation=".", eventsFormat="geojson"):
     """
         Attempts to write the GeoJSON, JSON, and log files to 
         "[outputLocation]/output/[folderName]", where [folderName] is determined 
@@ -42,7 +83,8 @@ def createOutputFiles(outputLocation="."):
         created.
             
         Input: Folder location to write output files to. Will use ".", the 
-        current location of the script, by default.
+        current location of the script, by default. String eventsFormat of the
+        homogenized events (a key of eventsFormats), "geojson" by default.
         
         Output: Dict of locations for empty GeoJSON + JSON + log files
     """
@@ -56,7 +98,8 @@ def createOutputFiles(outputLocation="."):
     Path(outputFolder).mkdir(exist_ok=False) # Folder should not already exist
     
     # Figure out file names to use
-    eventsFile = f"{outputFolder}/homogenizedEvents.geojson"
+    eventsFile = (f"{outputFolder}/homogenizedEvents."
+                  f"{eventsFormats[eventsFormat]}")
     categoriesFile = f"{outputFolder}/parsedCategories.json"
     sourcesFile = f"{outputFolder}/parsedSources.json"
     logFile = f"{outputFolder}/log.log"
@@ -70,6 +113,23 @@ def createOutputFiles(outputLocation="."):
     # Return locations for files
     return fileLocations
 
+def deduplicateVertices(vertices, pointKeys):
+    """
+        Drops the exploded vertices whose key is already in pointKeys (or 
+        repeats an earlier vertex). Vertices are taken one at a time, so they
+        can be read back from disk (see "streamHomogenizedEvents").
+        
+        Input: Iterable of exploded vertex Point features, set pointKeys of 
+        keys (see "vertexKey") of the existing Points; updated in place
+        
+        Output: Generator of the vertices that are new
+    """
+    for vertex in vertices:
+        key = vertexKey(vertex)
+        if key not in pointKeys:
+            pointKeys.add(key)
+            yield vertex
+
 def determineFolderName():
     """
         Determines the folder name to use when writing the EONET and log data to 
@@ -84,27 +144,197 @@ def determineFolderName():
     folderName = currentDateTime.strftime("%d-%m-%Y_T%H-%M-%S")
     return folderName
 
-def homogenizeData(parsedEONETData):
+def explodeAndDeduplicate(features):
+    """
+        Explodes every LineString/Polygon feature into dated Point features 
+        (see "explodeFeature") and drops the vertices that duplicate an 
+        existing Point, so no data is lost when non-Point geometries are 
+        removed. Duplicates are found in a single pass with a hash set of 
+        (event id, date, rounded coordinates) keys.
+        
+        Input: List of EONET Events feature dicts
+        
+        Output: Tuple of (list of features with the exploded geometries 
+        replaced by their new vertices, appended at the end, dict with the 
+        number of 'new' and 'duplicate' vertices)
+    """
+    keptFeatures = []
+    pointKeys = set()
+    vertices = []
+    for feature in features:
+        geometry = feature["geometry"]
+        if geometry is not None and geometry["type"] in explodedTypes:
+            vertices.extend(explodeFeature(feature))
+            continue
+        if geometry is not None and geometry["type"] == "Point":
+            pointKeys.add(vertexKey(feature))
+        keptFeatures.append(feature)
+    
+    newVertices = list(deduplicateVertices(vertices, pointKeys))
+    vertexCounts = {"new": len(newVertices), 
+                    "duplicate": len(vertices) - len(newVertices)}
+    return keptFeatures + newVertices, vertexCounts
+
+def explodeFeature(feature):
+    """
+        Turns each vertex of a LineString (or a Polygon's exterior ring) into 
+        a Point feature dated with its matching 'geometryDates' entry. The new
+        features have the same properties as EONET's own Points (in the same 
+        order), with no magnitude and the event's sources if it has any.
+        
+        Input: LineString or Polygon feature dict
+        
+        Output: Generator of Point feature dicts; none if the feature has 
+        neither 'geometryDates' nor a 'date' to date its vertices with
+    """
+    properties = feature["properties"]
+    geometry = feature["geometry"]
+    if geometry["type"] == "Polygon":
+        vertices = geometry["coordinates"][0][:-1] # Ring repeats its start
+    else:
+        vertices = geometry["coordinates"]
+    
+    # Vertices are dated by geometryDates when they line up, else all share 
+    # the feature's date
+    geometryDates = properties.get("geometryDates") or []
+    if not geometryDates and not properties.get("date"):
+        logging.warning(f"Skipped exploding {geometry['type']} of event "
+                        f"{properties.get('id')}: it has no dates")
+        return
+    if len(geometryDates) != len(vertices):
+        featureDate = properties.get("date") or geometryDates[0]
+        geometryDates = [featureDate] * len(vertices)
+    
+    for vertex, geometryDate in zip(vertices, geometryDates):
+        vertexProperties = {
+            "id": properties["id"], "title": properties["title"], 
+            "description": properties.get("description"), 
+            "link": properties.get("link"), "closed": properties.get("closed"),
+            "date": normalizeDate(geometryDate), "magnitudeValue": None, 
+            "magnitudeUnit": None, "categories": properties["categories"], 
+            "sources": properties.get("sources", [])}
+        yield {"type": "Feature", "properties": vertexProperties, 
+               "geometry": {"type": "Point", "coordinates": list(vertex)}}
+
+def filterPoints(eventsGDF):
+    """
+        Keeps only the rows of eventsGDF whose geometry is a Point. Geometry 
+        types are checked for the whole geometry array at once with shapely
+        rather than row by row.
+        
+        Input: GeoDataFrame eventsGDF
+        
+        Output: GeoDataFrame with only the Point rows of eventsGDF
+    """
+    import shapely # Imported lazily; only the geopandas engine needs it
+    
+    typeIds = shapely.get_type_id(eventsGDF['geometry'].values)
+    return eventsGDF[typeIds == shapely.GeometryType.POINT]
+
+def homogenizeData(parsedEONETData, explodeLines=True):
     """
         Homogenizes EONET Events data. Currently this is limited to making all
-        data as geometry type Point. Note that LineString in data is already
-        mentioned as a Point, thus coordinates in LineString are duplicates.
-        Supported types: Point, LineString
+        data as geometry type Point. LineString (and Polygon) vertices are 
+        exploded into dated Points, and only the ones that are not already 
+        mentioned as a Point are kept (see "explodeAndDeduplicate"); usually
+        they are all duplicates. Supported types: Point, LineString, Polygon
         
-        Input: Dict of dicts of parsed EONET data; only 'Events' is used
+        Input: Dict of dicts of parsed EONET data; only 'Events' is used. 
+        Boolean explodeLines; if False, non-Point geometries are just dropped
         
         Output: GeoDataFrame of homogenized Events data
     """
-    # Grab Events data from parsedEONETData and import into geopandas data frame
-    eventsData = parsedEONETData['Events']
-    eventsGDF = gpd.GeoDataFrame.from_features(eventsData["features"], crs=geo_crs)
+    import geopandas as gpd # Imported lazily; only the geopandas engine needs it
+    
+    # Grab Events data from parsedEONETData, explode non-Point geometries and
+    # import into geopandas data frame
+    eventsFeatures = parsedEONETData['Events']["features"]
+    numFeatures = len(eventsFeatures)
+    vertexCounts = {"new": 0, "duplicate": 0}
+    if explodeLines:
+        eventsFeatures, vertexCounts = explodeAndDeduplicate(eventsFeatures)
+        logging.info(f"Exploded non-Point geometries into "
+                     f"{vertexCounts['new']} new and "
+                     f"{vertexCounts['duplicate']} duplicate vertices")
+    eventsGDF = gpd.GeoDataFrame.from_features(eventsFeatures, crs=geo_crs)
     
     # Only grab Point geometry entries and exclude 'geometryDates' column
-    filtered_gdf = eventsGDF[eventsGDF['geometry'].apply(lambda x : x.geom_type == 'Point')]
-    filtered_gdf = filtered_gdf.drop(columns=['geometryDates'])
+    filtered_gdf = filterPoints(eventsGDF)
+    filtered_gdf = filtered_gdf.drop(columns=['geometryDates'], 
+                                     errors='ignore')
+    recordFeatureCounts(numFeatures, len(filtered_gdf), vertexCounts['new'], 
+                        vertexCounts['duplicate'])
     
     return filtered_gdf
 
+def homogenizeFeature(feature, parsedEONETData):
+    """
+        Homogenizes a single EONET Events feature the same way "homogenizeData"
+        + "improveReadability" do for a whole GeoDataFrame: non-Point features
+        are dropped, 'geometryDates' is removed, coordinates and magnitudes 
+        become floats (like the GeoDataFrame's magnitude column, which also 
+        holds events without one), and 'simpleCategory' + 'simpleSources' are
+        added.
+        
+        Input: Dict feature from the Events FeatureCollection, dict of dicts 
+        parsedEONETData (only 'Categories' and 'Sources' are used)
+        
+        Output: Homogenized feature dict, or None if it is not a Point
+    """
+    geometry = feature["geometry"]
+    if geometry is None or geometry["type"] != "Point":
+        return None
+    
+    properties = {key: value for key, value in feature["properties"].items() 
+                  if key != "geometryDates"}
+    if properties.get('magnitudeValue') is not None:
+        properties['magnitudeValue'] = float(properties['magnitudeValue'])
+    categories = parsedEONETData['Categories']
+    sources = parsedEONETData['Sources']
+    properties['simpleCategory'] = \
+        categories[properties['categories'][0]['id']]['title']
+    properties['simpleSources'] = \
+        ', '.join([sources[d['id']]['title'] for d in properties['sources']])
+    
+    return {"type": "Feature", "properties": properties, 
+            "geometry": {"type": "Point", "coordinates": 
+                         [float(c) for c in geometry["coordinates"]]}}
+
+def homogenizeFeatures(parsedEONETData, explodeLines=True):
+    """
+        Light engine alternative to "homogenizeData" + "improveReadability": 
+        the Events features are exploded + deduplicated the same way, then 
+        homogenized one plain dict at a time with "homogenizeFeature", so 
+        neither geopandas nor numpy has to be imported. Written with 
+        "writeFeatureCollection", the output matches the geopandas engine's 
+        as long as some event has no magnitude (always the case for EONET); 
+        otherwise geopandas keeps an all-integer magnitude column as integers
+        while this engine writes floats.
+        
+        Input: Dict of dicts of parsed EONET data. Boolean explodeLines; if 
+        False, non-Point geometries are just dropped
+        
+        Output: List of homogenized feature dicts
+    """
+    eventsFeatures = parsedEONETData['Events']["features"]
+    numFeatures = len(eventsFeatures)
+    vertexCounts = {"new": 0, "duplicate": 0}
+    if explodeLines:
+        eventsFeatures, vertexCounts = explodeAndDeduplicate(eventsFeatures)
+        logging.info(f"Exploded non-Point geometries into "
+                     f"{vertexCounts['new']} new and "
+                     f"{vertexCounts['duplicate']} duplicate vertices")
+    
+    homogenizedFeatures = []
+    for feature in eventsFeatures:
+        homogenizedFeature = homogenizeFeature(feature, parsedEONETData)
+        if homogenizedFeature is not None:
+            homogenizedFeatures.append(homogenizedFeature)
+    recordFeatureCounts(numFeatures, len(homogenizedFeatures), 
+                        vertexCounts['new'], vertexCounts['duplicate'])
+    
+    return homogenizedFeatures
+
 def improveReadability(homogenizedEvents, parsedEONETData):
     """
         Adds two columns to the homogenized events data: 'simpleCategory' and 
@@ -118,20 +348,273 @@ def improveReadability(homogenizedEvents, parsedEONETData):
         Output: Modded GeoDataFrame homogenizedEvents that contains the new 
         columns
     """
-    # Adding a simpler version of categories for each event
+    import numpy as np # Imported lazily; only the geopandas engine needs it
+    
+    # Adding a simpler version of categories for each event; the first 
+    # category id of every event is turned into a categorical code, and all
+    # titles are then taken from the codes at once
     categories = parsedEONETData['Categories']
-    # Lambda function for mapping to categories column; maps to full title
-    getCategory = lambda e : categories[e[0]['id']]['title']
-    homogenizedEvents['simpleCategory'] = homogenizedEvents.categories.apply(getCategory)
+    eventCategories = homogenizedEvents.categories.to_numpy()
+    firstCategories = map(itemgetter(0), eventCategories)
+    categoryIds = map(itemgetter('id'), firstCategories)
+    homogenizedEvents['simpleCategory'] = \
+        lookupTitles(categoryIds, len(homogenizedEvents), categories)
     
-    # Adding a simpler version of sources for each event
+    # Adding a simpler version of sources for each event; the sources of all
+    # events are exploded into one batch and mapped to titles, then each 
+    # event's run of titles is joined with a single reduceat
     sources = parsedEONETData['Sources']
-    # Lambda function for mapping to sources column; maps to full title of sources
-    getSources = lambda e : ', '.join([sources[d['id']]['title'] for d in e])
-    homogenizedEvents['simpleSources'] = homogenizedEvents.sources.apply(getSources)
+    eventSources = homogenizedEvents.sources.to_numpy()
+    sourceCounts = np.fromiter(map(len, eventSources), np.intp, 
+                               len(eventSources))
+    explodedSources = chain.from_iterable(eventSources)
+    sourceIds = map(itemgetter('id'), explodedSources)
+    sourceTitles = lookupTitles(sourceIds, sourceCounts.sum(), sources)
+    rowNumbers = np.repeat(np.arange(len(homogenizedEvents)), sourceCounts)
+    isFirst = np.ones(len(rowNumbers), dtype=bool)
+    isFirst[1:] = rowNumbers[1:] != rowNumbers[:-1]
+    titlePieces = np.where(isFirst, sourceTitles, ', ' + sourceTitles)
+    simpleSources = np.full(len(homogenizedEvents), '', dtype=object)
+    if len(titlePieces):
+        simpleSources[rowNumbers[isFirst]] = \
+            np.add.reduceat(titlePieces, np.flatnonzero(isFirst))
+    homogenizedEvents['simpleSources'] = simpleSources
     
     return homogenizedEvents
 
+def iterFeatures(eventsFile):
+    """
+        Yields the features of a GeoJSON FeatureCollection file one at a time
+        using an incremental parser, so only one feature (plus a read chunk) is
+        held in memory at once. Gzipped files (".gz") are also read.
+        
+        Input: String eventsFile location of the FeatureCollection
+        
+        Output: Generator of feature dicts
+    """
+    decoder = json.JSONDecoder()
+    openFile = gzip.open if str(eventsFile).endswith(".gz") else open
+    with openFile(eventsFile, "rt", encoding="utf-8") as inFile:
+        
+        # Skip ahead to the start of the features array
+        buffer = ""
+        match = None
+        while match is None:
+            chunk = inFile.read(streamChunkSize)
+            if not chunk:
+                raise ValueError(f"No features array found in {eventsFile}")
+            buffer += chunk
+            match = featuresArrayPattern.search(buffer)
+        position = match.end()
+        
+        # Decode one feature at a time, reading more whenever one is cut off
+        endOfFile = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position >= len(buffer):
+                    raise json.JSONDecodeError("Need more data", buffer, 
+                                               position)
+                feature, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if endOfFile:
+                    raise
+                
+                # At least double what is pending, so a feature much bigger 
+                # than a chunk is only re-decoded a logarithmic number of times
+                chunk = inFile.read(max(streamChunkSize, 
+                                        len(buffer) - position))
+                endOfFile = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield feature
+
+def loadJSON(inFile):
+    """
+        Reads a JSON document with orjson when it is installed (several times 
+        faster on large Events files) and with json otherwise; both give the
+        same dicts.
+        
+        Input: Binary file object to read
+        
+        Output: Parsed JSON document
+    """
+    if orjson is not None:
+        return orjson.loads(inFile.read())
+    return json.load(inFile)
+
+def locateData(inputLocation = './data'):
+    """
+        Determines which file in inputLocation holds Events, Categories, and 
+        Sources. Assumes files follow standard naming convention as defined in
+        "pullData.py" script; other files (such as pullData.py's log) are 
+        ignored, so a pullData.py output folder can be read directly.
+        
+        Input: String inputLocation that defines where data is stored in,
+        './data' by default
+        
+        Output: Dict of type of EONET data to its file location
+    """
+    # Determine list of files in inputLocation
+    inputPath = Path(inputLocation)
+    files = list(file for file in inputPath.iterdir() if file.is_file())
+    
+    # Determine which file is which
+    fileLocations = {}
+    for file in files:
+        fileName = file.name
+        tokenizedFileName = fileName.split('.')
+        typeFile = tokenizedFileName[0].title() # Grab type of file
+        if typeFile not in dataTypes or tokenizedFileName[-1] == "tmp":
+            continue # Not EONET data (or an unfinished streamed file)
+        if typeFile not in fileLocations:
+            fileLocations[typeFile] = str(inputPath / fileName)
+        else:
+            errorMsg = f"Detected repeated {typeFile} file in {inputLocation}"
+            raise Exception(errorMsg)
+    
+    # Quick sanity check that all 3 files are there
+    missingTypes = [typeFile for typeFile in dataTypes 
+                    if typeFile not in fileLocations]
+    errorMsg = f"Missing {', '.join(missingTypes)} file(s) in {inputLocation}"
+    assert not missingTypes, errorMsg
+    
+    return fileLocations
+
+def lookupTitles(ids, numIds, parsedInfo):
+    """
+        Maps Category or Source ids to their titles in one vectorized step: 
+        the ids are factorized, each distinct id is turned into a categorical 
+        code (its position in parsedInfo) with a pandas Index lookup, and the 
+        titles are taken from the array of codes at once.
+        
+        Input: Iterable of string ids, integer numIds of ids, dict parsedInfo
+        of id to a dict with a 'title' (parsed Categories or Sources)
+        
+        Output: NumPy object array of titles, aligned with ids; a KeyError is
+        raised for an unknown id
+    """
+    import numpy as np # Imported lazily; only the geopandas engine needs it
+    import pandas as pd
+    
+    # Factorize the ids, then look up only the few distinct ones
+    idCodes, uniqueIds = pd.factorize(np.fromiter(ids, object, numIds))
+    uniqueCodes = pd.Index(list(parsedInfo)).get_indexer(uniqueIds)
+    if (uniqueCodes == -1).any():
+        raise KeyError(uniqueIds[np.argmax(uniqueCodes == -1)])
+    codes = uniqueCodes[idCodes]
+    titles = np.array([info['title'] for info in parsedInfo.values()], 
+                      dtype=object)
+    return titles[codes]
+
+def normalizeDate(date):
+    """
+        Normalizes an EONET date to the format Point dates use; 
+        'geometryDates' use "YYYY-MM-DD HH:MM:SS" while Points use 
+        "YYYY-MM-DDTHH:MM:SSZ".
+        
+        Input: String date in either format
+        
+        Output: String date as "YYYY-MM-DDTHH:MM:SSZ"
+    """
+    return date.replace(" ", "T").rstrip("Z") + "Z"
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments. All arguments are optional; running the
+        script without any gives the original output (with the light engine,
+        see "homogenizeFeatures"). "--engine auto" is resolved to "light" 
+        unless an option needs a GeoDataFrame, then to "geopandas".
+        
+        Input: List of string arguments, sys.argv by default
+        
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Homogenizes EONET Events to "
+                                     "Points only")
+    parser.add_argument("--input", default="./data", 
+                        help="folder holding the Events, Categories, and "
+                        "Sources files, e.g. a pullData.py output folder "
+                        "(default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", 
+                        help="homogenize Events one feature at a time in "
+                        "bounded memory")
+    parser.add_argument("--engine", choices=engines, default="auto", 
+                        help="homogenize with plain dicts (light; starts "
+                        "fast, no geopandas import) or a GeoDataFrame "
+                        "(geopandas); auto picks light unless --format, "
+                        "--index, or --aggregate needs geopandas (default: "
+                        "%(default)s)")
+    parser.add_argument("--drop-lines", action="store_true", 
+                        help="drop non-Point geometries instead of exploding "
+                        "their new vertices into Points")
+    parser.add_argument("--format", choices=list(eventsFormats), 
+                        default="geojson", help="output format of the "
+                        "homogenized events (default: %(default)s; parquet and"
+                        " feather need pyarrow and are not available with "
+                        "--stream)")
+    parser.add_argument("--index", action="store_true", 
+                        help="also save a memory-mappable spatio-temporal "
+                        "query index of the homogenized events (see "
+                        "eventIndex.py; not available with --stream)")
+    parser.add_argument("--aggregate", action="store_true", 
+                        help="also save a pyramid of pre-aggregated grid "
+                        "layers (counts + max magnitude per cell, category "
+                        "and time bucket; see eventAggregates.py; not "
+                        "available with --stream)")
+    parser.add_argument("--tiles", action="store_true", 
+                        help="also write the aggregated layers as vector "
+                        "tiles (implies --aggregate)")
+    parser.add_argument("--max-zoom", type=int, 
+                        help="finest zoom level aggregated (default: "
+                        "eventAggregates.py's defaultMaxZoom, 8)")
+    parser.add_argument("--time-bucket", 
+                        help="time bucket events are aggregated by; year, "
+                        "month, week, or day (default: eventAggregates.py's "
+                        "defaultTimeBucket, month)")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="also write the run's metrics to FILE in "
+                        "Prometheus text format (e.g. for node_exporter's "
+                        "textfile collector)")
+    parsedArguments = parser.parse_args(arguments)
+    parsedArguments.aggregate = parsedArguments.aggregate or \
+                                parsedArguments.tiles
+    if parsedArguments.index and parsedArguments.stream:
+        parser.error("--index can not be combined with --stream")
+    if parsedArguments.aggregate and parsedArguments.stream:
+        parser.error("--aggregate and --tiles can not be combined with "
+                     "--stream")
+    if parsedArguments.format != "geojson" and parsedArguments.stream:
+        parser.error("--format can not be combined with --stream")
+    
+    # Aggregation defaults live in eventAggregates, which is only imported 
+    # (with numpy + pandas) when aggregating
+    if parsedArguments.aggregate:
+        import eventAggregates # For the aggregation defaults
+        if parsedArguments.max_zoom is None:
+            parsedArguments.max_zoom = eventAggregates.defaultMaxZoom
+        if parsedArguments.time_bucket is None:
+            parsedArguments.time_bucket = eventAggregates.defaultTimeBucket
+        if not 0 <= parsedArguments.max_zoom <= 20:
+            parser.error("--max-zoom should be 0 to 20")
+        if parsedArguments.time_bucket not in eventAggregates.timeBuckets:
+            parser.error("--time-bucket should be one of " + 
+                         ", ".join(eventAggregates.timeBuckets))
+    
+    # Only the geopandas engine makes the GeoDataFrame these options need
+    needsGeoDataFrame = parsedArguments.format != "geojson" or \
+                        parsedArguments.index or parsedArguments.aggregate
+    if parsedArguments.engine == "light" and needsGeoDataFrame:
+        parser.error("--engine light can not be combined with --format, "
+                     "--index, or --aggregate")
+    if parsedArguments.engine == "auto":
+        parsedArguments.engine = "geopandas" if needsGeoDataFrame else "light"
+    return parsedArguments
+
 def parseData(EONETData):
     """
         Parses Dict of dicts, each dict entry representing EONET data. In this
@@ -168,45 +651,92 @@ def parseData(EONETData):
     
     return parsedEONETData
 
-def readData(inputLocation = './data'):
+def readColumnarEvents(fileLocation, columns=None, category=None):
+    """
+        Reads homogenized events written by "writeColumnarEvents". The file is
+        memory-mapped and only the requested columns are read; for GeoParquet
+        the category filter also skips whole row groups.
+        
+        Input: String fileLocation of a ".parquet" or ".feather" file, optional
+        list of columns to read (all by default), optional string category 
+        title ('simpleCategory') to keep
+        
+        Output: GeoDataFrame if 'geometry' was read, else a pandas DataFrame
+    """
+    import geopandas as gpd # Imported lazily; only needed for this format
+    import pyarrow as pa # Optional dependency; only needed for this format
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    
+    if str(fileLocation).endswith(".parquet"):
+        filters = None if category is None else \
+                  [('simpleCategory', '=', category)]
+        table = pq.read_table(fileLocation, columns=columns, filters=filters,
+                              memory_map=True)
+        geoMetadata = pq.read_schema(fileLocation).metadata[b"geo"]
+    else:
+        with pa.memory_map(str(fileLocation), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        geoMetadata = table.schema.metadata[b"geo"]
+        if category is not None:
+            table = table.filter(pc.equal(table['simpleCategory'], category))
+        if columns is not None:
+            table = table.select(columns)
+    
+    eventsDF = table.to_pandas()
+    if 'geometry' not in eventsDF.columns:
+        return eventsDF
+    geometryMetadata = json.loads(geoMetadata)["columns"]["geometry"]
+    geometry = gpd.GeoSeries.from_wkb(eventsDF['geometry'], 
+                                      crs=geometryMetadata.get("crs"))
+    return gpd.GeoDataFrame(eventsDF.drop(columns=['geometry']), 
+                            geometry=geometry)
+
+def readData(inputLocation = './data', skipEvents = False):
     """
         Reads in GeoJSON + JSON data for Events, Categories, and Sources from
         inputLocation. Assumes files follow standard naming convention as 
-        defined in "pullData.py" script.
+        defined in "pullData.py" script; gzipped files (".gz") are also read.
         
         Input: String inputLocation that defines where data is stored in,
-        './data' by default
+        './data' by default, boolean skipEvents to leave Events unread (None)
+        for when they are streamed instead
         
         Output: Dict of Dicts containing each file's respective data
     """
-    # Determine list of files in inputLocation
-    inputPath = Path(inputLocation)
-    files = list(file for file in inputPath.iterdir() if file.is_file())
-    
-    # Quick sanity check that there are only 3 files
-    errorMsg = f"There should only be {numDataFiles} files in {inputLocation}"
-    assert len(files) == numDataFiles, errorMsg
-    
     # Determine which file is which
-    fileLocations = {}
-    for file in files:
-        fileName = file.name
-        tokenizedFileName = fileName.split('.')
-        typeFile = tokenizedFileName[0].title() # Grab type of file
-        if typeFile not in fileLocations:
-            fileLocations[typeFile] = f"./data/{fileName}"
-        else:
-            errorMsg = f"Detected repeated {typeFile} file in {inputLocation}"
-            raise Exception(errorMsg)
+    fileLocations = locateData(inputLocation)
             
     # Read in data files
     filesData = {}
     for typeFile in fileLocations:
-        with open(fileLocations[typeFile], "r") as inFile:
-            filesData[typeFile] = json.load(inFile)
+        if skipEvents and typeFile == 'Events':
+            filesData[typeFile] = None
+            continue
+        openFile = gzip.open if fileLocations[typeFile].endswith(".gz") else open
+        with openFile(fileLocations[typeFile], "rb") as inFile:
+            filesData[typeFile] = loadJSON(inFile)
             
     return filesData
 
+def recordFeatureCounts(numFeatures, numKept, numNew, numDuplicate):
+    """
+        Adds the feature counts of a homogenization to the active metrics run
+        (see "pipelineMetrics.py"), including how many were dropped as 
+        non-Point.
+        
+        Input: Integer numFeatures read, integer numKept Points written, 
+        integers numNew + numDuplicate of exploded vertices
+        
+        Output: None
+    """
+    pipelineMetrics.incrementCounter("inputFeatures", numFeatures)
+    pipelineMetrics.incrementCounter("homogenizedFeatures", numKept)
+    pipelineMetrics.incrementCounter("droppedNonPointFeatures", 
+                                     numFeatures + numNew - numKept)
+    pipelineMetrics.incrementCounter("newVertices", numNew)
+    pipelineMetrics.incrementCounter("duplicateVertices", numDuplicate)
+
 def setupLogging(logFile):
     """
         Sets up logging with an initial logging message to indicate logger has
@@ -222,7 +752,140 @@ def setupLogging(logFile):
     logging.basicConfig(filename=logFile, filemode="w", level=logging.DEBUG, 
                         format=logFormatting)
                     
-def writeEONETData(fileLocations, parsedEONETData, homogenizedEvents):
+def streamHomogenizedEvents(eventsFile, parsedEONETData, outputFile, 
+                            explodeLines=True):
+    """
+        Constant-memory alternative to "homogenizeData" + "improveReadability"
+        + writing the events in "writeEONETData". Features are read one at a 
+        time from eventsFile, homogenized with "homogenizeFeature", and written 
+        to outputFile as they go. Exploded LineString/Polygon vertices (see 
+        "explodeAndDeduplicate") are spilled to a temporary file until every 
+        Point was seen, then read back one at a time and the new ones are 
+        written at the end; only the Point keys are kept in memory.
+        
+        Input: String eventsFile location of the EONET Events, dict of dicts 
+        parsedEONETData (only 'Categories' and 'Sources' are used), string 
+        outputFile location to write the homogenized GeoJSON to, boolean 
+        explodeLines; if False, non-Point geometries are just dropped
+        
+        Output: Dict with the number of features 'kept' and 'dropped' as 
+        non-Point, and of 'newVertices' and 'duplicateVertices'
+    """
+    counts = {"kept": 0, "dropped": 0, "newVertices": 0, 
+              "duplicateVertices": 0}
+    
+    def homogenizedFeatures(vertexFile):
+        pointKeys = set()
+        numVertices = 0
+        for feature in iterFeatures(eventsFile):
+            homogenizedFeature = homogenizeFeature(feature, parsedEONETData)
+            if homogenizedFeature is not None:
+                counts["kept"] += 1
+                if explodeLines:
+                    pointKeys.add(vertexKey(homogenizedFeature))
+                yield homogenizedFeature
+                continue
+            counts["dropped"] += 1
+            geometry = feature["geometry"]
+            if explodeLines and geometry is not None and \
+               geometry["type"] in explodedTypes:
+                for vertex in explodeFeature(feature):
+                    vertexFile.write(json.dumps(vertex) + "\n")
+                    numVertices += 1
+        
+        # Only the vertices that are not already a Point are new
+        vertexFile.seek(0)
+        for vertex in deduplicateVertices(map(json.loads, vertexFile), 
+                                          pointKeys):
+            counts["kept"] += 1
+            counts["newVertices"] += 1
+            yield homogenizeFeature(vertex, parsedEONETData)
+        counts["duplicateVertices"] = numVertices - counts["newVertices"]
+    
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as vertexFile:
+        writeFeatureCollection(outputFile, homogenizedFeatures(vertexFile))
+    recordFeatureCounts(counts["kept"] + counts["dropped"] - 
+                        counts["newVertices"], counts["kept"], 
+                        counts["newVertices"], counts["duplicateVertices"])
+    return counts
+
+def vertexKey(pointFeature):
+    """
+        Determines the key Points are deduplicated on: event id, normalized 
+        date, and coordinates rounded to vertexPrecision decimal places.
+        
+        Input: Point feature dict
+        
+        Output: Hashable tuple key
+    """
+    longitude, latitude = pointFeature["geometry"]["coordinates"][:2]
+    return (pointFeature["properties"]["id"], 
+            normalizeDate(pointFeature["properties"]["date"]), 
+            round(longitude, vertexPrecision), round(latitude, vertexPrecision))
+
+def writeColumnarEvents(fileLocation, homogenizedEvents, eventsFormat, 
+                        compression="default"):
+    """
+        Writes homogenized events as GeoParquet or Arrow IPC (Feather) with 
+        WKB geometries and GeoParquet "geo" metadata (with no bbox when there
+        are no events). Rows are sorted by 'simpleCategory' and month, and 
+        each (category, month) group gets its own row group (record batch for
+        Feather), so readers can skip whole groups.
+        
+        Input: String fileLocation to write to, GeoDataFrame of homogenized
+        Events (after "improveReadability"), string eventsFormat of "parquet" 
+        or "feather", compression codec name (or None for uncompressed); 
+        "default" uses the format's entry in columnarCompression
+        
+        Output: Integer number of row groups written
+    """
+    import pyarrow as pa # Optional dependency; only needed for this format
+    import pyarrow.parquet as pq
+    import shapely # Imported lazily; only needed for this format
+    
+    # Sort by partition keys, remembering where each partition starts
+    months = homogenizedEvents['date'].str[:7]
+    sortedEvents = homogenizedEvents.assign(month=months) \
+        .sort_values(['simpleCategory', 'month'], kind="stable") \
+        .drop(columns=['month'])
+    partitionKeys = list(zip(sortedEvents['simpleCategory'], 
+                             sortedEvents['date'].str[:7]))
+    partitionStarts = [position for position in range(len(partitionKeys)) 
+                       if position == 0 or 
+                       partitionKeys[position] != partitionKeys[position - 1]]
+    
+    # Arrow table with WKB geometries and GeoParquet metadata
+    table = pa.Table.from_pandas(
+        sortedEvents.drop(columns=['geometry']).reset_index(drop=True),
+        preserve_index=False)
+    table = table.append_column('geometry', pa.array(
+        shapely.to_wkb(sortedEvents['geometry'].values), type=pa.binary()))
+    geometryMetadata = {"encoding": "WKB", "geometry_types": ["Point"], 
+                        "crs": sortedEvents.crs.to_json_dict()}
+    if len(sortedEvents): # Bounds of no events would be NaN
+        geometryMetadata["bbox"] = list(sortedEvents.total_bounds)
+    geoMetadata = {"version": "1.0.0", "primary_column": "geometry", 
+                   "columns": {"geometry": geometryMetadata}}
+    table = table.replace_schema_metadata({"geo": json.dumps(geoMetadata)})
+    
+    # One row group/record batch per (category, month)
+    partitionEnds = partitionStarts[1:] + [len(partitionKeys)]
+    if compression == "default":
+        compression = columnarCompression[eventsFormat]
+    if eventsFormat == "parquet":
+        writer = pq.ParquetWriter(fileLocation, table.schema, 
+                                  compression=compression or "none")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_file(fileLocation, table.schema, options=options)
+    with writer:
+        for start, end in zip(partitionStarts, partitionEnds):
+            writer.write_table(table.slice(start, end - start))
+    
+    return len(partitionStarts)
+
+def writeEONETData(fileLocations, parsedEONETData, homogenizedEvents, 
+                   eventsFormat="geojson"):
     """
         Attempts to write parsed + homogenized data into their respective
         empty files, the locations of which are specified in fileLocations
@@ -230,14 +893,23 @@ def writeEONETData(fileLocations, parsedEONETData, homogenizedEvents):
         Input: Dict with type of EONET data and their respective file location
         called fileLocations, dict of each type of EONET data with the 
         associated data for each called parsedEONETData (ignoring 'Events'),
-        GeoDataFrame of homogenized Events
+        GeoDataFrame of homogenized Events (or list of homogenized feature 
+        dicts from "homogenizeFeatures"; None if already written by
+        "streamHomogenizedEvents"), string eventsFormat of the homogenized
+        events ("geojson" by default, see "writeColumnarEvents" for others)
         
         Output: None as the data should be successfully written to each datum's
         respective file
     """
     # First write homogenized data to appropriate file
-    with open(fileLocations['Events'], "w") as outFile:
-        outFile.write(homogenizedEvents.to_json(drop_id = True, indent = 4))
+    if homogenizedEvents is not None and eventsFormat != "geojson":
+        writeColumnarEvents(fileLocations['Events'], homogenizedEvents, 
+                            eventsFormat)
+    elif isinstance(homogenizedEvents, list):
+        writeFeatureCollection(fileLocations['Events'], homogenizedEvents)
+    elif homogenizedEvents is not None:
+        with open(fileLocations['Events'], "w") as outFile:
+            outFile.write(homogenizedEvents.to_json(drop_id = True, indent = 4))
         
     # Then write parsed Categories and Sources to respective files
     typeList = ['Categories', 'Sources']
@@ -249,33 +921,111 @@ def writeEONETData(fileLocations, parsedEONETData, homogenizedEvents):
         with open(fileLocations[typeData], "w") as outFile:
             outFile.write(jsonData)
            
+def writeFeatureCollection(fileLocation, features):
+    """
+        Writes an iterable of features to fileLocation as a GeoJSON 
+        FeatureCollection one feature at a time. The output is formatted 
+        exactly like json.dumps(..., indent=4) (and GeoDataFrame.to_json) 
+        would format the whole collection.
+        
+        Input: String fileLocation to write to, iterable of feature dicts
+        
+        Output: Integer number of features written
+    """
+    featureIndent = " " * 8
+    numFeatures = 0
+    with open(fileLocation, "w") as outFile:
+        outFile.write('{\n    "type": "FeatureCollection",\n    "features": [')
+        for feature in features:
+            featureJSON = json.dumps(feature, indent=4)
+            featureJSON = featureJSON.replace("\n", "\n" + featureIndent)
+            outFile.write(("," if numFeatures else "") + "\n" + featureIndent +
+                          featureJSON)
+            numFeatures += 1
+        outFile.write("\n    ]\n}" if numFeatures else "]\n}")
+    return numFeatures
+
 ## MAIN
 if __name__ == "__main__":
 
+    arguments = parseArguments()
+    fileLocations = None
+    pipelineMetrics.startRun("homogenizeEvents", determineFolderName())
+
     try:
         
         # Set up output files to check if outputs can be written without issue
-        fileLocations = createOutputFiles()
+        fileLocations = createOutputFiles(eventsFormat=arguments.format)
         
         # Initialize logging
         setupLogging(fileLocations["Log"])
         logging.info('Main logger initialized')
         
-        # Read in GeoJSON + JSON data
+        # Read in GeoJSON + JSON data; streamed Events are read later
         logging.info('Reading in data')
-        EONETData = readData()
+        with pipelineMetrics.measureStage("readData"):
+            EONETData = readData(arguments.input, skipEvents=arguments.stream)
         
         # Grab relevant info from EONET data (limited to Categories and Sources)
         logging.info('Parsing read EONET data')
-        parsedEONETData = parseData(EONETData)
+        with pipelineMetrics.measureStage("parseData"):
+            parsedEONETData = parseData(EONETData)
         
         # Homogenize EONET Events and modify info for readability purposes
-        homogenizedEvents = homogenizeData(parsedEONETData)
-        homogenizedEvents = improveReadability(homogenizedEvents, parsedEONETData)
+        if arguments.stream:
+            logging.info('Streaming homogenized Events to file')
+            with pipelineMetrics.measureStage("streamHomogenizedEvents"):
+                counts = streamHomogenizedEvents(
+                    locateData(arguments.input)['Events'], parsedEONETData, 
+                    fileLocations['Events'], not arguments.drop_lines)
+            logging.info(f"Kept {counts['kept']} Point features; dropped "
+                         f"{counts['dropped']} non-Point features with "
+                         f"{counts['newVertices']} new and "
+                         f"{counts['duplicateVertices']} duplicate vertices")
+            homogenizedEvents = None # Already written
+        elif arguments.engine == "light":
+            with pipelineMetrics.measureStage("homogenizeFeatures"):
+                homogenizedEvents = homogenizeFeatures(parsedEONETData, 
+                                                       not arguments.drop_lines)
+        else:
+            with pipelineMetrics.measureStage("homogenizeData"):
+                homogenizedEvents = homogenizeData(parsedEONETData, 
+                                                   not arguments.drop_lines)
+            with pipelineMetrics.measureStage("improveReadability"):
+                homogenizedEvents = improveReadability(homogenizedEvents, 
+                                                       parsedEONETData)
         
         # Attempt to write GeoDataFrame + JSON data
         logging.info('Writing homogenized EONET data to respective files')
-        writeEONETData(fileLocations, parsedEONETData, homogenizedEvents)
+        with pipelineMetrics.measureStage("writeEONETData"):
+            writeEONETData(fileLocations, parsedEONETData, homogenizedEvents, 
+                           arguments.format)
+        
+        # Save a query index next to the homogenized events
+        if arguments.index:
+            import eventIndex # Imported lazily; needs numpy + pandas
+            indexLocation = Path(fileLocations['Events']).parent / 'eventIndex'
+            logging.info(f'Saving query index to {indexLocation}')
+            with pipelineMetrics.measureStage("saveEventIndex"):
+                eventIndex.saveEventIndex(
+                    eventIndex.buildEventIndex(homogenizedEvents), 
+                    indexLocation)
+        
+        # Save pre-aggregated layers next to the homogenized events
+        if arguments.aggregate:
+            import eventAggregates # Imported lazily; needs numpy + pandas
+            aggregatesLocation = \
+                Path(fileLocations['Events']).parent / 'aggregates'
+            logging.info(f'Saving aggregated layers to {aggregatesLocation}')
+            with pipelineMetrics.measureStage("aggregateEvents"):
+                aggregates = eventAggregates.aggregateEvents(
+                    homogenizedEvents, maxZoom=arguments.max_zoom, 
+                    timeBucket=arguments.time_bucket)
+                numTiles = eventAggregates.writeAggregates(
+                    aggregates, aggregatesLocation, 
+                    timeBucket=arguments.time_bucket, tiles=arguments.tiles)
+            logging.info(f"Saved {len(aggregates)} zoom levels and "
+                         f"{numTiles} vector tiles")
         
         # Successful run
         logging.info('Data successfully parsed and homogenized')
@@ -283,6 +1033,17 @@ if __name__ == "__main__":
               "'output' folder for data.\n\nExiting script")
 
     except Exception as error:
+        pipelineMetrics.recordError(error)
         logging.exception("Traceback of error:")
         print("Error! Script failed to execute properly. Refer to log for more"
               " details")
+    
+    finally:
+        
+        # Save the run's metrics next to its log, whether it succeeded or not
+        metricsRun = pipelineMetrics.finishRun()
+        if fileLocations is not None:
+            pipelineMetrics.writeMetrics(
+                metricsRun, Path(fileLocations["Log"]).with_name("metrics.json"))
+        if arguments.prometheus:
+            pipelineMetrics.writePrometheus(metricsRun, arguments.prometheus)
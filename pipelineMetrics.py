@@ -0,0 +1,467 @@
+"""
+    Description: Instrumentation shared by pullData.py, homogenizeEvents.py
+    and pollEONET.py. A script starts a run ("startRun"), wraps each pipeline
+    stage in "measureStage" (wall time, CPU time, and peak memory), and every
+    HTTP request sent through "requestScheduler.py" is recorded with its
+    latency, bytes, status code (or error), attempt number, and the rate limit
+    headroom the API reported. Library code can add counters (e.g. features
+    dropped as non-Point) with "incrementCounter".
+
+    Like logging, the run being recorded is module-wide state: while no run is
+    started every function here does nothing, so instrumented functions cost
+    nothing when they are used on their own.
+
+    Input: Calls from the instrumented scripts; see "startRun"
+
+    Output: Run metrics as a JSON file ("writeMetrics") and in Prometheus text
+    format, either as a file for node_exporter's textfile collector
+    ("writePrometheus") or served over HTTP ("serveMetrics")
+"""
+
+## IMPORTS
+from contextlib import contextmanager # For measuring stages in with blocks
+from datetime import datetime, timezone # For timestamping runs
+import json # For writing metrics files
+import os # For atomically replacing metrics files
+from pathlib import Path # For making metrics folders
+import sys # For telling macOS' ru_maxrss unit apart
+import threading # For recording from many threads + serving metrics
+import time # For timing stages and requests
+from urllib.parse import urlparse # For labelling requests by endpoint
+
+try:
+    import resource # For peak memory; not available on Windows
+except ImportError:
+    resource = None
+
+## CONSTANTS
+metricsPrefix = "eonet" # Prefix of every Prometheus metric name
+latencyQuantiles = (0.5, 0.9, 0.99) # Reported per endpoint
+clearRefsFile = "/proc/self/clear_refs" # Linux; resets the peak RSS
+activeRun = None # Run being recorded, see "startRun"
+latestRun = None # Last finished run, served by "serveMetrics"
+requestTotals = {} # Requests of every finished run of this process
+
+## HELPER FUNCTIONS
+
+def addRequestTotals(totals, summary):
+    """
+        Adds a run's request summary to running per-endpoint totals, so
+        Prometheus counters keep counting up across the runs of a long-lived
+        process (e.g. every cycle of pollEONET.py).
+
+        Input: Dict totals of endpoint to its "statuses", "bytes", 
+        "latencySum" and "count" (left unchanged), dict summary from 
+        "summarizeRequests"
+
+        Output: New dict of totals including summary
+    """
+    newTotals = {endpoint: dict(endpointTotals, 
+                                statuses=dict(endpointTotals["statuses"]))
+                 for endpoint, endpointTotals in totals.items()}
+    for endpoint, endpointSummary in summary.items():
+        endpointTotals = newTotals.setdefault(endpoint, {
+            "statuses": {}, "bytes": 0, "latencySum": 0.0, "count": 0})
+        for status, count in endpointSummary["statuses"].items():
+            endpointTotals["statuses"][status] = \
+                endpointTotals["statuses"].get(status, 0) + count
+        for key in ("bytes", "latencySum", "count"):
+            endpointTotals[key] += endpointSummary[key]
+    return newTotals
+
+def finishRun(scheduler=None):
+    """
+        Finishes the active run, adding its duration, (if given) the
+        scheduler's retry/throttle/breaker counters and current state, and
+        the process' request totals up to and including this run.
+
+        Input: Optional scheduler dict from "requestScheduler.createScheduler"
+
+        Output: Finished run dict, or None if no run was active
+    """
+    global activeRun, latestRun, requestTotals
+    run = activeRun
+    if run is None:
+        return None
+    with run["lock"]:
+        run["finishedAt"] = datetime.now(timezone.utc).isoformat()
+        run["durationSeconds"] = time.perf_counter() - run["startTime"]
+        if scheduler is not None:
+            with scheduler["lock"]:
+                run["scheduler"] = dict(
+                    scheduler["stats"], breaker=scheduler["breaker"],
+                    ratePerSecond=scheduler["ratePerSecond"])
+        run["requestTotals"] = addRequestTotals(requestTotals, 
+                                                summarizeRequests(run))
+        requestTotals = run["requestTotals"]
+    activeRun, latestRun = None, run
+    return run
+
+def formatPrometheus(run):
+    """
+        Formats a run's metrics in the Prometheus text exposition format.
+        Stage and request metrics are labelled by stage and endpoint; request
+        latencies are exposed as a summary per endpoint. Request counters (and
+        the summary's sum + count) are totals of every run of the process so
+        far, so they only reset when the process restarts; the quantiles are
+        the run's own.
+
+        Input: Run dict from "startRun"
+
+        Output: String of Prometheus metrics
+    """
+    script = run["script"]
+    lines = []
+    def addMetric(name, metricType, helpText, samples):
+        lines.append(f"# HELP {metricsPrefix}_{name} {helpText}")
+        lines.append(f"# TYPE {metricsPrefix}_{name} {metricType}")
+        for suffix, labels, value in samples:
+            labelText = ",".join(f'{label}="{labelValue}"' for label,
+                                 labelValue in dict(script=script,
+                                                    **labels).items())
+            lines.append(f"{metricsPrefix}_{name}{suffix}{{{labelText}}} "
+                         f"{value}")
+
+    addMetric("run_duration_seconds", "gauge", "Duration of the run.",
+              [("", {}, run.get("durationSeconds",
+                                time.perf_counter() - run["startTime"]))])
+    addMetric("run_failed", "gauge", "1 if the run failed.",
+              [("", {}, int(run["status"] == "failed"))])
+    stages = run["stages"]
+    addMetric("stage_wall_seconds", "gauge", "Wall time of each stage.",
+              [("", {"stage": stage["name"]}, stage["wallSeconds"])
+               for stage in stages])
+    addMetric("stage_cpu_seconds", "gauge", "CPU time of each stage.",
+              [("", {"stage": stage["name"]}, stage["cpuSeconds"])
+               for stage in stages])
+    addMetric("stage_peak_rss_bytes", "gauge", "Peak memory of each stage.",
+              [("", {"stage": stage["name"]}, stage["peakRSSBytes"])
+               for stage in stages if stage["peakRSSBytes"] is not None])
+
+    summary = summarizeRequests(run)
+    totals = run["requestTotals"] if "requestTotals" in run else \
+             addRequestTotals(requestTotals, summary) # Run still active
+    addMetric("requests_total", "counter", "HTTP requests by status code "
+              "(or error).", [("", {"endpoint": endpoint, "status": status},
+                               count)
+                              for endpoint, endpointTotals in totals.items()
+                              for status, count in
+                              endpointTotals["statuses"].items()])
+    addMetric("request_bytes_total", "counter", "Body bytes received.",
+              [("", {"endpoint": endpoint}, endpointTotals["bytes"])
+               for endpoint, endpointTotals in totals.items()])
+    latencySamples = []
+    for endpoint, endpointTotals in totals.items():
+        for quantile, value in summary.get(endpoint, {}).get(
+                "latencyQuantiles", {}).items():
+            latencySamples.append(("", {"endpoint": endpoint,
+                                        "quantile": quantile}, value))
+        latencySamples.append(("_sum", {"endpoint": endpoint},
+                               endpointTotals["latencySum"]))
+        latencySamples.append(("_count", {"endpoint": endpoint},
+                               endpointTotals["count"]))
+    addMetric("request_latency_seconds", "summary", "Latency of HTTP "
+              "requests.", latencySamples)
+    addMetric("rate_limit_remaining", "gauge", "Requests left in the API's "
+              "rate limit window, as last reported.",
+              [("", {"endpoint": endpoint},
+                endpointSummary["rateLimitRemaining"])
+               for endpoint, endpointSummary in summary.items()
+               if endpointSummary["rateLimitRemaining"] is not None])
+
+    for name, value in run.get("scheduler", {}).items():
+        if isinstance(value, (int, float)):
+            metricName = "".join(f"_{character.lower()}"
+                                 if character.isupper() else character
+                                 for character in name) # snake_case
+            addMetric(f"scheduler_{metricName}", "gauge", f"Scheduler "
+                      f"{name}.", [("", {}, value)])
+    addMetric("pipeline_count", "gauge", "Counters recorded by the pipeline.",
+              [("", {"name": name}, value)
+               for name, value in run["counters"].items()])
+    return "\n".join(lines) + "\n"
+
+def incrementCounter(name, amount=1):
+    """
+        Adds amount to a named counter of the active run (does nothing if no
+        run is active).
+
+        Input: String name of the counter, number amount to add
+
+        Output: None
+    """
+    run = activeRun
+    if run is None:
+        return
+    with run["lock"]:
+        run["counters"][name] = run["counters"].get(name, 0) + amount
+
+@contextmanager
+def measureStage(stageName):
+    """
+        Measures the wall time, CPU time, and peak memory (RSS) of the code in
+        the with block as a stage of the active run. On Linux the peak is
+        reset when a stage starts, so it is the stage's own peak; elsewhere it
+        is the process' peak so far. Nested stages are supported; a stage that
+        raises is recorded as failed.
+
+        Input: String stageName
+
+        Output: Context manager
+    """
+    run = activeRun
+    if run is None:
+        yield
+        return
+    stage = {"name": stageName, "wallSeconds": None, "cpuSeconds": None,
+             "peakRSSBytes": None, "failed": False}
+    with run["lock"]:
+        # Resetting the peak would hide the enclosing stages' peaks so far
+        peakSoFar = readPeakRSS()
+        for openStage in run["openStages"]:
+            openStage["peakRSSBytes"] = max(openStage["peakRSSBytes"] or 0,
+                                            peakSoFar or 0)
+        resetPeakRSS()
+        run["openStages"].append(stage)
+    wallStart, cpuStart = time.perf_counter(), time.process_time()
+    try:
+        yield
+    except BaseException:
+        stage["failed"] = True
+        raise
+    finally:
+        stage["wallSeconds"] = time.perf_counter() - wallStart
+        stage["cpuSeconds"] = time.process_time() - cpuStart
+        peakRSS = readPeakRSS()
+        if peakRSS is not None:
+            stage["peakRSSBytes"] = max(stage["peakRSSBytes"] or 0, peakRSS)
+        with run["lock"]:
+            run["openStages"].remove(stage)
+            run["stages"].append(stage)
+
+def parseHeaderInteger(headers, header):
+    """
+        Parses a numeric response header leniently (e.g. "10" or "10.0"), so
+        a malformed value is left out of the metrics instead of failing the
+        request it came with.
+
+        Input: Dict-like headers, string header name
+
+        Output: Integer value, or None if the header is missing or malformed
+    """
+    try:
+        return int(float(headers[header]))
+    except (KeyError, OverflowError, TypeError, ValueError):
+        return None
+
+def readPeakRSS():
+    """
+        Reads the peak resident set size of this process (since the last
+        "resetPeakRSS", where supported).
+
+        Input: None
+
+        Output: Integer bytes, or None where "resource" is not available
+    """
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRSS if sys.platform == "darwin" else maxRSS * 1024 # KB on Linux
+
+def recordError(error):
+    """
+        Marks the active run as failed.
+
+        Input: Exception error that made the run fail
+
+        Output: None
+    """
+    run = activeRun
+    if run is None:
+        return
+    with run["lock"]:
+        run["status"] = "failed"
+        run["error"] = f"{type(error).__name__}: {error}"
+
+def recordRequest(URL, attempt, latency, response=None, error=None,
+                  streamed=False):
+    """
+        Records one HTTP request (attempt) in the active run.
+
+        Input: String URL requested, integer attempt number (1 for the first
+        try), float latency in seconds, requests Response (None if the
+        request failed with error), optional Exception error, boolean streamed
+        if the body was not downloaded yet (its Content-Length is used)
+
+        Output: None
+    """
+    run = activeRun
+    if run is None:
+        return
+    request = {"endpoint": urlparse(URL).path, "attempt": attempt,
+               "latencySeconds": latency, "status": None, "bytes": None,
+               "rateLimitRemaining": None, "rateLimitLimit": None,
+               "error": None if error is None else type(error).__name__}
+    if response is not None:
+        request["status"] = response.status_code
+        if not streamed:
+            request["bytes"] = len(response.content)
+        else:
+            request["bytes"] = parseHeaderInteger(response.headers,
+                                                  "Content-Length")
+        for header, key in (("X-RateLimit-Remaining", "rateLimitRemaining"),
+                            ("X-RateLimit-Limit", "rateLimitLimit")):
+            request[key] = parseHeaderInteger(response.headers, header)
+    with run["lock"]:
+        run["requests"].append(request)
+
+def resetPeakRSS():
+    """
+        Resets the peak resident set size of this process, where the OS
+        allows it (Linux); elsewhere does nothing.
+
+        Input: None
+
+        Output: None
+    """
+    try:
+        with open(clearRefsFile, "w") as refsFile:
+            refsFile.write("5")
+    except OSError:
+        pass
+
+def serveMetrics(port, host="127.0.0.1"):
+    """
+        Serves the last finished run (or the active one before any finished)
+        in Prometheus text format at "/metrics", from a background thread.
+
+        Input: Integer port, string host to listen on
+
+        Output: ThreadingHTTPServer serving the metrics
+    """
+    # Imported lazily, so scripts that only record metrics start faster
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            run = latestRun or activeRun
+            if self.path != "/metrics" or run is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with run["lock"]:
+                body = formatPrometheus(run).encode()
+            self.send_response(200)
+            self.send_header("Content-Type",
+                             "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def startRun(script, runId):
+    """
+        Starts recording a run; replaces any run still active.
+
+        Input: String script name (e.g. "pullData"), string runId
+
+        Output: Run dict being recorded
+    """
+    global activeRun
+    activeRun = {"lock": threading.RLock(), "script": script, "runId": runId,
+                 "startedAt": datetime.now(timezone.utc).isoformat(),
+                 "startTime": time.perf_counter(), "status": "succeeded",
+                 "stages": [], "openStages": [], "requests": [],
+                 "counters": {}}
+    return activeRun
+
+def summarizeRequests(run):
+    """
+        Summarizes a run's requests per endpoint.
+
+        Input: Run dict from "startRun"
+
+        Output: Dict of endpoint to its count, statuses (status code, or
+        error name, to count), retries, bytes, latency sum + max +
+        quantiles, and last reported rate limit headroom
+    """
+    summary = {}
+    for request in run["requests"]:
+        endpointSummary = summary.setdefault(request["endpoint"], {
+            "count": 0, "statuses": {}, "retries": 0, "bytes": 0,
+            "latencies": [], "rateLimitRemaining": None,
+            "rateLimitLimit": None})
+        status = str(request["status"] or request["error"])
+        endpointSummary["count"] += 1
+        endpointSummary["statuses"][status] = \
+            endpointSummary["statuses"].get(status, 0) + 1
+        endpointSummary["retries"] += request["attempt"] > 1
+        endpointSummary["bytes"] += request["bytes"] or 0
+        endpointSummary["latencies"].append(request["latencySeconds"])
+        if request["rateLimitRemaining"] is not None:
+            endpointSummary["rateLimitRemaining"] = \
+                request["rateLimitRemaining"]
+            endpointSummary["rateLimitLimit"] = request["rateLimitLimit"]
+
+    for endpointSummary in summary.values():
+        latencies = sorted(endpointSummary.pop("latencies"))
+        endpointSummary["latencySum"] = sum(latencies)
+        endpointSummary["latencyMax"] = latencies[-1]
+        endpointSummary["latencyQuantiles"] = {
+            str(quantile): latencies[min(len(latencies) - 1,
+                                         int(quantile * len(latencies)))]
+            for quantile in latencyQuantiles}
+    return summary
+
+def writeFileAtomically(fileLocation, text):
+    """
+        Writes text to fileLocation through a temporary file, so readers (e.g.
+        a Prometheus textfile collector) never see a half-written file.
+
+        Input: Path-like fileLocation, string text
+
+        Output: None
+    """
+    Path(fileLocation).parent.mkdir(parents=True, exist_ok=True)
+    tempFile = f"{fileLocation}.tmp"
+    with open(tempFile, "w") as outFile:
+        outFile.write(text)
+    os.replace(tempFile, fileLocation)
+
+def writeMetrics(run, fileLocation):
+    """
+        Writes a run's metrics to fileLocation as JSON: run info, every stage,
+        every request plus a per-endpoint summary, counters, and scheduler
+        state.
+
+        Input: Run dict from "startRun", path-like fileLocation
+
+        Output: None
+    """
+    with run["lock"]:
+        metrics = {key: value for key, value in run.items()
+                   if key not in ("lock", "startTime", "openStages",
+                                  "requests", "requestTotals")}
+        metrics["requestSummary"] = summarizeRequests(run)
+        metrics["requests"] = list(run["requests"])
+    writeFileAtomically(fileLocation, json.dumps(metrics, indent=4))
+
+def writePrometheus(run, fileLocation):
+    """
+        Writes a run's metrics in Prometheus text format to fileLocation, e.g.
+        a "*.prom" file in node_exporter's textfile collector folder.
+
+        Input: Run dict from "startRun", path-like fileLocation
+
+        Output: None
+    """
+    with run["lock"]:
+        text = formatPrometheus(run)
+    writeFileAtomically(fileLocation, text)
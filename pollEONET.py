@@ -0,0 +1,286 @@
+"""
+    Description: Long-running polling daemon that keeps an up-to-date copy of
+    the homogenized EONET events. Every cycle the Events are fetched, parsed,
+    homogenized and made readable (see "./homogenize/homogenizeEvents.py") in
+    this one process, passing data between stages in memory; nothing is
+    written to disk until the final output. geopandas is imported by the
+    first cycle with something to homogenize and stays loaded for later
+    cycles.
+
+    Categories and Sources rarely change, so they are kept in a TTL cache and
+    only requested again (conditionally, so an unchanged resource costs an
+    empty 304) once their time to live has passed. Events are requested
+    conditionally every cycle too; if they did not change, the cycle stops
+    there.
+
+    Requests go through pullData.py's shared rate-limit-aware scheduler. With
+    "--snapshots" the raw data of every cycle that changed is also saved to the
+    snapshot store (see "snapshotStore.py"), which only keeps what changed.
+
+    Input: Optional script arguments (see "parseArguments"), e.g.
+    "py pollEONET.py --interval 300 --metadata-ttl 86400"
+
+    Every cycle is measured (see "pipelineMetrics.py"): wall time, CPU time
+    and peak memory of each stage plus latency, bytes, status code and rate
+    limit headroom of each request. The last cycle's metrics are kept in
+    "metrics.json" next to the output and, with "--metrics-port", served in 
+    Prometheus text format at "/metrics".
+
+    Output: Latest homogenized events plus parsed Categories and Sources in
+    "./output/latest", each file replaced atomically once a cycle changed
+    them. Logs are appended to "./output/latest/log.log"
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+import logging # For logging purposes
+import os # For atomically replacing output files
+from pathlib import Path # For making the output folder
+import pipelineMetrics # For per-cycle metrics + the Prometheus endpoint
+import pullData # For requesting EONET data through the shared scheduler
+import snapshotStore # For optionally keeping the raw data of every cycle
+import sys # For importing homogenizeEvents
+import time # For scheduling cycles and the TTL cache clock
+
+sys.path.append(str(Path(__file__).resolve().parent / "homogenize"))
+import homogenizeEvents # For the in-process homogenize pipeline
+
+## CONSTANTS
+defaultInterval = 300.0 # Seconds between the start of each cycle
+defaultMetadataTTL = 24 * 3600.0 # Seconds Categories + Sources are cached for
+defaultOutputLocation = "./output/latest"
+metadataTypes = ("Categories", "Sources") # Kept in the TTL cache
+
+## HELPER FUNCTIONS
+
+def createMetadataCache(ttl=defaultMetadataTTL, clock=time.monotonic):
+    """
+        Creates the TTL cache Categories and Sources are kept in.
+
+        Input: Positive float ttl in seconds entries stay fresh for, clock
+        function (time.monotonic by default)
+
+        Output: Cache dict; entries hold the data, when it was fetched, its
+        ETag/Last-Modified validators, and whether it changed since it was 
+        last written ("unwritten")
+    """
+    return {"ttl": ttl, "clock": clock, "entries": {}}
+
+def fetchCachedJSON(cache, typeURL, URL, session, tryTimes=3, pauseTime=3):
+    """
+        Returns the JSON of typeURL from the cache while it is fresh. Once the
+        TTL has passed it is requested again conditionally; a 304 just renews
+        the entry. A change stays reported until "markMetadataWritten" is 
+        called, so a cycle that failed to write it is retried next cycle.
+
+        Input: Cache dict from "createMetadataCache", string typeURL (e.g.
+        "Categories"), string URL, requests Session, positive integer
+        tryTimes, positive float pauseTime
+
+        Output: Tuple of (JSON dict, boolean changed since it was last 
+        written)
+    """
+    now = cache["clock"]()
+    entry = cache["entries"].get(typeURL)
+    if entry is not None and now - entry["fetchedAt"] < cache["ttl"]:
+        return entry["data"], entry["unwritten"]
+
+    logging.info(f"Refreshing cached {typeURL} at {URL}")
+    validators = entry["validators"] if entry is not None else None
+    responseData, validators = pullData.requestHTTPJSONConditional(
+        URL, tryTimes, pauseTime, session, validators=validators)
+    changed = responseData is not None
+    if not changed: # 304; cached copy still good
+        responseData = entry["data"]
+        changed = entry["unwritten"]
+    cache["entries"][typeURL] = {"data": responseData, "fetchedAt": now,
+                                 "validators": validators, 
+                                 "unwritten": changed}
+    return responseData, changed
+
+def markMetadataWritten(cache):
+    """
+        Marks every cached entry as written, once a cycle's output made it to
+        disk, so unchanged metadata no longer triggers a rewrite.
+
+        Input: Cache dict from "createMetadataCache"
+
+        Output: None
+    """
+    for entry in cache["entries"].values():
+        entry["unwritten"] = False
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Polls EONET and keeps the "
+                                     "latest homogenized events up to date")
+    parser.add_argument("--interval", type=float, default=defaultInterval,
+                        help="seconds between cycles (default: %(default)s)")
+    parser.add_argument("--metadata-ttl", type=float,
+                        default=defaultMetadataTTL,
+                        help="seconds Categories + Sources are cached for "
+                        "(default: %(default)s)")
+    parser.add_argument("--cycles", type=int,
+                        help="stop after this many cycles (default: run "
+                        "until interrupted)")
+    parser.add_argument("--output", default=defaultOutputLocation,
+                        help="folder the latest data is written to (default:"
+                        " %(default)s)")
+    parser.add_argument("--format", choices=list(homogenizeEvents.eventsFormats),
+                        default="geojson", help="output format of the "
+                        "homogenized events (default: %(default)s)")
+    parser.add_argument("--drop-lines", action="store_true",
+                        help="drop non-Point geometries instead of exploding "
+                        "their new vertices into Points")
+    parser.add_argument("--snapshots", nargs="?", 
+                        const=snapshotStore.defaultStoreLocation,
+                        help="also save the raw data of every changed cycle to"
+                        " this snapshot store (default when given without a "
+                        "location: %(const)s)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve the last cycle's metrics in Prometheus "
+                        "text format on this port at /metrics")
+    parser.add_argument("--rate", type=float,
+                        default=pullData.requestScheduler.defaultRatePerSecond,
+                        help="sustained requests per second (default: "
+                        "%(default)s)")
+    parser.add_argument("--base-url", default=pullData.apiBaseURL,
+                        help="EONET API base URL (default: %(default)s)")
+    return parser.parse_args(arguments)
+
+def pollCycle(state, session, arguments, tryTimes=3, pauseTime=3):
+    """
+        Runs one fetch -> parse -> homogenize -> improve readability cycle in
+        memory, writing the output only if Events or the cached metadata
+        changed.
+
+        Input: Dict state kept between cycles ("cache" from
+        "createMetadataCache" and the Events "validators"), requests Session,
+        argparse Namespace arguments from "parseArguments", positive integer
+        tryTimes and positive float pauseTime of every request
+
+        Output: Integer number of homogenized events written, or None if
+        nothing changed
+    """
+    listURLs = dict(pullData.determineURLs(arguments.base_url))
+
+    # Categories + Sources from the TTL cache, Events conditionally
+    EONETData = {}
+    metadataChanged = False
+    with pipelineMetrics.measureStage("requestEONETData"):
+        for typeURL in metadataTypes:
+            EONETData[typeURL], changed = fetchCachedJSON(
+                state["cache"], typeURL, listURLs[typeURL], session, tryTimes,
+                pauseTime)
+            metadataChanged = metadataChanged or changed
+        events, validators = pullData.requestHTTPJSONConditional(
+            listURLs["Events"], tryTimes, pauseTime, session, 
+            validators=state["validators"])
+    if events is None and not metadataChanged:
+        logging.info("Events not modified; nothing to do")
+        return None
+    EONETData["Events"] = events if events is not None else state["events"]
+
+    # Same stages as homogenizeEvents.py, without touching disk in between
+    with pipelineMetrics.measureStage("parseData"):
+        parsedEONETData = homogenizeEvents.parseData(EONETData)
+    with pipelineMetrics.measureStage("homogenizeData"):
+        homogenizedEvents = homogenizeEvents.homogenizeData(
+            parsedEONETData, not arguments.drop_lines)
+    with pipelineMetrics.measureStage("improveReadability"):
+        homogenizedEvents = homogenizeEvents.improveReadability(
+            homogenizedEvents, parsedEONETData)
+    with pipelineMetrics.measureStage("writeLatestData"):
+        writeLatestData(arguments.output, parsedEONETData, homogenizedEvents,
+                        arguments.format)
+    if arguments.snapshots:
+        runId = pullData.determineFolderName()
+        logging.info(f"Saving raw data as run {runId} in "
+                     f"{arguments.snapshots}")
+        with pipelineMetrics.measureStage("saveSnapshot"):
+            snapshotStore.saveSnapshot(arguments.snapshots, EONETData, runId)
+    
+    # Only remember the Events (and that the metadata was written) once they
+    # made it to disk
+    state["events"], state["validators"] = EONETData["Events"], validators
+    markMetadataWritten(state["cache"])
+
+    return len(homogenizedEvents)
+
+def writeLatestData(outputLocation, parsedEONETData, homogenizedEvents,
+                    eventsFormat):
+    """
+        Writes the homogenized events and parsed Categories + Sources to
+        outputLocation (see "homogenizeEvents.writeEONETData") through
+        temporary files, so readers never see a half-written file.
+
+        Input: String outputLocation folder, dict of dicts parsedEONETData,
+        GeoDataFrame homogenizedEvents, string eventsFormat
+
+        Output: None
+    """
+    extension = homogenizeEvents.eventsFormats[eventsFormat]
+    fileLocations = {
+        "Events": f"{outputLocation}/homogenizedEvents.{extension}",
+        "Categories": f"{outputLocation}/parsedCategories.json",
+        "Sources": f"{outputLocation}/parsedSources.json"}
+    tempLocations = {typeFile: f"{fileLocation}.tmp"
+                     for typeFile, fileLocation in fileLocations.items()}
+    homogenizeEvents.writeEONETData(tempLocations, parsedEONETData,
+                                    homogenizedEvents, eventsFormat)
+    for typeFile, fileLocation in fileLocations.items():
+        os.replace(tempLocations[typeFile], fileLocation)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    pullData.requestScheduler.configureScheduler(pullData.sharedScheduler, 
+                                                 arguments.rate)
+    Path(arguments.output).mkdir(parents=True, exist_ok=True)
+    pullData.setupLogging(f"{arguments.output}/log.log", fileMode="a")
+    logging.info('Polling daemon started')
+    if arguments.metrics_port is not None:
+        pipelineMetrics.serveMetrics(arguments.metrics_port)
+        logging.info(f"Serving metrics at "
+                     f"http://127.0.0.1:{arguments.metrics_port}/metrics")
+    print(f"Polling EONET every {arguments.interval} seconds; latest data in "
+          f"'{arguments.output}'. Press Ctrl+C to stop.")
+
+    state = {"cache": createMetadataCache(arguments.metadata_ttl),
+             "validators": None, "events": None}
+    numCycles = 0
+    try:
+        with pullData.createSession() as session:
+            while arguments.cycles is None or numCycles < arguments.cycles:
+                cycleStart = time.monotonic()
+                pipelineMetrics.startRun("pollEONET",
+                                         pullData.determineFolderName())
+                try:
+                    numEvents = pollCycle(state, session, arguments)
+                    if numEvents is not None:
+                        logging.info(f"Wrote {numEvents} homogenized events")
+                except Exception as error:
+                    # Keep polling; the next cycle may well succeed
+                    pipelineMetrics.recordError(error)
+                    logging.exception("Cycle failed:")
+                metricsRun = pipelineMetrics.finishRun(pullData.sharedScheduler)
+                pipelineMetrics.writeMetrics(metricsRun,
+                                             f"{arguments.output}/metrics.json")
+                numCycles += 1
+                logging.info(f"Cycle {numCycles} took "
+                             f"{time.monotonic() - cycleStart:.2f} seconds")
+
+                # Wait until the next cycle is due
+                if arguments.cycles is None or numCycles < arguments.cycles:
+                    time.sleep(max(0.0, arguments.interval -
+                                   (time.monotonic() - cycleStart)))
+    except KeyboardInterrupt:
+        logging.info('Polling daemon stopped')
+        print("\nStopped polling.")
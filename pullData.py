@@ -3,41 +3,193 @@
     EONET API. Script also requests Categories and Sources' JSON for 
     presentation purposes. Once requested, EONET will attempt to return the info 
     in GeoJSON format if the rate limit has not been reached. The info is then 
-    written to a local folder at the script's location called 
-    "./output/[dateTime]", where dateTime is standardized according to date and 
-    time script was run. The folder's name is standardized according to when the 
-    data was pulled (refer to "determineFileName" function for more details).
+    saved as a run in the content-addressed snapshot store at 
+    "./output/snapshots" (see "snapshotStore.py"): unchanged Categories and 
+    Sources are stored only once, and Events only as per-event changes since 
+    the previous run. Runs are named after the date and time the data was 
+    pulled (refer to "determineFolderName" function for more details); 
+    "py snapshotStore.py checkout [run] [folder]" writes one back out as plain
+    files.
     
     Any errors are written to a log file for post review; logs are stored in 
-    "./output/logs".
+    "./output/logs" as "[run].log". Metrics of every run (wall time, CPU time
+    and peak memory of each stage; latency, bytes, status code and rate limit
+    headroom of each request) are written to "./output/metrics/[run].json" 
+    (see "pipelineMetrics.py"), and with "--prometheus" in Prometheus text 
+    format too.
 
-    Input: None (This could be changed to accept script arguments for defining
-    where to write the file and if the user would like to pass parameters to the 
-    HTTP requests)
+    Every request goes through one shared scheduler (see "requestScheduler.py")
+    that paces requests within the API's rate limit, backs off with jitter on
+    429s and server errors (honoring Retry-After), and stops sending requests
+    for a while if the API keeps failing.
 
-    Output: GeoJSON + JSON files containing EONET info; files located in 
-    "./output" folder. Logs stored in "./output/logs" folder. Files are either
-    "log", "events", "categories", or "sources" (excluding file extension)
+    With "--backfill START END" the script instead pulls the history of events
+    between two dates into a folder of "./output/backfill" named after the 
+    backfill's settings: the range (and optionally categories) is split into 
+    windows fetched concurrently, each window is checkpointed to disk once 
+    fetched so an interrupted backfill resumes where it stopped, and the 
+    windows are merged by event id.
+
+    With "--sync" the script instead keeps a single up-to-date copy of the data
+    in "./output/sync". Conditional requests (ETag/Last-Modified) are sent so
+    unchanged resources cost nothing, and only events changed since the last 
+    sync (the watermark) are requested and merged in by event id.
+
+    Input: Optional script arguments (see "parseArguments"); "--concurrent"
+    requests Events, Categories, and Sources in parallel over one shared
+    connection pool, "--sync" runs an incremental sync, "--stream" writes
+    responses straight to disk as they arrive ("--gzip" to compress them), 
+    "--store" also upserts the events into the SQLite event store (see 
+    "eventStore.py"), "--rate" sets the sustained requests per second, 
+    "--base-url" points the script at another EONET-compatible server (e.g. a
+    local stub for testing)
+
+    Output: Run of the snapshot store containing EONET info, or (with 
+    "--sync"/"--stream") GeoJSON + JSON files in the "./output" folder. Files 
+    are either "log", "events", "categories", or "sources" (excluding file 
+    extension)
 """
 
 ## IMPORTS
-from datetime import datetime # For standardizing filenames
+import argparse # For parsing script arguments
+import codecs # For incrementally checking streamed responses are valid UTF-8
+from concurrent.futures import ThreadPoolExecutor, as_completed # For workers
+from datetime import date, datetime, timedelta, timezone # For dates + windows
+import eventStore # For upserting events into the local SQLite event store
+import gzip # For optionally compressing streamed responses
 import json # For parsing data from the API call
 import logging # For logging purposes
+import os # For atomically replacing synced files
+import pipelineMetrics # For per-stage + per-request metrics of each run
 from pathlib import Path # For making directories and files
 import requests # For sending and receiving API calls to EONET API
+import requestScheduler # For rate limiting, backing off, and retrying requests
 from requests import HTTPError # In case responses are no good
-import time # For waiting between requests
+from requests.adapters import HTTPAdapter # For sizing the connection pool
+import snapshotStore # For saving runs without storing unchanged data twice
 
 ## CONSTANTS
 apiBaseURL = "https://eonet.gsfc.nasa.gov/api/v3"
 EONETEventsURL = f"{apiBaseURL}/events/geojson"
 EONETCategoriesURL = f"{apiBaseURL}/categories"
 EONETSourcesURL = f"{apiBaseURL}/sources"
+defaultMaxWorkers = 3 # One worker per EONET endpoint requested
+syncFileNames = {"Events": "events.geojson", "Categories": "categories.json",
+                 "Sources": "sources.json"}
+syncStateFileName = "state.json" # Watermark + ETag/Last-Modified per endpoint
+streamChunkSize = 64 * 1024 # Bytes written to disk at a time when streaming
+defaultWindowDays = 30 # Days of history per backfill window
+sharedScheduler = requestScheduler.createScheduler() # Paces every request
 
 ## HELPER FUNCTIONS 
 
-def createOutputFiles(outputLocation="."):
+def backfillShard(URL, shardFile, start, end, category, limit, tryTimes, 
+                  pauseTime, session=None):
+    """
+        Requests one backfill shard (see "requestEventsWindow") and 
+        checkpoints it to shardFile.
+        
+        Input: String events URL, path-like shardFile, then the arguments of
+        "requestEventsWindow"
+        
+        Output: Integer number of features in the shard
+    """
+    events = requestEventsWindow(URL, start, end, category, limit, tryTimes, 
+                                 pauseTime, session)
+    writeJSONFileAtomically(shardFile, events)
+    return len(events["features"])
+
+def backfillEONETData(backfillFolder, start, end, 
+                      windowDays = defaultWindowDays, categories = None, 
+                      limit = None, tryTimes = 3, pauseTime = 3, 
+                      maxWorkers = defaultMaxWorkers, baseURL = apiBaseURL):
+    """
+        Pulls every event (open and closed) with activity between start and 
+        end. The range is split into windows of windowDays, and further into
+        one shard per category if categories are given. Shards are fetched
+        concurrently, at most maxWorkers at a time and paced by the shared
+        scheduler, and each is checkpointed to "[backfillFolder]/shards" as 
+        soon as it is fetched; shards already there are not requested again.
+        The shards are then merged by event id (see "mergeEvents").
+        
+        Input: String backfillFolder from "createBackfillFolder", ISO date 
+        strings start and end (inclusive), positive integer windowDays, 
+        optional list of category ids, optional positive integer limit of 
+        events per request, positive integer tryTimes, positive float 
+        pauseTime, positive integer maxWorkers, string baseURL of the API
+        
+        Output: Tuple of (merged GeoJSON FeatureCollection dict, dict of 
+        counts "fetched" and "resumed")
+    """
+    eventsURL = dict(determineURLs(baseURL))["Events"]
+    shardFolder = Path(backfillFolder) / "shards"
+    shardFolder.mkdir(exist_ok=True)
+    shards = [(category, windowStart, windowEnd) 
+              for windowStart, windowEnd in determineWindows(start, end, 
+                                                             windowDays)
+              for category in (categories or [None])]
+    shardFile = lambda category, windowStart, windowEnd: shardFolder / \
+        f"{category or 'all'}_{windowStart}_{windowEnd}.geojson"
+    
+    # Fetch the shards not checkpointed by an earlier run
+    missingShards = [shard for shard in shards 
+                     if not shardFile(*shard).is_file()]
+    numResumed = len(shards) - len(missingShards)
+    logging.info(f"Backfilling {len(shards)} shards; {numResumed} already "
+                 f"checkpointed")
+    failedShards = []
+    with createSession(maxWorkers) as session, \
+         ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {executor.submit(backfillShard, eventsURL, 
+                                   shardFile(category, windowStart, windowEnd),
+                                   windowStart, windowEnd, category, limit, 
+                                   tryTimes, pauseTime, session): 
+                   (category, windowStart, windowEnd)
+                   for category, windowStart, windowEnd in missingShards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                numFeatures = future.result()
+            except Exception:
+                logging.exception(f"Shard {shard} failed:")
+                failedShards.append(shard)
+                continue
+            logging.info(f"Checkpointed shard {shard} with {numFeatures} "
+                         f"features")
+    if failedShards: # Finished shards are kept; a rerun only fetches these
+        raise Exception(f"{len(failedShards)} of {len(missingShards)} shards "
+                        f"failed; run the same backfill again to resume")
+    
+    # Merge oldest to newest, so the newest events come first
+    mergedEvents = None
+    for shard in shards:
+        with open(shardFile(*shard), "r") as inFile:
+            events = json.load(inFile)
+        mergedEvents = events if mergedEvents is None else \
+                       mergeEvents(mergedEvents, events)
+    
+    return mergedEvents, {"fetched": len(missingShards), 
+                          "resumed": numResumed}
+
+def checkJSONChunk(checkState, chunk):
+    """
+        Feeds one chunk of a streamed JSON document to a lightweight incremental
+        check (see "startJSONCheck"). The chunk must decode as UTF-8, and the 
+        first and last significant bytes are remembered; nothing is parsed.
+        
+        Input: Dict checkState from "startJSONCheck", bytes chunk
+        
+        Output: None; a ValueError is raised if the chunk is not valid UTF-8
+    """
+    checkState["decoder"].decode(chunk) # Raises on invalid UTF-8
+    strippedChunk = chunk.strip()
+    if strippedChunk:
+        if checkState["first"] is None:
+            checkState["first"] = strippedChunk[:1]
+        checkState["last"] = strippedChunk[-1:]
+    checkState["size"] += len(chunk)
+
+def createOutputFiles(outputLocation=".", compress=False):
     """
         Attempts to write the GeoJSON, JSON, and log files to 
         "[outputLocation]/output/[folderName]", where [folderName] is determined 
@@ -45,7 +197,8 @@ def createOutputFiles(outputLocation="."):
         created.
             
         Input: Folder location to write output files to. Will use ".", the 
-        current location of the script, by default.
+        current location of the script, by default. Boolean compress adds a
+        ".gz" extension to the GeoJSON + JSON files.
         
         Output: Dict of locations for empty GeoJSON + JSON + log files
     """
@@ -59,9 +212,10 @@ def createOutputFiles(outputLocation="."):
     Path(outputFolder).mkdir(exist_ok=False) # Folder should not already exist
     
     # Figure out file names to use
-    eventsFile = f"{outputFolder}/events.geojson"
-    categoriesFile = f"{outputFolder}/categories.json"
-    sourcesFile = f"{outputFolder}/sources.json"
+    extension = ".gz" if compress else ""
+    eventsFile = f"{outputFolder}/events.geojson{extension}"
+    categoriesFile = f"{outputFolder}/categories.json{extension}"
+    sourcesFile = f"{outputFolder}/sources.json{extension}"
     logFile = f"{outputFolder}/log.log"
     
     # Make files; error raised if already exists
@@ -73,6 +227,79 @@ def createOutputFiles(outputLocation="."):
     # Return locations for files
     return fileLocations
 
+def createBackfillFolder(start, end, categories=None, 
+                         windowDays=defaultWindowDays, limit=None, 
+                         outputLocation="."):
+    """
+        Creates (if needed) the folder a backfill is kept in, 
+        "[outputLocation]/output/backfill/[start]_[end]" plus the categories,
+        if any, the window size ("[windowDays]d") and the limit, if any 
+        ("limit[limit]"). Like "createSyncFolder" the folder is reused, which
+        is what lets an interrupted backfill resume; a backfill with other 
+        settings gets its own folder rather than resuming shards made with 
+        different ones.
+        
+        Input: ISO date strings start and end, optional list of category ids,
+        positive integer windowDays, optional positive integer limit of events
+        per request, folder location to write output files to ("." by 
+        default)
+        
+        Output: String location of the backfill folder
+    """
+    settings = [f"{windowDays}d"] + ([f"limit{limit}"] if limit else [])
+    folderName = "_".join([start, end] + sorted(categories or []) + settings)
+    backfillFolder = f"{outputLocation}/output/backfill/{folderName}"
+    Path(backfillFolder).mkdir(parents=True, exist_ok=True)
+    return backfillFolder
+
+def createLogFile(runId, outputLocation="."):
+    """
+        Determines the log file of a run saved to the snapshot store, 
+        "[outputLocation]/output/logs/[runId].log", creating the logs folder if
+        needed.
+        
+        Input: String runId from "determineFolderName", folder location to 
+        write output files to ("." by default)
+        
+        Output: String location of the (empty) log file
+    """
+    logFolder = f"{outputLocation}/output/logs"
+    Path(logFolder).mkdir(parents=True, exist_ok=True)
+    logFile = f"{logFolder}/{runId}.log"
+    Path(logFile).touch(exist_ok=False) # Run should not already exist
+    return logFile
+
+def createSession(maxConnections=defaultMaxWorkers):
+    """
+        Creates a requests Session whose connection pool keeps up to 
+        maxConnections keep-alive connections per host, so concurrent requests
+        to EONET share TLS connections instead of each opening a new one.
+        
+        Input: Positive integer maxConnections for sizing the connection pool
+        
+        Output: requests Session ready to be shared between threads
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=maxConnections)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def createSyncFolder(outputLocation="."):
+    """
+        Creates (if needed) the folder incremental syncs are kept in, 
+        "[outputLocation]/output/sync". Unlike "createOutputFiles" the folder is
+        reused between runs.
+        
+        Input: Folder location to write output files to. Will use ".", the 
+        current location of the script, by default.
+        
+        Output: String location of the sync folder
+    """
+    syncFolder = f"{outputLocation}/output/sync"
+    Path(syncFolder).mkdir(parents=True, exist_ok=True)
+    return syncFolder
+
 def determineFolderName():
     """
         Determines the folder name to use when writing the EONET and log data to 
@@ -87,35 +314,210 @@ def determineFolderName():
     folderName = currentDateTime.strftime("%d-%m-%Y_T%H-%M-%S")
     return folderName
 
-def setupLogging(logFile):
+def determineWindows(start, end, windowDays=defaultWindowDays):
+    """
+        Splits the date range from start to end (both inclusive) into 
+        consecutive, non-overlapping windows of windowDays days; the last 
+        window may be shorter.
+        
+        Input: ISO date strings start and end, positive integer windowDays
+        
+        Output: List of tuples of ISO date strings (window start, window end)
+    """
+    windowStart = date.fromisoformat(start)
+    lastDay = date.fromisoformat(end)
+    windows = []
+    while windowStart <= lastDay:
+        windowEnd = min(windowStart + timedelta(days=windowDays - 1), lastDay)
+        windows.append((windowStart.isoformat(), windowEnd.isoformat()))
+        windowStart = windowEnd + timedelta(days=1)
+    return windows
+
+def determineURLs(baseURL=apiBaseURL):
+    """
+        Determines the Events, Categories, and Sources URLs to request given
+        the base URL of an EONET-compatible API.
+        
+        Input: String baseURL, EONET's v3 API by default
+        
+        Output: List of tuples of (type of EONET data, URL)
+    """
+    return [("Events", f"{baseURL}/events/geojson"), 
+            ("Categories", f"{baseURL}/categories"), 
+            ("Sources", f"{baseURL}/sources")]
+
+def finishJSONCheck(checkState):
+    """
+        Finishes the incremental check of a streamed JSON document; the 
+        document must be non-empty, start with "{" or "[" and end with the
+        matching "}" or "]", and not stop in the middle of a UTF-8 character.
+        
+        Input: Dict checkState from "startJSONCheck"
+        
+        Output: None; a ValueError is raised if the document looks truncated
+    """
+    checkState["decoder"].decode(b"", final=True) # Raises on a cut character
+    closingBytes = {b"{": b"}", b"[": b"]"}
+    if checkState["first"] not in closingBytes:
+        raise ValueError(f"Streamed response of {checkState['size']} bytes "
+                         f"does not start like a JSON document")
+    if checkState["last"] != closingBytes[checkState["first"]]:
+        raise ValueError(f"Streamed response of {checkState['size']} bytes "
+                         f"looks truncated")
+
+def mergeEvents(previousEvents, changedEvents):
+    """
+        Merges changed EONET events into a previously synced FeatureCollection.
+        An event can span several features (one per geometry date), so features
+        are upserted by (event id, geometry date, geometry type), like 
+        eventStore.py's rows. LineStrings are dated by their first geometry 
+        date, so a track that gained vertices replaces the shorter one. 
+        Previous geometries a delta did not include are kept but get the 
+        event's latest "closed" status. Changed events come first, like EONET
+        orders its most recent events.
+        
+        Input: GeoJSON FeatureCollection dicts previousEvents and changedEvents
+        
+        Output: Merged GeoJSON FeatureCollection dict
+    """
+    def featureKey(feature):
+        properties = feature["properties"]
+        geometryDate = properties.get("date") or \
+                       (properties.get("geometryDates") or [None])[0]
+        geometryType = (feature["geometry"] or {}).get("type")
+        return properties["id"], geometryDate, geometryType
+    
+    changedKeys = {featureKey(feature) for feature in changedEvents["features"]}
+    closedStatus = {feature["properties"]["id"]: feature["properties"]["closed"]
+                    for feature in changedEvents["features"]}
+    keptFeatures = []
+    for feature in previousEvents["features"]:
+        if featureKey(feature) in changedKeys:
+            continue # Replaced by its newer version
+        eventId = feature["properties"]["id"]
+        if eventId in closedStatus:
+            feature["properties"]["closed"] = closedStatus[eventId]
+        keptFeatures.append(feature)
+    
+    mergedEvents = dict(previousEvents)
+    mergedEvents["features"] = changedEvents["features"] + keptFeatures
+    return mergedEvents
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments. All arguments are optional; running the
+        script without any keeps the original sequential behaviour.
+        
+        Input: List of string arguments, sys.argv by default
+        
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Requests the latest EONET "
+                                     "Events, Categories, and Sources")
+    parser.add_argument("--concurrent", action="store_true", 
+                        help="request all endpoints in parallel over one "
+                        "shared connection pool")
+    parser.add_argument("--max-workers", type=int, default=defaultMaxWorkers,
+                        help="cap on concurrent requests (default: "
+                        "%(default)s)")
+    parser.add_argument("--backfill", nargs=2, metavar=("START", "END"),
+                        help="pull the history of events between two ISO "
+                        "dates (inclusive) into './output/backfill', resuming"
+                        " an interrupted backfill of the same range")
+    parser.add_argument("--window-days", type=int, default=defaultWindowDays,
+                        help="days of history per backfill window (default: "
+                        "%(default)s)")
+    parser.add_argument("--categories", nargs="+", metavar="CATEGORY",
+                        help="only backfill these category ids, one shard "
+                        "per category and window")
+    parser.add_argument("--limit", type=int, help="events per backfill "
+                        "request; full responses are split into smaller "
+                        "windows")
+    parser.add_argument("--sync", action="store_true", 
+                        help="incrementally sync './output/sync' instead of "
+                        "writing a new snapshot folder")
+    parser.add_argument("--stream", action="store_true", 
+                        help="write responses to disk as they arrive instead "
+                        "of decoding and re-encoding them")
+    parser.add_argument("--gzip", action="store_true", 
+                        help="gzip streamed responses on the fly (implies "
+                        "--stream)")
+    parser.add_argument("--snapshots", 
+                        default=snapshotStore.defaultStoreLocation,
+                        help="snapshot store runs are saved to (default: "
+                        "%(default)s)")
+    parser.add_argument("--store", nargs="?", 
+                        const=eventStore.defaultStoreLocation, 
+                        help="also upsert events into this SQLite event store"
+                        " (default when given without a location: %(const)s;"
+                        " not available with --stream)")
+    parser.add_argument("--metrics", default="./output/metrics",
+                        help="folder each run's JSON metrics file is written "
+                        "to (default: %(default)s)")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="also write the run's metrics to FILE in "
+                        "Prometheus text format (e.g. for node_exporter's "
+                        "textfile collector)")
+    parser.add_argument("--rate", type=float, 
+                        default=requestScheduler.defaultRatePerSecond,
+                        help="sustained requests per second; lowered "
+                        "automatically when the API's rate limit headers show"
+                        " the quota running low "
+                        "(default: %(default)s)")
+    parser.add_argument("--base-url", default=apiBaseURL, 
+                        help="EONET API base URL (default: %(default)s)")
+    parsedArguments = parser.parse_args(arguments)
+    if parsedArguments.max_workers < 1:
+        parser.error("--max-workers should be at least 1")
+    if parsedArguments.store and (parsedArguments.stream or 
+                                  parsedArguments.gzip):
+        parser.error("--store can not be combined with --stream or --gzip")
+    if parsedArguments.backfill and (parsedArguments.sync or 
+                                     parsedArguments.stream or 
+                                     parsedArguments.gzip):
+        parser.error("--backfill can not be combined with --sync, --stream or"
+                     " --gzip")
+    if parsedArguments.backfill:
+        try:
+            windows = determineWindows(*parsedArguments.backfill)
+        except ValueError:
+            parser.error("--backfill dates should be ISO dates (YYYY-MM-DD)")
+        if not windows or parsedArguments.window_days < 1:
+            parser.error("--backfill START should not be after END, and "
+                         "--window-days should be positive")
+    return parsedArguments
+
+def setupLogging(logFile, fileMode="w"):
     """
         Sets up logging with an initial logging message to indicate logger has
         started.
         
-        Input: Log file location to start logging in
+        Input: Log file location to start logging in, file mode to open it with
+        ("w" by default; "a" keeps previous runs' logs)
         
         Returns: None
     """
     # Create logger
     logFormatting = ("%(asctime)s %(levelname)-8s [%(filename)s:function "
                      "%(funcName)s:%(lineno)d] - %(message)s")
-    logging.basicConfig(filename=logFile, filemode="w", level=logging.DEBUG, 
-                        format=logFormatting)
+    logging.basicConfig(filename=logFile, filemode=fileMode, 
+                        level=logging.DEBUG, format=logFormatting)
 
-def requestEONETData(tryTimes = 3, pauseTime = 3):
+def requestEONETData(tryTimes = 3, pauseTime = 3, baseURL = apiBaseURL):
     """
         Requests EONET data from NASA using NASA's EONET API. Will attempt 3
-        times in total by default to get data, 3 seconds by default between each
-        request. Grabs Events, Categories, and Sources
+        times in total by default to get data, backing off from 3 seconds by 
+        default between each request. Requests are paced by the shared 
+        scheduler. Grabs Events, Categories, and Sources
         
         Input: Positive integer tryTimes for capping number of requests, 
-        positive float pauseTime for # of seconds to wait between each request
+        positive float pauseTime for # of seconds to wait between each request,
+        string baseURL of the API to request from
         
         Output: List of dicts containing EONET data in GeoJSON + JSON format
     """
     # Determine list of tuples of URLs to try
-    listURLs = [("Events", EONETEventsURL), ("Categories", EONETCategoriesURL), 
-                ("Sources", EONETSourcesURL)]
+    listURLs = determineURLs(baseURL)
         
     # Go through URL list and attempt to request JSON data from each
     jsonData = {}
@@ -123,89 +525,511 @@ def requestEONETData(tryTimes = 3, pauseTime = 3):
         logging.info(f"Requesting {typeURL} at {URL}")
         responseData = requestHTTPJSON(URL, tryTimes, pauseTime)
         jsonData[typeURL] = responseData
-        time.sleep(1) # Wait a second between each successful retrieval
+    
+    return jsonData
+
+def requestEONETDataConcurrently(tryTimes = 3, pauseTime = 3, 
+                                 maxWorkers = defaultMaxWorkers, 
+                                 baseURL = apiBaseURL):
+    """
+        Concurrent version of "requestEONETData". Events, Categories, and 
+        Sources are requested in parallel, at most maxWorkers at a time, over a
+        single shared keep-alive connection pool. No pause is taken between 
+        successful retrievals, so a run takes about as long as the slowest
+        response.
+        
+        Input: Positive integer tryTimes for capping number of requests, 
+        positive float pauseTime for # of seconds to wait between each retry,
+        positive integer maxWorkers for capping concurrent requests, string
+        baseURL of the API to request from
+        
+        Output: Dict of dicts containing EONET data in GeoJSON + JSON format
+    """
+    # Determine list of tuples of URLs to try
+    listURLs = determineURLs(baseURL)
+    
+    # Request every URL in parallel, sharing one pool of connections
+    with createSession(maxWorkers) as session, \
+         ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {}
+        for typeURL, URL in listURLs:
+            logging.info(f"Requesting {typeURL} at {URL}")
+            futures[typeURL] = executor.submit(requestHTTPJSON, URL, tryTimes, 
+                                               pauseTime, session)
+        
+        # Keep the same key order as the sequential version
+        jsonData = {typeURL: futures[typeURL].result() 
+                    for typeURL, _ in listURLs}
     
     return jsonData
         
-def requestHTTPJSON(URL, tryTimes, pauseTime):
+def requestEventsWindow(URL, start, end, category, limit, tryTimes, pauseTime,
+                        session=None):
     """
-        Tries to request a resource from URL up to tryTimes; raises an error if 
-        unsuccessful. Waits for pauseTime seconds between each request.
+        Requests every event (open and closed) with activity between start and
+        end, optionally of one category. If limit is given and a response is 
+        full (as many events as the limit), the window may have been cut off,
+        so it is split in half and each half requested instead, down to 
+        single days.
+        
+        Input: String events URL, ISO date strings start and end (inclusive), 
+        optional string category id, optional positive integer limit, 
+        positive integer tryTimes, positive float pauseTime, optional requests
+        Session
+        
+        Output: GeoJSON FeatureCollection dict of the window's events
+    """
+    params = {"start": start, "end": end, "status": "all"}
+    if category is not None:
+        params["category"] = category
+    if limit is not None:
+        params["limit"] = limit
+    events = requestHTTP(URL, tryTimes, pauseTime, session, params).json()
+    
+    numEvents = len({feature["properties"]["id"] 
+                     for feature in events["features"]})
+    if limit is None or numEvents < limit or start == end:
+        if limit is not None and numEvents >= limit:
+            logging.warning(f"{start} ({category or 'all categories'}) has "
+                            f"{limit} or more events; some may be missing")
+        return events
+    
+    # Response is full; split the window and try again
+    windowDays = (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+    (firstStart, firstEnd), (secondStart, secondEnd) = \
+        determineWindows(start, end, (windowDays + 1) // 2)
+    logging.info(f"Window {start} to {end} hit the limit of {limit} events; "
+                 f"splitting it")
+    firstEvents = requestEventsWindow(URL, firstStart, firstEnd, category, 
+                                      limit, tryTimes, pauseTime, session)
+    secondEvents = requestEventsWindow(URL, secondStart, secondEnd, category,
+                                       limit, tryTimes, pauseTime, session)
+    return mergeEvents(firstEvents, secondEvents)
+
+def requestHTTP(URL, tryTimes, pauseTime, session=None, params=None, 
+                headers=None, stream=False, scheduler=None):
+    """
+        Tries to request a resource from URL up to tryTimes through the shared
+        scheduler (see "requestScheduler.sendRequest"); raises an error if 
+        unsuccessful. Retries back off exponentially from pauseTime seconds, 
+        with jitter, or wait as long as Retry-After asks. A 304 (Not Modified)
+        counts as a success for conditional requests.
+        
+        Input: String URL to attempt, integer tryTimes for establishing limit
+        requests on, positive float pauseTime as the base wait between 
+        requests, optional requests Session to reuse connections from, optional
+        dicts of query params and headers to send, boolean stream to defer 
+        downloading the body until it is iterated over, optional scheduler 
+        dict (sharedScheduler by default)
+        
+        Output: requests Response if successful, else an error will be raised
+    """
+    # Reuse the session's connections if given, else make a one-off request
+    httpClient = session if session is not None else requests
+    scheduler = scheduler if scheduler is not None else sharedScheduler
+    
+    response = requestScheduler.sendRequest(scheduler, httpClient, URL, 
+                                            tryTimes, pauseTime, params=params,
+                                            headers=headers, stream=stream)
+    if response.status_code not in (200, 304): # Can't run rest of script
+        logging.error(f"API call to {URL} not successful; received status "
+                      f"code [{response.status_code}]")
+        response.raise_for_status()
+    return response
+
+def requestHTTPJSON(URL, tryTimes, pauseTime, session=None):
+    """
+        Tries to request a JSON resource from URL up to tryTimes; raises an 
+        error if unsuccessful. Waits for pauseTime seconds between each request.
         
         Input: String URL to attempt, integer tryTimes for establishing limit
         requests on, positive float pauseTime for waiting given seconds between
-        requests
+        requests, optional requests Session to reuse connections from
         
         Output: JSON dict received from URL if successful, else an error will be
         raised
     """
-    # Starting requests
-    success = False
-    triedTimes = 0
-    while not success and triedTimes < tryTimes:
-        response = requests.get(URL)
-        if response.status_code == 200:
-            success = True # Successful response; no more need to try
-        else: # Failed response; try again, up to tryTimes
-            logger.info(f"API call #{triedTimes + 1} out of f{tryTimes} not "
-                        f"successful; received status code "
-                        f"[{response.status_code}]")
-            triedTimes += 1
-            if triedTimes < tryTimes: # Still more times to try
-                time.sleep(pauseTime) # Wait before attempting again
-    if not success: # Tried tryTimes yet still failed; can't run rest of script
-        response.raise_for_status()
+    response = requestHTTP(URL, tryTimes, pauseTime, session)
     return response.json()
+
+def requestHTTPJSONConditional(URL, tryTimes, pauseTime, session=None, 
+                               params=None, validators=None):
+    """
+        Conditional version of "requestHTTPJSON". Previously received ETag and
+        Last-Modified validators are sent back as If-None-Match and 
+        If-Modified-Since, so an unchanged resource comes back as an empty 304.
+        
+        Input: String URL to attempt, integer tryTimes, positive float 
+        pauseTime, optional requests Session, optional dict of query params, 
+        optional dict validators with "ETag" and/or "Last-Modified" keys
+        
+        Output: Tuple of (JSON dict, or None if not modified, dict of validators
+        to send next time)
+    """
+    validators = validators or {}
+    headers = {}
+    if validators.get("ETag"):
+        headers["If-None-Match"] = validators["ETag"]
+    if validators.get("Last-Modified"):
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    
+    response = requestHTTP(URL, tryTimes, pauseTime, session, params, headers)
+    if response.status_code == 304:
+        return None, validators
+    
+    newValidators = {header: response.headers[header] 
+                     for header in ("ETag", "Last-Modified") 
+                     if header in response.headers}
+    return response.json(), newValidators
            
-def writeEONETData(fileLocations, EONETData):
+def readSyncState(syncFolder):
+    """
+        Reads the sync state (watermark + per-endpoint validators) kept in 
+        syncFolder. A missing state file means nothing was synced yet.
+        
+        Input: String location of the sync folder
+        
+        Output: Dict with "watermark" (date string or None) and "validators" 
+        (dict of type of EONET data to its ETag/Last-Modified dict)
+    """
+    stateFile = Path(syncFolder) / syncStateFileName
+    if not stateFile.is_file():
+        return {"watermark": None, "validators": {}}
+    with open(stateFile, "r") as inFile:
+        return json.load(inFile)
+
+def startJSONCheck():
+    """
+        Starts a lightweight incremental check of a JSON document that is 
+        streamed chunk by chunk, so a response can be validated without ever
+        holding or decoding the whole document. Used with "checkJSONChunk" and
+        "finishJSONCheck".
+        
+        Input: None
+        
+        Output: Dict holding the state of the check
     """
-        Attempts to write the data stored in EONETData into their respective
-        empty files, the locations of which are specified in fileLocations
+    return {"decoder": codecs.getincrementaldecoder("utf-8")(), "first": None,
+            "last": None, "size": 0}
+
+def streamEONETData(fileLocations, tryTimes = 3, pauseTime = 3, 
+                    compress = False, maxWorkers = 1, baseURL = apiBaseURL):
+    """
+        Streaming version of "requestEONETData" writing plain files. Each 
+        response body is written to its file chunk by chunk as it arrives, 
+        optionally gzipped, so memory use stays flat however large the events
+        feed is. Up to maxWorkers endpoints are streamed at a time over one
+        shared connection pool.
         
         Input: Dict with type of EONET data and their respective file location
-        called fileLocations, and a dict of each type of EONET data with the 
-        associated data for each called EONETData
+        called fileLocations, positive integer tryTimes, positive float 
+        pauseTime, boolean compress to gzip files, positive integer maxWorkers
+        for capping concurrent requests, string baseURL of the API
         
-        Output: None as the data should be successfully written to each datum's
-        respective file
+        Output: Dict of type of EONET data to number of bytes received
+    """
+    listURLs = determineURLs(baseURL)
+    with createSession(maxWorkers) as session, \
+         ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {}
+        for typeURL, URL in listURLs:
+            logging.info(f"Streaming {typeURL} at {URL} to "
+                         f"{fileLocations[typeURL]}")
+            futures[typeURL] = executor.submit(streamHTTPJSON, URL, 
+                                               fileLocations[typeURL], 
+                                               tryTimes, pauseTime, session,
+                                               compress)
+        receivedBytes = {typeURL: futures[typeURL].result() 
+                         for typeURL, _ in listURLs}
+    
+    return receivedBytes
+
+def streamHTTPJSON(URL, fileLocation, tryTimes, pauseTime, session=None, 
+                   compress=False):
     """
-    # Write EONET data to each associated file
-    for typeData in EONETData:
+        Requests a JSON resource from URL (see "requestHTTP") and streams the
+        body to fileLocation in chunks as it arrives, without decoding it. The
+        body goes to a temporary file first and only replaces fileLocation once
+        the lightweight incremental JSON check passed.
         
-        # Serialize data to JSON
-        jsonData = json.dumps(EONETData[typeData], indent=4)
+        Input: String URL to attempt, string fileLocation to write to, integer
+        tryTimes, positive float pauseTime, optional requests Session, boolean
+        compress to gzip the file on the fly
         
-        with open(fileLocations[typeData], "w") as outFile:
-            outFile.write(jsonData)
-           
+        Output: Integer number of (decoded) bytes received
+    """
+    response = requestHTTP(URL, tryTimes, pauseTime, session, stream=True)
+    checkState = startJSONCheck()
+    tempFile = f"{fileLocation}.tmp"
+    openFile = gzip.open if compress else open
+    try:
+        with response, openFile(tempFile, "wb") as outFile:
+            for chunk in response.iter_content(chunk_size=streamChunkSize):
+                checkJSONChunk(checkState, chunk)
+                outFile.write(chunk)
+        finishJSONCheck(checkState)
+    except Exception:
+        Path(tempFile).unlink(missing_ok=True)
+        raise
+    os.replace(tempFile, fileLocation)
+    pipelineMetrics.incrementCounter("streamedBytes", checkState["size"])
+    
+    return checkState["size"]
+
+def syncEONETData(syncFolder, tryTimes = 3, pauseTime = 3, 
+                  baseURL = apiBaseURL):
+    """
+        Incrementally syncs the EONET data kept in syncFolder. Categories and
+        Sources are requested conditionally and only rewritten if changed. 
+        Events are requested conditionally too and, once a watermark exists, 
+        limited to events with activity since the watermark ("start"/"end", 
+        "status=all" so closed events get updated) before being merged into
+        the previously synced events by event id. These delta queries change
+        with the watermark, so they are sent without the full pull's 
+        validators, and an empty delta leaves the events untouched.
+        
+        Input: String location of the sync folder, positive integer tryTimes,
+        positive float pauseTime, string baseURL of the API to request from
+        
+        Output: List of the types of EONET data that changed
+    """
+    state = readSyncState(syncFolder)
+    newWatermark = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    eventsFile = Path(syncFolder) / syncFileNames["Events"]
+    
+    changedTypes = []
+    with createSession() as session:
+        for typeURL, URL in determineURLs(baseURL):
+            params = None
+            isDelta = (typeURL == "Events" and state["watermark"] is not None
+                       and eventsFile.is_file())
+            if isDelta:
+                params = {"start": state["watermark"], "end": newWatermark,
+                          "status": "all"}
+            
+            logging.info(f"Syncing {typeURL} at {URL} with params {params}")
+            if isDelta: # Validators only hold for the full pull's query
+                responseData, _ = requestHTTPJSONConditional(
+                    URL, tryTimes, pauseTime, session, params)
+            else:
+                responseData, validators = requestHTTPJSONConditional(
+                    URL, tryTimes, pauseTime, session, params, 
+                    state["validators"].get(typeURL))
+                state["validators"][typeURL] = validators
+            if responseData is None: # 304; already up to date
+                logging.info(f"{typeURL} not modified")
+                continue
+            if isDelta and not responseData['features']:
+                logging.info("No events changed since the watermark")
+                continue
+            
+            if isDelta:
+                logging.info(f"Merging {len(responseData['features'])} changed"
+                             f" event features")
+                with open(eventsFile, "r") as inFile:
+                    responseData = mergeEvents(json.load(inFile), responseData)
+            writeJSONFileAtomically(Path(syncFolder) / syncFileNames[typeURL],
+                                    responseData)
+            changedTypes.append(typeURL)
+    
+    # Only move the watermark once everything was written successfully
+    state["watermark"] = newWatermark
+    writeJSONFileAtomically(Path(syncFolder) / syncStateFileName, state)
+    return changedTypes
+
+def writeJSONFileAtomically(fileLocation, data):
+    """
+        Serializes data to JSON and writes it to fileLocation through a 
+        temporary file, so a reader never sees a half-written file.
+        
+        Input: Path-like fileLocation to write to, JSON serializable data
+        
+        Output: None
+    """
+    tempFile = f"{fileLocation}.tmp"
+    with open(tempFile, "w") as outFile:
+        outFile.write(json.dumps(data, indent=4))
+    os.replace(tempFile, fileLocation)
+
+def storeEONETEvents(storeLocation, events):
+    """
+        Upserts EONET events into the SQLite event store at storeLocation (see
+        "eventStore.py"), creating the store if needed.
+        
+        Input: String storeLocation of the database, GeoJSON FeatureCollection
+        dict events
+        
+        Output: Integer number of features upserted
+    """
+    connection = eventStore.openEventStore(storeLocation)
+    try:
+        return eventStore.upsertEvents(connection, events)
+    finally:
+        connection.close()
+
 ## MAIN
 if __name__ == "__main__":
 
+    arguments = parseArguments()
+    requestScheduler.configureScheduler(sharedScheduler, arguments.rate)
+    runId = determineFolderName()
+    pipelineMetrics.startRun("pullData", runId)
+
     try:
         
-        # Set up output files to check if outputs can be written without issue
-        fileLocations = createOutputFiles()
+        if arguments.backfill:
+            
+            # Reuse the backfill folder (and its checkpoints) if it exists
+            start, end = arguments.backfill
+            backfillFolder = createBackfillFolder(
+                start, end, arguments.categories, arguments.window_days, 
+                arguments.limit)
+            setupLogging(f"{backfillFolder}/log.log", fileMode="a")
+            logging.info('Main logger initialized')
+            
+            # Fetch missing shards and merge every shard
+            logging.info(f'Backfilling EONET events from {start} to {end}')
+            print(f"\nBackfilling EONET events from {start} to {end}...")
+            with pipelineMetrics.measureStage("backfillEONETData"):
+                events, counts = backfillEONETData(
+                    backfillFolder, start, end, arguments.window_days, 
+                    arguments.categories, arguments.limit, 
+                    maxWorkers=arguments.max_workers, 
+                    baseURL=arguments.base_url)
+            
+            # Categories + Sources to go with them, for homogenizeEvents.py
+            EONETData = {"Events": events}
+            with pipelineMetrics.measureStage("requestMetadata"):
+                for typeURL, URL in determineURLs(arguments.base_url)[1:]:
+                    logging.info(f"Requesting {typeURL} at {URL}")
+                    EONETData[typeURL] = requestHTTPJSON(URL, 3, 3)
+            with pipelineMetrics.measureStage("writeBackfillFiles"):
+                for typeURL, fileName in syncFileNames.items():
+                    writeJSONFileAtomically(Path(backfillFolder) / fileName, 
+                                            EONETData[typeURL])
+            
+            # Attempt to upsert events into the event store
+            if arguments.store:
+                logging.info(f'Upserting events into {arguments.store}')
+                with pipelineMetrics.measureStage("storeEONETEvents"):
+                    numUpserted = storeEONETEvents(arguments.store, events)
+                logging.info(f'Upserted {numUpserted} event features')
+            
+            # Successful run
+            logging.info(f"Backfill done; {counts['fetched']} shards fetched,"
+                         f" {counts['resumed']} resumed, "
+                         f"{len(events['features'])} features merged")
+            print(f"Backfilled {len(events['features'])} event features "
+                  f"({counts['fetched']} shards fetched, {counts['resumed']} "
+                  f"resumed); refer to '{backfillFolder}' for data.\n\n"
+                  f"Exiting script")
         
-        # Initialize logging
-        setupLogging(fileLocations["Log"])
-        logging.info('Main logger initialized')
+        elif arguments.sync:
+            
+            # Reuse the sync folder and keep appending to its log
+            syncFolder = createSyncFolder()
+            setupLogging(f"{syncFolder}/log.log", fileMode="a")
+            logging.info('Main logger initialized')
+            
+            # Request only what changed since the last sync
+            logging.info('Syncing EONET data')
+            print("\nSyncing EONET data...")
+            with pipelineMetrics.measureStage("syncEONETData"):
+                changedTypes = syncEONETData(syncFolder, 
+                                             baseURL=arguments.base_url)
+            
+            # Bring the event store up to date with the synced events
+            if arguments.store and "Events" in changedTypes:
+                logging.info(f'Upserting events into {arguments.store}')
+                with pipelineMetrics.measureStage("storeEONETEvents"), \
+                     open(f"{syncFolder}/{syncFileNames['Events']}") as inFile:
+                    numUpserted = storeEONETEvents(arguments.store, 
+                                                   json.load(inFile))
+                logging.info(f'Upserted {numUpserted} event features')
+            
+            # Successful run
+            logging.info(f'Data successfully synced; changed: {changedTypes}')
+            print(f"EONET data was successfully synced (changed: "
+                  f"{', '.join(changedTypes) or 'nothing'}); refer to "
+                  f"'output/sync' folder for data.\n\nExiting script")
         
-        # Request EONET data
-        logging.info('Requesting EONET data')
-        print("\nRequesting EONET data...")
-        EONETData = requestEONETData()
-        print("Data grabbed!")
+        elif arguments.stream or arguments.gzip:
+            
+            # Set up output files to check if outputs can be written without 
+            # issue
+            fileLocations = createOutputFiles(compress=arguments.gzip)
+            
+            # Initialize logging
+            setupLogging(fileLocations["Log"])
+            logging.info('Main logger initialized')
+            
+            # Stream EONET data straight to the output files
+            logging.info('Streaming EONET data to respective files')
+            print("\nStreaming EONET data...")
+            maxWorkers = arguments.max_workers if arguments.concurrent else 1
+            with pipelineMetrics.measureStage("streamEONETData"):
+                receivedBytes = streamEONETData(fileLocations, 
+                                                compress=arguments.gzip,
+                                                maxWorkers=maxWorkers,
+                                                baseURL=arguments.base_url)
+            
+            # Successful run
+            logging.info(f'Data successfully streamed; bytes: {receivedBytes}')
+            print("EONET data was successfully saved; refer to 'output' folder"
+                  " for data.\n\nExiting script")
         
-        # Attempt to write GeoJSON + JSON data
-        logging.info('Writing EONET data to respective files')
-        writeEONETData(fileLocations, EONETData)
+        else:
         
-        # Successful run
-        logging.info('Data successfully grabbed')
-        print("EONET data was successfully saved; refer to 'output' folder for"
-              " data.\n\nExiting script")
+            # Initialize logging
+            setupLogging(createLogFile(runId))
+            logging.info('Main logger initialized')
+            
+            # Request EONET data
+            logging.info('Requesting EONET data')
+            print("\nRequesting EONET data...")
+            with pipelineMetrics.measureStage("requestEONETData"):
+                if arguments.concurrent:
+                    EONETData = requestEONETDataConcurrently(
+                        maxWorkers=arguments.max_workers, 
+                        baseURL=arguments.base_url)
+                else:
+                    EONETData = requestEONETData(baseURL=arguments.base_url)
+            print("Data grabbed!")
+            
+            # Attempt to save the run to the snapshot store
+            logging.info(f'Saving EONET data as run {runId} in '
+                         f'{arguments.snapshots}')
+            with pipelineMetrics.measureStage("saveSnapshot"):
+                manifest = snapshotStore.saveSnapshot(arguments.snapshots, 
+                                                      EONETData, runId)
+            logging.info(f"Saved run {runId}; {manifest['changedEvents']} "
+                         f"changed and {manifest['removedEvents']} removed "
+                         f"events")
+            
+            # Attempt to upsert events into the event store
+            if arguments.store:
+                logging.info(f'Upserting events into {arguments.store}')
+                with pipelineMetrics.measureStage("storeEONETEvents"):
+                    numUpserted = storeEONETEvents(arguments.store, 
+                                                   EONETData["Events"])
+                logging.info(f'Upserted {numUpserted} event features')
+            
+            # Successful run
+            logging.info('Data successfully grabbed')
+            print(f"EONET data was successfully saved as run {runId}; refer to"
+                  f" '{arguments.snapshots}' for data.\n\nExiting script")
 
     except Exception as error:
+        pipelineMetrics.recordError(error)
         logging.exception("Traceback of error:")
         print("Error! Script failed to execute properly. Refer to log for more"
               " details")
+    
+    finally:
+        
+        # Save the run's metrics, whether it succeeded or not
+        metricsRun = pipelineMetrics.finishRun(sharedScheduler)
+        pipelineMetrics.writeMetrics(metricsRun, 
+                                     f"{arguments.metrics}/{runId}.json")
+        if arguments.prometheus:
+            pipelineMetrics.writePrometheus(metricsRun, arguments.prometheus)
@@ -0,0 +1,366 @@
+"""
+    Description: Shared, thread-safe scheduler that every EONET request goes
+    through. It paces requests with a token bucket that adapts to the
+    api.nasa.gov "X-RateLimit-Limit"/"X-RateLimit-Remaining" headers, retries
+    failed requests with exponential backoff + full jitter, honors
+    "Retry-After" (pausing every thread, not just the one that got the 429;
+    a wait longer than maxDelay fails right away instead), and trips a
+    circuit breaker after repeated server errors so a struggling API is not
+    hammered further. Every attempt is recorded in the active metrics run, if
+    any (see "pipelineMetrics.py").
+
+    The scheduler is a plain dict of state (see "createScheduler") guarded by
+    its own lock, so one scheduler can be shared by every thread of a run.
+
+    Input: Scheduler settings (see "createScheduler") and requests to send
+    through "sendRequest"
+
+    Output: requests Response objects; see "sendRequest"
+"""
+
+## IMPORTS
+from email.utils import parsedate_to_datetime # For HTTP-date Retry-After values
+import logging # For logging retries, pauses and breaker trips
+import pipelineMetrics # For recording every request's latency, bytes + status
+import random # For jittering backoff delays
+import requests # For sending requests and catching connection errors
+import threading # For sharing one scheduler between threads
+import time # For the token bucket clock and waiting
+
+## CONSTANTS
+defaultRatePerSecond = 1.0 # Sustained requests/second before headers are seen
+defaultCapacity = 3 # Burst size; enough for Events, Categories, and Sources
+defaultMaxDelay = 60.0 # Cap in seconds on a single backoff/Retry-After wait
+defaultFailureThreshold = 5 # Consecutive server errors that open the breaker
+defaultCooldown = 30.0 # Seconds the breaker stays open before a trial request
+trialPollInterval = 0.05 # Seconds between checks while a trial is in flight
+rateLimitWindow = 3600.0 # Seconds X-RateLimit-Limit applies to (api.nasa.gov)
+retryStatusCodes = {408, 429, 500, 502, 503, 504} # Worth trying again
+breakerStatusCodes = {500, 502, 503, 504} # Count towards opening the breaker
+
+## HELPER FUNCTIONS
+
+class CircuitOpenError(RuntimeError):
+    """
+        Raised instead of sending a request while the circuit breaker is open.
+    """
+
+class RetryAfterTooLongError(RuntimeError):
+    """
+        Raised instead of retrying when the server's Retry-After asks for a
+        longer wait than the scheduler's maxDelay.
+    """
+
+def acquireToken(scheduler):
+    """
+        Blocks until the scheduler allows another request: any shared pause
+        (Retry-After or an exhausted quota) is over and the token bucket has a
+        token, which is then taken. Raises CircuitOpenError right away if the
+        circuit breaker is open; once its cooldown passed, a single trial
+        request is let through ("halfOpen") while every other request waits 
+        for its outcome: they go ahead if it succeeded and get 
+        CircuitOpenError if it reopened the breaker.
+
+        Input: Scheduler dict from "createScheduler"
+
+        Output: None once a token was taken
+    """
+    while True:
+        with scheduler["lock"]:
+            now = scheduler["clock"]()
+
+            # Circuit breaker
+            if scheduler["breaker"] == "open":
+                if now < scheduler["breakerOpenUntil"]:
+                    raise CircuitOpenError(
+                        f"Circuit breaker open for another "
+                        f"{scheduler['breakerOpenUntil'] - now:.1f} seconds")
+                scheduler["breaker"] = "halfOpen"
+                scheduler["trialInFlight"] = False
+
+            # Refill the token bucket, then take a token if there is one
+            refillTokens(scheduler, now)
+            waitTime = scheduler["pausedUntil"] - now
+            if scheduler["breaker"] == "halfOpen" and \
+               scheduler["trialInFlight"]:
+                waitTime = trialPollInterval
+            elif waitTime <= 0:
+                if scheduler["tokens"] >= 1:
+                    scheduler["tokens"] -= 1
+                    scheduler["stats"]["requests"] += 1
+                    if scheduler["breaker"] == "halfOpen":
+                        scheduler["trialInFlight"] = True
+                    return
+                waitTime = (1 - scheduler["tokens"]) / \
+                           scheduler["ratePerSecond"]
+        scheduler["sleep"](waitTime)
+
+def backoffDelay(scheduler, attempt, baseDelay):
+    """
+        Exponential backoff with full jitter: a random delay between 0 and
+        baseDelay * 2^attempt, capped at the scheduler's maxDelay.
+
+        Input: Scheduler dict from "createScheduler", non-negative integer
+        attempt (0 for the first retry), positive float baseDelay in seconds
+
+        Output: Float seconds to wait
+    """
+    return random.uniform(0, min(scheduler["maxDelay"],
+                                 baseDelay * 2 ** attempt))
+
+def countStat(scheduler, name):
+    """
+        Increments one of the scheduler's counters in "stats".
+
+        Input: Scheduler dict from "createScheduler", string name of the stat
+
+        Output: None
+    """
+    with scheduler["lock"]:
+        scheduler["stats"][name] += 1
+
+def configureScheduler(scheduler, ratePerSecond):
+    """
+        Changes the sustained rate of a scheduler that may already be shared
+        between threads, under its lock.
+
+        Input: Scheduler dict from "createScheduler", positive float 
+        ratePerSecond of sustained requests
+
+        Output: None
+    """
+    with scheduler["lock"]:
+        scheduler["baseRatePerSecond"] = ratePerSecond
+        scheduler["ratePerSecond"] = ratePerSecond
+
+def createScheduler(ratePerSecond=defaultRatePerSecond,
+                    capacity=defaultCapacity, maxDelay=defaultMaxDelay,
+                    failureThreshold=defaultFailureThreshold,
+                    cooldown=defaultCooldown, clock=time.monotonic,
+                    sleep=time.sleep):
+    """
+        Creates a scheduler to share between every request of a run.
+
+        Input: Positive float ratePerSecond of sustained requests (lowered
+        automatically while X-RateLimit headers show the quota running low),
+        positive integer capacity of the token bucket (burst size), positive
+        float maxDelay capping any single backoff (a longer Retry-After 
+        raises RetryAfterTooLongError), positive integer failureThreshold of
+        consecutive server errors that open the circuit breaker, positive 
+        float cooldown in seconds before a half-open trial request, clock and
+        sleep functions (time.monotonic and time.sleep by default; 
+        replaceable for testing)
+
+        Output: Scheduler dict
+    """
+    return {"lock": threading.Lock(), "clock": clock, "sleep": sleep,
+            "baseRatePerSecond": ratePerSecond,
+            "ratePerSecond": ratePerSecond, "capacity": capacity,
+            "tokens": float(capacity), "lastRefill": clock(),
+            "pausedUntil": 0.0, "maxDelay": maxDelay,
+            "failureThreshold": failureThreshold, "cooldown": cooldown,
+            "breaker": "closed", "breakerOpenUntil": 0.0,
+            "trialInFlight": False, "consecutiveFailures": 0,
+            "stats": {"requests": 0, "retries": 0, "throttled": 0,
+                      "breakerTrips": 0}}
+
+def parseRetryAfter(value, now=None):
+    """
+        Parses a Retry-After header, given either as delay-seconds or as an
+        HTTP-date.
+
+        Input: String header value (or None), optional POSIX timestamp now
+        (time.time() by default) for HTTP-dates
+
+        Output: Non-negative float seconds to wait, or None if missing/invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retryTime = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retryTime - (time.time() if now is None else now))
+
+def pauseScheduler(scheduler, seconds):
+    """
+        Pauses every request sent through the scheduler for the given seconds,
+        e.g. after a 429 with Retry-After.
+
+        Input: Scheduler dict from "createScheduler", float seconds to pause
+
+        Output: None
+    """
+    with scheduler["lock"]:
+        pausedUntil = scheduler["clock"]() + seconds
+        scheduler["pausedUntil"] = max(scheduler["pausedUntil"], pausedUntil)
+
+def recordOutcome(scheduler, isFailure):
+    """
+        Updates the circuit breaker after a request. Consecutive failures
+        reaching failureThreshold (or a failed half-open trial) open it for
+        cooldown seconds; any success closes it.
+
+        Input: Scheduler dict from "createScheduler", boolean isFailure for a
+        server error or connection failure
+
+        Output: None
+    """
+    with scheduler["lock"]:
+        scheduler["trialInFlight"] = False
+        if not isFailure:
+            scheduler["consecutiveFailures"] = 0
+            scheduler["breaker"] = "closed"
+            return
+        scheduler["consecutiveFailures"] += 1
+        if scheduler["breaker"] == "halfOpen" or \
+           scheduler["consecutiveFailures"] >= scheduler["failureThreshold"]:
+            scheduler["breaker"] = "open"
+            scheduler["breakerOpenUntil"] = scheduler["clock"]() + \
+                                            scheduler["cooldown"]
+            scheduler["stats"]["breakerTrips"] += 1
+            logging.warning(f"Circuit breaker opened for "
+                            f"{scheduler['cooldown']} seconds after "
+                            f"{scheduler['consecutiveFailures']} consecutive "
+                            f"failures")
+
+def refillTokens(scheduler, now):
+    """
+        Adds the tokens earned since the last refill, up to capacity. Caller
+        must hold the scheduler's lock.
+
+        Input: Scheduler dict from "createScheduler", float now from its clock
+
+        Output: None
+    """
+    earned = (now - scheduler["lastRefill"]) * scheduler["ratePerSecond"]
+    scheduler["tokens"] = min(scheduler["capacity"],
+                              scheduler["tokens"] + earned)
+    scheduler["lastRefill"] = now
+
+def sendRequest(scheduler, httpClient, URL, tryTimes, pauseTime, **kwargs):
+    """
+        Sends a GET request through the scheduler, trying up to tryTimes.
+        429s, 408s, 5xx responses and connection errors are retried after the
+        longer of Retry-After and an exponential backoff with jitter based on
+        pauseTime; other responses are returned as they are. A 429 pauses
+        every request sharing the scheduler. A Retry-After longer than the 
+        scheduler's maxDelay is not waited out: RetryAfterTooLongError is 
+        raised right away, rather than retrying early into more 429s.
+
+        Input: Scheduler dict from "createScheduler", requests Session (or the
+        requests module) httpClient, string URL, positive integer tryTimes,
+        positive float pauseTime as the base backoff delay, keyword arguments
+        passed on to httpClient.get
+
+        Output: requests Response of the last attempt; a connection error,
+        CircuitOpenError or RetryAfterTooLongError is raised if no response 
+        could be had
+    """
+    for attempt in range(tryTimes):
+        acquireToken(scheduler)
+        requestStart = time.perf_counter()
+        try:
+            response = httpClient.get(URL, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            pipelineMetrics.recordRequest(URL, attempt + 1,
+                                          time.perf_counter() - requestStart,
+                                          error=error)
+            recordOutcome(scheduler, isFailure=True)
+            if attempt + 1 == tryTimes:
+                raise
+            logging.info(f"API call #{attempt + 1} out of {tryTimes} failed: "
+                         f"{error}")
+            countStat(scheduler, "retries")
+            scheduler["sleep"](backoffDelay(scheduler, attempt, pauseTime))
+            continue
+        except Exception: # Still settle the breaker so waiters move on
+            recordOutcome(scheduler, isFailure=True)
+            raise
+
+        pipelineMetrics.recordRequest(URL, attempt + 1,
+                                      time.perf_counter() - requestStart,
+                                      response,
+                                      streamed=kwargs.get("stream", False))
+        updateFromHeaders(scheduler, response.headers)
+        recordOutcome(scheduler,
+                      response.status_code in breakerStatusCodes)
+        if response.status_code not in retryStatusCodes or \
+           attempt + 1 == tryTimes:
+            return response
+
+        # Retry, waiting at least as long as the server asked
+        waitTime = backoffDelay(scheduler, attempt, pauseTime)
+        retryAfter = parseRetryAfter(response.headers.get("Retry-After"))
+        if retryAfter is not None and retryAfter > scheduler["maxDelay"]:
+            response.close()
+            raise RetryAfterTooLongError(
+                f"API call to {URL} got status code [{response.status_code}] "
+                f"with Retry-After of {retryAfter:.0f} seconds, more than the "
+                f"{scheduler['maxDelay']:.0f} second limit; try again later")
+        if retryAfter is not None:
+            waitTime = max(waitTime, retryAfter)
+        logging.info(f"API call #{attempt + 1} out of {tryTimes} not "
+                     f"successful; received status code "
+                     f"[{response.status_code}], retrying in "
+                     f"{waitTime:.1f} seconds")
+        response.close()
+        countStat(scheduler, "retries")
+        if response.status_code == 429: # The shared pause does the waiting
+            countStat(scheduler, "throttled")
+            pauseScheduler(scheduler, waitTime)
+        else:
+            scheduler["sleep"](waitTime)
+
+def updateFromHeaders(scheduler, headers):
+    """
+        Adapts the token bucket to api.nasa.gov style rate limit headers.
+        "X-RateLimit-Remaining" caps the tokens on hand. While plenty of the
+        quota remains requests go out at the configured rate; once it runs low
+        (no more than a burst left) the rate drops to what the quota refills
+        at, i.e. "X-RateLimit-Limit" per hour (or the remaining quota spread
+        until "X-RateLimit-Reset", if sent). An exhausted quota pauses the 
+        scheduler until the reset or, without one, one request interval.
+
+        Input: Scheduler dict from "createScheduler", dict-like response
+        headers
+
+        Output: None
+    """
+    try:
+        limit = float(headers["X-RateLimit-Limit"])
+        remaining = float(headers["X-RateLimit-Remaining"])
+    except (KeyError, ValueError):
+        return
+    reset = parseRetryAfter(headers.get("X-RateLimit-Reset"))
+    if reset is not None and reset > 1e9: # Epoch time, not seconds
+        reset = max(0.0, reset - time.time())
+
+    with scheduler["lock"]:
+        now = scheduler["clock"]()
+        refillTokens(scheduler, now)
+        scheduler["tokens"] = min(scheduler["tokens"], remaining)
+        if remaining > scheduler["capacity"]:
+            scheduler["ratePerSecond"] = scheduler["baseRatePerSecond"]
+            return
+        if reset:
+            quotaRate = max(remaining, 1) / reset
+        else:
+            quotaRate = limit / rateLimitWindow
+        scheduler["ratePerSecond"] = min(scheduler["baseRatePerSecond"],
+                                         max(quotaRate, 1e-6))
+        if remaining > 0:
+            return
+
+        # Quota used up; hold everything until it resets
+        waitTime = min(reset if reset is not None 
+                       else 1 / scheduler["ratePerSecond"],
+                       scheduler["maxDelay"])
+        scheduler["pausedUntil"] = max(scheduler["pausedUntil"], 
+                                       now + waitTime)
+        logging.warning(f"Rate limit quota used up; pausing requests for "
+                        f"{waitTime:.1f} seconds")
@@ -0,0 +1,509 @@
+"""
+    Description: Lightweight local HTTP service over the latest homogenized
+    events, e.g. the "./output/latest" folder kept up to date by pollEONET.py,
+    so dashboards (such as a Tableau web data connector) can poll for updated
+    data instead of re-reading whole GeoJSON files.
+
+    "/events" answers with a compact GeoJSON FeatureCollection of the events
+    matching the optional "bbox" (minLon,minLat,maxLon,maxLat), "start"
+    (inclusive) and "end" (exclusive) ISO dates, and "category" (ids, comma
+    separated) parameters, found with the spatio-temporal query index (see
+    "./homogenize/eventIndex.py"). Results are paged: "limit" events at a
+    time, and the "next" member holds the cursor for the next page. A cursor
+    belongs to the snapshot it was made on; once a new snapshot lands it gets
+    a 410 and the client starts over. "/categories" and "/sources" serve the
+    parsed Categories and Sources, "/status" the loaded snapshot.
+
+    Every response has an ETag (so polling clients get empty 304s while
+    nothing changed) and is compressed with brotli (if the "brotli" package is
+    installed) or gzip, as the client accepts. Responses are kept in an
+    in-memory LRU cache. The folder is checked for a new snapshot at most
+    every "--check-interval" seconds; when one landed it is loaded and the
+    cache is cleared.
+
+    Input: Optional script arguments (see "parseArguments"), e.g.
+    "py serveEvents.py --data ./output/latest --port 8080", then
+    "http://127.0.0.1:8080/events?bbox=-125,32,-114,42&category=wildfires"
+
+    Output: HTTP service running until interrupted
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+import base64 # For opaque pagination cursors
+from collections import OrderedDict # For the LRU response cache
+import gzip # For compressing responses
+import hashlib # For ETags
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # Server
+import json # For reading the homogenized data and writing responses
+import logging # For logging reloads
+import numpy as np # For combining query results
+from pathlib import Path # For locating the data
+import sys # For importing eventIndex + homogenizeEvents
+import threading # For guarding the snapshot + cache between server threads
+import time # For throttling snapshot checks
+from urllib.parse import parse_qs, urlparse # For reading request paths
+
+sys.path.append(str(Path(__file__).resolve().parent / "homogenize"))
+import eventIndex # For bbox/date/category queries
+import homogenizeEvents # For the output file names + columnar formats
+
+try:
+    import brotli # For brotli compression, when installed
+except ImportError:
+    brotli = None
+
+## CONSTANTS
+defaultDataLocation = "./output/latest"
+defaultPageSize = 1000 # Events per page unless "limit" asks otherwise
+maxPageSize = 10000
+defaultCacheSize = 256 # Responses kept in memory
+defaultCheckInterval = 1.0 # Seconds between checks for a new snapshot
+minCompressSize = 1024 # Bytes; smaller bodies are sent as they are
+metadataFileNames = {"/categories": "parsedCategories.json",
+                     "/sources": "parsedSources.json"}
+
+## HELPER FUNCTIONS
+
+class RequestError(ValueError):
+    """
+        Raised for bad requests; carries the HTTP status to answer with.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def buildPage(snapshot, query):
+    """
+        Builds the body of an "/events" page: the matching events after the
+        cursor, at most "limit" of them, with the cursor of the next page.
+
+        Input: Snapshot dict from "loadSnapshot", dict query from parse_qs
+
+        Output: Bytes of the compact GeoJSON FeatureCollection
+    """
+    rows = queryRows(snapshot, query)
+    limit = parseInteger(query, "limit", defaultPageSize)
+    if not 1 <= limit <= maxPageSize:
+        raise RequestError(400, f"limit should be 1 to {maxPageSize}")
+    after = -1
+    if "cursor" in query:
+        after = decodeCursor(query["cursor"][0], snapshot["version"])
+    first = np.searchsorted(rows, after, side="right")
+    pageRows = rows[first:first + limit]
+
+    nextCursor = None
+    if first + limit < len(rows):
+        nextCursor = encodeCursor(snapshot["version"], int(pageRows[-1]))
+    features = b",".join(snapshot["features"][row] for row in pageRows)
+    header = json.dumps({"type": "FeatureCollection",
+                         "numberMatched": int(len(rows)),
+                         "numberReturned": int(len(pageRows)),
+                         "next": nextCursor}, separators=(",", ":"))
+    return header[:-1].encode() + b',"features":[' + features + b"]}"
+
+def chooseEncoding(acceptEncoding):
+    """
+        Picks the best compression the client accepts: brotli (when
+        installed), then gzip.
+
+        Input: String Accept-Encoding header (or None)
+
+        Output: String "br", "gzip", or "identity"
+    """
+    accepted = {}
+    for part in (acceptEncoding or "").split(","):
+        name, _, parameters = part.strip().partition(";")
+        quality = 1.0
+        if parameters.strip().startswith("q="):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return "identity"
+
+def compressBody(body, encoding):
+    """
+        Compresses a response body.
+
+        Input: Bytes body, string encoding from "chooseEncoding"
+
+        Output: Bytes of the compressed body
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
+
+def createHandler(service):
+    """
+        Creates a request handler class bound to the service's state.
+
+        Input: Service dict from "createService"
+
+        Output: BaseHTTPRequestHandler subclass
+    """
+    class EventsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requestURL = urlparse(self.path)
+            encoding = chooseEncoding(self.headers.get("Accept-Encoding"))
+            try:
+                snapshot = refreshSnapshot(service)
+                status, body, etag, encoding = respond(
+                    service, snapshot, requestURL.path, requestURL.query,
+                    encoding)
+            except RequestError as error:
+                status, etag, encoding = error.status, None, "identity"
+                body = json.dumps({"error": str(error)}).encode()
+            except Exception:
+                logging.exception(f"Failed to answer {self.path}:")
+                status, etag, encoding = 500, None, "identity"
+                body = b'{"error": "internal error"}'
+
+            if etag is not None and \
+               etag in parseETags(self.headers.get("If-None-Match")):
+                status, body = 304, b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/geo+json"
+                             if requestURL.path == "/events"
+                             else "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache") # Revalidate, cheaply
+            self.send_header("Vary", "Accept-Encoding")
+            if etag is not None:
+                self.send_header("ETag", etag)
+            if encoding != "identity" and status != 304:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.info(f"{self.address_string()} {format % args}")
+
+    return EventsHandler
+
+def createService(dataLocation, cacheSize=defaultCacheSize,
+                  checkInterval=defaultCheckInterval):
+    """
+        Creates the service's state, loading the current snapshot.
+
+        Input: String dataLocation folder of the homogenized output, positive
+        integer cacheSize of responses kept, float checkInterval in seconds
+        between checks for a new snapshot
+
+        Output: Service dict
+    """
+    service = {"lock": threading.Lock(), "reloadLock": threading.Lock(),
+               "dataLocation": dataLocation,
+               "cacheSize": cacheSize, "checkInterval": checkInterval,
+               "snapshot": None, "lastCheck": 0.0, "cache": OrderedDict(),
+               "stats": {"hits": 0, "misses": 0, "reloads": 0}}
+    refreshSnapshot(service)
+    return service
+
+def decodeCursor(cursor, version):
+    """
+        Decodes a pagination cursor made by "encodeCursor".
+
+        Input: String cursor, string version of the current snapshot
+
+        Output: Integer row the previous page ended at; raises RequestError
+        if the cursor is invalid or belongs to another snapshot
+    """
+    try:
+        cursorVersion, after = base64.urlsafe_b64decode(
+            cursor.encode() + b"=" * (-len(cursor) % 4)).decode().split(":")
+        after = int(after)
+    except ValueError:
+        raise RequestError(400, "invalid cursor")
+    if cursorVersion != version:
+        raise RequestError(410, "cursor belongs to an older snapshot; start "
+                           "over without a cursor")
+    return after
+
+def encodeCursor(version, after):
+    """
+        Encodes an opaque pagination cursor.
+
+        Input: String version of the snapshot, integer row the page ended at
+
+        Output: String cursor
+    """
+    return base64.urlsafe_b64encode(f"{version}:{after}".encode()) \
+                 .decode().rstrip("=")
+
+def findEventsFile(dataLocation):
+    """
+        Finds the homogenized events in dataLocation, in any output format
+        (see "homogenizeEvents.eventsFormats").
+
+        Input: String dataLocation folder
+
+        Output: Path of the events file; raises FileNotFoundError if none
+    """
+    for extension in homogenizeEvents.eventsFormats.values():
+        eventsFile = Path(dataLocation, f"homogenizedEvents.{extension}")
+        if eventsFile.is_file():
+            return eventsFile
+    raise FileNotFoundError(f"No homogenizedEvents file in {dataLocation}")
+
+def loadSnapshot(dataLocation):
+    """
+        Loads the homogenized events, Categories, and Sources in dataLocation:
+        every feature is serialized compactly once, and the query index is
+        built over them.
+
+        Input: String dataLocation folder
+
+        Output: Snapshot dict with its "version", "features" (compact JSON
+        bytes per row), query "index", and "metadata" bodies
+    """
+    eventsFile = findEventsFile(dataLocation)
+    version = snapshotVersion(dataLocation)
+    if eventsFile.suffix == ".geojson":
+        with open(eventsFile, "r") as inFile:
+            features = json.load(inFile)["features"]
+    else:
+        eventsGDF = homogenizeEvents.readColumnarEvents(str(eventsFile))
+        features = json.loads(eventsGDF.to_json(drop_id=True))["features"]
+
+    properties = [feature["properties"] for feature in features]
+    coordinates = np.array([feature["geometry"]["coordinates"]
+                            for feature in features],
+                           dtype=np.float64).reshape(-1, 2)
+    index = eventIndex.buildEventIndexFromArrays(
+        coordinates[:, 0], coordinates[:, 1], 
+        [eventProperties["date"] for eventProperties in properties],
+        [eventProperties["categories"][0]["id"] 
+         for eventProperties in properties],
+        [eventProperties["id"] for eventProperties in properties],
+        [eventProperties["title"] for eventProperties in properties])
+
+    metadata = {}
+    for route, fileName in metadataFileNames.items():
+        metadataFile = Path(dataLocation, fileName)
+        if metadataFile.is_file():
+            metadata[route] = metadataFile.read_bytes()
+    return {"version": version,
+            "features": [json.dumps(feature, separators=(",", ":")).encode()
+                         for feature in features],
+            "index": index,
+            "metadata": metadata, "loadedAt": time.time()}
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Serves the latest "
+                                     "homogenized EONET events over HTTP")
+    parser.add_argument("--data", default=defaultDataLocation,
+                        help="folder of the homogenized output, e.g. kept up "
+                        "to date by pollEONET.py (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=defaultCacheSize,
+                        help="responses kept in memory (default: "
+                        "%(default)s)")
+    parser.add_argument("--check-interval", type=float,
+                        default=defaultCheckInterval,
+                        help="seconds between checks for a new snapshot "
+                        "(default: %(default)s)")
+    return parser.parse_args(arguments)
+
+def parseETags(ifNoneMatch):
+    """
+        Parses an If-None-Match header into its ETags.
+
+        Input: String header value (or None)
+
+        Output: Set of ETag strings (weak "W/" prefixes removed)
+    """
+    return {tag.strip().removeprefix("W/")
+            for tag in (ifNoneMatch or "").split(",") if tag.strip()}
+
+def parseInteger(query, name, default):
+    """
+        Reads an integer query parameter.
+
+        Input: Dict query from parse_qs, string name, integer default
+
+        Output: Integer value; raises RequestError if it is not an integer
+    """
+    try:
+        return int(query[name][0]) if name in query else default
+    except ValueError:
+        raise RequestError(400, f"{name} should be an integer")
+
+def queryRows(snapshot, query):
+    """
+        Finds the rows of the events matching the query's "bbox", "start",
+        "end", and "category" parameters (see "eventIndex.queryEventIndex").
+
+        Input: Snapshot dict from "loadSnapshot", dict query from parse_qs
+
+        Output: Sorted array of matching row numbers
+    """
+    bbox = None
+    if "bbox" in query:
+        try:
+            bbox = tuple(float(value) for value in
+                         query["bbox"][0].split(","))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise RequestError(400, "bbox should be minLon,minLat,maxLon,"
+                               "maxLat")
+    start = query["start"][0] if "start" in query else None
+    end = query["end"][0] if "end" in query else None
+    categories = query["category"][0].split(",") if "category" in query \
+                 else [None]
+    try:
+        rows = [eventIndex.queryEventIndex(snapshot["index"], bbox, start,
+                                           end, category)
+                for category in categories]
+    except ValueError:
+        raise RequestError(400, "start and end should be ISO dates")
+    return np.unique(np.concatenate(rows)) if len(rows) > 1 else rows[0]
+
+def refreshSnapshot(service):
+    """
+        Returns the current snapshot, first loading a new one (and clearing
+        the response cache) if the data folder changed since the last check.
+        Checks happen at most every checkInterval seconds.
+
+        Input: Service dict from "createService"
+
+        Output: Snapshot dict from "loadSnapshot"
+    """
+    with service["lock"]:
+        now = time.monotonic()
+        snapshot = service["snapshot"]
+        if snapshot is not None and \
+           now - service["lastCheck"] < service["checkInterval"]:
+            return snapshot
+        service["lastCheck"] = now
+    try:
+        if snapshot is not None and \
+           snapshotVersion(service["dataLocation"]) == snapshot["version"]:
+            return snapshot
+    except FileNotFoundError: # Mid-replace; keep serving what is loaded
+        return snapshot
+
+    # A new snapshot landed. One thread loads it while the others keep
+    # answering from the old one
+    if not service["reloadLock"].acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if service["snapshot"] is not snapshot: # Loaded while we waited
+            return service["snapshot"]
+        snapshot = loadSnapshot(service["dataLocation"])
+        with service["lock"]:
+            service["snapshot"] = snapshot
+            service["cache"].clear()
+            service["stats"]["reloads"] += 1
+    finally:
+        service["reloadLock"].release()
+    logging.info(f"Loaded snapshot {snapshot['version']} with "
+                 f"{len(snapshot['features'])} events")
+    return snapshot
+
+def respond(service, snapshot, path, queryString, encoding):
+    """
+        Answers a request from the response cache, or builds (and caches) the
+        response. Equal queries in another parameter order share an entry.
+
+        Input: Service dict, snapshot dict, string path, string queryString,
+        string encoding from "chooseEncoding"
+
+        Output: Tuple of (integer status, bytes body, string ETag, string
+        encoding the body was compressed with)
+    """
+    query = parse_qs(queryString)
+    cacheKey = (snapshot["version"], path,
+                tuple(sorted((name, tuple(values))
+                             for name, values in query.items())), encoding)
+    with service["lock"]:
+        cached = service["cache"].get(cacheKey)
+        if cached is not None:
+            service["cache"].move_to_end(cacheKey)
+            service["stats"]["hits"] += 1
+            return cached
+        service["stats"]["misses"] += 1
+
+    if path == "/events":
+        body = buildPage(snapshot, query)
+    elif path in metadataFileNames and path in snapshot["metadata"]:
+        body = snapshot["metadata"][path]
+    elif path == "/status":
+        with service["lock"]:
+            stats = dict(service["stats"])
+        body = json.dumps({"version": snapshot["version"],
+                           "numEvents": len(snapshot["features"]),
+                           "loadedAt": snapshot["loadedAt"],
+                           "cache": stats}).encode()
+        return 200, body, None, "identity" # Changes every time; not cached
+    else:
+        raise RequestError(404, f"unknown path {path}")
+
+    if len(body) < minCompressSize:
+        encoding = "identity"
+    etag = '"' + hashlib.sha256(repr(cacheKey[:3]).encode() +
+                                encoding.encode()).hexdigest()[:32] + '"'
+    response = (200, compressBody(body, encoding), etag, encoding)
+    with service["lock"]:
+        service["cache"][cacheKey] = response
+        while len(service["cache"]) > service["cacheSize"]:
+            service["cache"].popitem(last=False)
+    return response
+
+def snapshotVersion(dataLocation):
+    """
+        Determines the version of the data in dataLocation from the size and
+        modification time of its files, which pollEONET.py replaces
+        atomically whenever a cycle changed them.
+
+        Input: String dataLocation folder
+
+        Output: String version
+    """
+    eventsFile = findEventsFile(dataLocation)
+    stats = [eventsFile.name]
+    for fileName in metadataFileNames.values():
+        metadataFile = Path(dataLocation, fileName)
+        if metadataFile.is_file():
+            fileStats = metadataFile.stat()
+            stats += [fileStats.st_size, fileStats.st_mtime_ns]
+    fileStats = eventsFile.stat()
+    stats += [fileStats.st_size, fileStats.st_mtime_ns, fileStats.st_ino]
+    return hashlib.sha256(repr(stats).encode()).hexdigest()[:16]
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(message)s")
+    service = createService(arguments.data, arguments.cache_size,
+                            arguments.check_interval)
+    server = ThreadingHTTPServer((arguments.host, arguments.port),
+                                 createHandler(service))
+    print(f"Serving events from '{arguments.data}' at "
+          f"http://{arguments.host}:{arguments.port}/events")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
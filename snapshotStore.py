@@ -0,0 +1,415 @@
+"""
+    Description: Content-addressed, compressed store of EONET snapshots.
+    Instead of every run writing a full, uncompressed copy of Events,
+    Categories, and Sources into a new folder, each run adds a small manifest
+    pointing at compressed blobs keyed by the SHA-256 of their content:
+
+    - Categories and Sources are stored as blobs of exactly the JSON a plain
+      run would write, so an unchanged file is stored once, however many runs
+      point at it.
+    - Events are stored as per-event deltas against the previous run: only
+      the features of events that were added or changed (plus the ids of
+      removed ones) go into the run's blob. Every "keyframeInterval" runs a
+      full copy is stored instead, so restoring a run never replays more than
+      that many deltas.
+
+    Blobs are zstd-compressed when the "zstandard" package is installed, else
+    gzipped; both can be read back. Layout of the store folder:
+
+        blobs/[first 2 hash characters]/[hash].zst (or .gz)
+        manifests/[run id].json
+        HEAD (run id of the latest run)
+
+    pullData.py saves its snapshots here; "checkout" writes a run back out as
+    the plain files homogenizeEvents.py reads.
+
+    Input: Command ("list" or "checkout") and its arguments, e.g.
+    "py snapshotStore.py checkout 17-10-2026_T03-00-57 ./homogenize/data"
+
+    Output: List of runs printed, or a run's files written to a folder
+"""
+
+## IMPORTS
+import argparse # For parsing script arguments
+from datetime import datetime, timezone # For recording when runs were made
+import gzip # For compressing blobs when zstandard is not installed
+import hashlib # For content addressing blobs
+import json # For serializing snapshots, deltas, and manifests
+import os # For atomically writing blobs + manifests
+from pathlib import Path # For making directories and files
+
+## CONSTANTS
+defaultStoreLocation = "./output/snapshots"
+keyframeInterval = 50 # Runs between full copies of Events
+blobExtensions = (".zst", ".gz") # One per codec of "compressBlob"
+snapshotFileNames = {"Events": "events.geojson",
+                     "Categories": "categories.json",
+                     "Sources": "sources.json"} # Same names as pullData.py
+
+## HELPER FUNCTIONS
+
+def applyEventsDelta(previousEvents, delta):
+    """
+        Rebuilds an Events FeatureCollection from the previous run's Events and
+        the delta made by "diffEvents" (or from a keyframe, which is a delta
+        against nothing).
+
+        Input: GeoJSON FeatureCollection dict previousEvents (None for a
+        keyframe), delta dict
+
+        Output: GeoJSON FeatureCollection dict
+    """
+    if previousEvents is None:
+        eventFeatures, previousOrder, collection = {}, [], {}
+    else:
+        collection, eventFeatures, previousOrder = groupFeatures(previousEvents)
+    collection = delta.get("collection", collection)
+    for eventId in delta["removed"]:
+        del eventFeatures[eventId]
+    eventFeatures.update(delta["changed"])
+    order = delta.get("order") or defaultOrder(previousOrder, delta)
+
+    # Put the features back in their original order
+    nextFeature = dict.fromkeys(eventFeatures, 0)
+    features = []
+    for eventId in order:
+        features.append(eventFeatures[eventId][nextFeature[eventId]])
+        nextFeature[eventId] += 1
+
+    return dict(collection, features=features)
+
+def checkoutSnapshot(storeLocation, runId, outputFolder):
+    """
+        Writes a stored run out as the plain files pullData.py used to write
+        ("events.geojson", "categories.json", "sources.json"), ready for
+        homogenizeEvents.py's "--input".
+
+        Input: String storeLocation, string runId (None for the latest run),
+        string outputFolder to write to (created if needed)
+
+        Output: Dict of type of EONET data to the file written
+    """
+    manifest = readManifest(storeLocation, runId)
+    Path(outputFolder).mkdir(parents=True, exist_ok=True)
+    fileLocations = {}
+    for typeData, fileName in snapshotFileNames.items():
+        fileLocations[typeData] = f"{outputFolder}/{fileName}"
+        if typeData == "Events":
+            data = serializeJSON(loadEvents(storeLocation, manifest))
+        else:
+            data = readBlob(storeLocation, manifest["blobs"][typeData])
+        with open(fileLocations[typeData], "wb") as outFile:
+            outFile.write(data)
+    return fileLocations
+
+def compressBlob(data):
+    """
+        Compresses blob data with zstd if the "zstandard" package is
+        installed, else with gzip.
+
+        Input: Bytes data
+
+        Output: Tuple of (compressed bytes, file extension of the codec)
+    """
+    try:
+        import zstandard # Optional dependency; better + faster than gzip
+    except ImportError:
+        return gzip.compress(data, mtime=0), ".gz"
+    return zstandard.ZstdCompressor(level=19).compress(data), ".zst"
+
+def decompressBlob(data, extension):
+    """
+        Decompresses blob data written by "compressBlob".
+
+        Input: Compressed bytes data, string extension of its codec
+
+        Output: Decompressed bytes
+    """
+    if extension == ".gz":
+        return gzip.decompress(data)
+    import zstandard # Optional dependency; needed to read zstd blobs
+    return zstandard.ZstdDecompressor().decompress(data)
+
+def defaultOrder(previousOrder, delta):
+    """
+        Feature order "diffEvents" assumes when a delta has no "order": the
+        previous order without removed or changed events, followed by the
+        features of changed events in the order of "changed".
+
+        Input: List previousOrder of the event id of every feature, delta dict
+
+        Output: List of the event id of every feature
+    """
+    dropped = set(delta["removed"]) | set(delta["changed"])
+    order = [eventId for eventId in previousOrder if eventId not in dropped]
+    for eventId, features in delta["changed"].items():
+        order += [eventId] * len(features)
+    return order
+
+def diffEvents(previousEvents, events):
+    """
+        Determines the per-event delta between two Events FeatureCollections:
+        the features of every event that was added or changed, the ids of
+        removed events, and (only if they changed) the collection's other
+        members and the order of the features.
+
+        Input: GeoJSON FeatureCollection dicts previousEvents (None to make a
+        keyframe) and events
+
+        Output: Delta dict for "applyEventsDelta"
+    """
+    collection, eventFeatures, order = groupFeatures(events)
+    if previousEvents is None:
+        previousCollection, previousFeatures, previousOrder = None, {}, []
+    else:
+        previousCollection, previousFeatures, previousOrder = \
+            groupFeatures(previousEvents)
+
+    delta = {"removed": [eventId for eventId in previousFeatures
+                         if eventId not in eventFeatures],
+             "changed": {eventId: features
+                         for eventId, features in eventFeatures.items()
+                         if previousFeatures.get(eventId) != features}}
+    if collection != previousCollection:
+        delta["collection"] = collection
+    if defaultOrder(previousOrder, delta) != order:
+        delta["order"] = order
+    return delta
+
+def findBlob(storeLocation, digest):
+    """
+        Finds the file of a stored blob. Only complete blobs count; a
+        leftover ".tmp" file of an interrupted write is ignored.
+
+        Input: String storeLocation, string hex digest of the blob
+
+        Output: Path of the blob file, or None if it is not stored
+    """
+    for extension in blobExtensions:
+        blobFile = Path(storeLocation, "blobs", digest[:2],
+                        f"{digest}{extension}")
+        if blobFile.is_file():
+            return blobFile
+    return None
+
+def groupFeatures(events):
+    """
+        Splits an Events FeatureCollection into its other members, the
+        features of each event, and the event id of every feature in order.
+
+        Input: GeoJSON FeatureCollection dict events
+
+        Output: Tuple of (dict of the collection's other members, dict of
+        event id to its list of features, list of event ids)
+    """
+    collection = {key: value for key, value in events.items()
+                  if key != "features"}
+    eventFeatures = {}
+    order = []
+    for feature in events["features"]:
+        eventId = feature["properties"]["id"]
+        eventFeatures.setdefault(eventId, []).append(feature)
+        order.append(eventId)
+    return collection, eventFeatures, order
+
+def listRuns(storeLocation=defaultStoreLocation):
+    """
+        Lists the runs in the store, oldest first.
+
+        Input: String storeLocation
+
+        Output: List of manifest dicts
+    """
+    manifests = [json.loads(manifestFile.read_text()) for manifestFile
+                 in Path(storeLocation, "manifests").glob("*.json")]
+    return sorted(manifests, key=lambda manifest: manifest["createdAt"])
+
+def loadEvents(storeLocation, manifest):
+    """
+        Rebuilds a run's Events by replaying its deltas from the last
+        keyframe.
+
+        Input: String storeLocation, manifest dict of the run
+
+        Output: GeoJSON FeatureCollection dict
+    """
+    # Walk back to the keyframe, then replay forwards
+    chain = [manifest]
+    while chain[-1]["eventsBase"] is not None:
+        chain.append(readManifest(storeLocation, chain[-1]["eventsBase"]))
+    events = None
+    for runManifest in reversed(chain):
+        delta = json.loads(readBlob(storeLocation,
+                                    runManifest["blobs"]["Events"]))
+        events = applyEventsDelta(events, delta)
+    return events
+
+def loadSnapshot(storeLocation=defaultStoreLocation, runId=None):
+    """
+        Loads a stored run back into the dict pullData.py requested.
+
+        Input: String storeLocation, string runId (None for the latest run)
+
+        Output: Dict of type of EONET data to its JSON data
+    """
+    manifest = readManifest(storeLocation, runId)
+    EONETData = {"Events": loadEvents(storeLocation, manifest)}
+    for typeData in ("Categories", "Sources"):
+        EONETData[typeData] = json.loads(
+            readBlob(storeLocation, manifest["blobs"][typeData]))
+    return EONETData
+
+def parseArguments(arguments=None):
+    """
+        Parses the script arguments.
+
+        Input: List of string arguments, sys.argv by default
+
+        Output: argparse Namespace of parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Lists or checks out EONET "
+                                     "snapshots")
+    parser.add_argument("--store", default=defaultStoreLocation,
+                        help="store location (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list stored runs")
+    checkout = commands.add_parser("checkout", help="write a run out as "
+                                   "plain files")
+    checkout.add_argument("run", help="run id, or 'HEAD' for the latest run")
+    checkout.add_argument("folder", help="folder to write the files to")
+    return parser.parse_args(arguments)
+
+def readBlob(storeLocation, digest):
+    """
+        Reads and decompresses the blob with the given hash.
+
+        Input: String storeLocation, string hex digest of the blob
+
+        Output: Bytes of the blob
+    """
+    blobFile = findBlob(storeLocation, digest)
+    if blobFile is None:
+        raise FileNotFoundError(f"Blob {digest} not found in {storeLocation}")
+    return decompressBlob(blobFile.read_bytes(), blobFile.suffix)
+
+def readManifest(storeLocation, runId=None):
+    """
+        Reads a run's manifest.
+
+        Input: String storeLocation, string runId (None or "HEAD" for the
+        latest run)
+
+        Output: Manifest dict, or None if the store has no runs yet and runId
+        is None
+    """
+    if runId in (None, "HEAD"):
+        headFile = Path(storeLocation, "HEAD")
+        if not headFile.is_file():
+            if runId is None:
+                return None
+            raise FileNotFoundError(f"No runs stored in {storeLocation}")
+        runId = headFile.read_text().strip()
+    with open(Path(storeLocation, "manifests", f"{runId}.json"), "r") as inFile:
+        return json.load(inFile)
+
+def saveSnapshot(storeLocation, EONETData, runId):
+    """
+        Saves a run's EONET data: Categories and Sources as content-addressed
+        blobs, Events as a delta against the latest run (or a keyframe), and a
+        manifest pointing at them, which then becomes HEAD.
+
+        Input: String storeLocation (created if needed), dict EONETData of
+        type of EONET data to its JSON data, string runId (e.g. from
+        pullData.py's "determineFolderName")
+
+        Output: Manifest dict of the run
+    """
+    manifestFile = Path(storeLocation, "manifests", f"{runId}.json")
+    if manifestFile.exists(): # Same as a folder that should not already exist
+        raise FileExistsError(f"Run {runId} already stored in {storeLocation}")
+    manifestFile.parent.mkdir(parents=True, exist_ok=True)
+    previousManifest = readManifest(storeLocation)
+
+    # Delta against the previous run, unless a keyframe is due
+    previousEvents = None
+    eventsBase = None
+    depth = 0
+    if previousManifest is not None and \
+       previousManifest["eventsDepth"] + 1 < keyframeInterval:
+        eventsBase = previousManifest["runId"]
+        depth = previousManifest["eventsDepth"] + 1
+        previousEvents = loadEvents(storeLocation, previousManifest)
+    delta = diffEvents(previousEvents, EONETData["Events"])
+
+    blobs = {"Events": writeBlob(storeLocation, serializeJSON(delta, None))}
+    for typeData in ("Categories", "Sources"):
+        blobs[typeData] = writeBlob(storeLocation,
+                                    serializeJSON(EONETData[typeData]))
+    manifest = {"runId": runId,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+                "blobs": blobs, "eventsBase": eventsBase,
+                "eventsDepth": depth,
+                "changedEvents": len(delta["changed"]),
+                "removedEvents": len(delta["removed"])}
+
+    writeFileAtomically(manifestFile, serializeJSON(manifest))
+    writeFileAtomically(Path(storeLocation, "HEAD"), runId.encode())
+    return manifest
+
+def serializeJSON(data, indent=4):
+    """
+        Serializes data the same way pullData.py writes its files, so equal
+        data always gives the same bytes (and blob hash).
+
+        Input: JSON serializable data, indent (4 by default, None for compact)
+
+        Output: Bytes of UTF-8 encoded JSON
+    """
+    return json.dumps(data, indent=indent).encode()
+
+def writeBlob(storeLocation, data):
+    """
+        Stores data as a compressed blob keyed by its SHA-256, unless a blob
+        with that hash is already stored.
+
+        Input: String storeLocation, bytes data
+
+        Output: String hex digest of data
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if findBlob(storeLocation, digest) is not None:
+        return digest # Already stored
+    blobFolder = Path(storeLocation, "blobs", digest[:2])
+    blobFolder.mkdir(parents=True, exist_ok=True)
+    compressedData, extension = compressBlob(data)
+    writeFileAtomically(blobFolder / f"{digest}{extension}", compressedData)
+    return digest
+
+def writeFileAtomically(fileLocation, data):
+    """
+        Writes data to fileLocation through a temporary file, so a reader
+        never sees a half-written file.
+
+        Input: Path-like fileLocation, bytes data
+
+        Output: None
+    """
+    tempFile = f"{fileLocation}.tmp"
+    with open(tempFile, "wb") as outFile:
+        outFile.write(data)
+    os.replace(tempFile, fileLocation)
+
+## MAIN
+if __name__ == "__main__":
+
+    arguments = parseArguments()
+    if arguments.command == "list":
+        for manifest in listRuns(arguments.store):
+            kind = "keyframe" if manifest["eventsBase"] is None else "delta"
+            print(f"{manifest['runId']}  {manifest['createdAt']}  {kind:<8}  "
+                  f"{manifest['changedEvents']} changed, "
+                  f"{manifest['removedEvents']} removed events")
+    else:
+        fileLocations = checkoutSnapshot(arguments.store, arguments.run,
+                                         arguments.folder)
+        print(f"Wrote {', '.join(fileLocations.values())}")
@@ -0,0 +1,78 @@
+"""
+    Description: Shared pytest fixtures. Puts the repo's root, "homogenize"
+    and "benchmark" folders on the import path (the scripts import each other
+    by module name), runs the EONET stub server ("benchmark/stubServer.py")
+    in-process on a free port, and lets tests swap pullData.py's shared
+    scheduler for a fast one.
+
+    Input: None; fixtures are requested by name
+
+    Output: Fixtures "repoRoot", "startStub", and "fastScheduler"
+"""
+
+## IMPORTS
+from http.server import ThreadingHTTPServer # For running the stub in-process
+from pathlib import Path # For locating the repo's folders
+import sys # For importing the repo's scripts
+import threading # For serving the stub while a test runs
+
+import pytest # For fixtures
+
+## CONSTANTS
+rootLocation = Path(__file__).resolve().parent.parent
+for folder in (rootLocation, rootLocation / "homogenize",
+               rootLocation / "benchmark"):
+    if str(folder) not in sys.path:
+        sys.path.insert(0, str(folder))
+
+import pullData # For swapping its shared scheduler
+import requestScheduler # For creating a fast scheduler
+import stubServer # For the stub EONET API
+
+## FIXTURES
+
+@pytest.fixture(scope="session")
+def repoRoot():
+    """
+        Location of the repo's root folder.
+
+        Output: Path of the root folder
+    """
+    return rootLocation
+
+@pytest.fixture
+def startStub():
+    """
+        Starts stub EONET APIs on free ports; every one started is shut down
+        when the test ends.
+
+        Output: Function taking stubServer.py's optional arguments (e.g.
+        "--throttle-rate", "1") and returning the stub's base URL
+    """
+    servers = []
+
+    def start(*arguments):
+        settings = stubServer.parseArguments(["0", "--quiet", *arguments])
+        server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                     stubServer.createHandler(settings))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def fastScheduler(monkeypatch):
+    """
+        Replaces pullData.py's shared scheduler with one that does not pace
+        requests noticeably, so tests against the stub run quickly.
+
+        Output: The scheduler dict in use
+    """
+    scheduler = requestScheduler.createScheduler(ratePerSecond=1000.0,
+                                                 capacity=100)
+    monkeypatch.setattr(pullData, "sharedScheduler", scheduler)
+    return scheduler
@@ -0,0 +1,72 @@
+"""
+    Description: Tests of "homogenize/batchHomogenize.py": folders that are
+    not snapshots are skipped and logged, snapshots with the same inputs are
+    homogenized once (and not again on the next batch run), and the merged
+    history keeps when each event was first and last seen.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import logging # For checking skipped folders are logged
+import shutil # For copying the bundled data into snapshot folders
+
+import batchHomogenize # Code under test
+
+## HELPER FUNCTIONS
+
+def copySnapshot(repoRoot, folder):
+    """
+        Copies the bundled data into a new snapshot folder.
+
+        Input: Path repoRoot, Path folder to create
+
+        Output: String location of the folder
+    """
+    shutil.copytree(repoRoot / "homogenize" / "data", folder)
+    return str(folder)
+
+## TESTS
+
+def testFindSnapshotsSkipsBadFolders(repoRoot, tmp_path, caplog):
+    snapshot = copySnapshot(repoRoot, tmp_path / "01-04-2023_T10-00-00")
+    repeated = copySnapshot(repoRoot, tmp_path / "repeated")
+    shutil.copy(tmp_path / "repeated" / "events.geojson",
+                tmp_path / "repeated" / "events.geojson.gz")
+    (tmp_path / "empty").mkdir()
+    (tmp_path / "file.json").write_text("{}")
+    badFolders = [str(tmp_path / name)
+                  for name in ("missing", "file.json", "empty")] + [repeated]
+
+    with caplog.at_level(logging.WARNING):
+        snapshots = batchHomogenize.findSnapshots([*badFolders, snapshot])
+    assert [found["location"] for found in snapshots] == [snapshot]
+    assert snapshots[0]["time"].isoformat() == "2023-04-01T10:00:00"
+    for folder in badFolders:
+        assert any(f"Skipping {folder};" in message
+                   for message in caplog.messages)
+
+def testIdenticalSnapshotsAreHomogenizedOnce(repoRoot, tmp_path):
+    folders = [copySnapshot(repoRoot, tmp_path / name)
+               for name in ("01-04-2023_T10-00-00", "02-04-2023_T10-00-00")]
+    snapshots = batchHomogenize.findSnapshots(folders)
+    outputLocation = str(tmp_path / "batch")
+
+    index, counts = batchHomogenize.homogenizeSnapshots(
+        snapshots, outputLocation, workers=2, explodeLines=True)
+    assert counts == {"homogenized": 1, "skipped": 1, "failed": 0}
+    assert len(set(index.values())) == 1
+    _, counts = batchHomogenize.homogenizeSnapshots(
+        snapshots, outputLocation, workers=2, explodeLines=True)
+    assert counts == {"homogenized": 0, "skipped": 2, "failed": 0}
+
+    features = batchHomogenize.mergeHistory(snapshots, index,
+                                            tmp_path / "batch" / "results")
+    assert features
+    assert {(feature["properties"]["firstSeen"],
+             feature["properties"]["lastSeen"]) for feature in features} == \
+           {("2023-04-01T10:00:00", "2023-04-02T10:00:00")}
+    dates = [feature["properties"]["date"] for feature in features]
+    assert dates == sorted(dates)
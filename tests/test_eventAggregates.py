@@ -0,0 +1,184 @@
+"""
+    Description: Tests of the Mapbox Vector Tile encoding in
+    "homogenize/eventAggregates.py", decoded again with a minimal protocol
+    buffers reader.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import struct # For decoding doubles
+
+import eventAggregates # Code under test
+import numpy as np # For bins without a magnitude
+import pandas as pd # For the bins of a tile
+import pytest # For tests
+
+## HELPER FUNCTIONS
+
+def decodeVarint(data, position):
+    """
+        Decodes a protocol buffers varint.
+
+        Input: Bytes data, integer position of the varint
+
+        Output: Tuple of (integer value, position after the varint)
+    """
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+def decodeMessage(data):
+    """
+        Decodes the fields of a protocol buffers message without a schema.
+
+        Input: Bytes data of the message
+
+        Output: List of (field number, value) tuples; varints as integers,
+        doubles as floats, length-delimited fields as bytes
+    """
+    fields = []
+    position = 0
+    while position < len(data):
+        key, position = decodeVarint(data, position)
+        fieldNumber, wireType = key >> 3, key & 7
+        if wireType == 0:
+            value, position = decodeVarint(data, position)
+        elif wireType == 1:
+            value = struct.unpack_from("<d", data, position)[0]
+            position += 8
+        elif wireType == 2:
+            length, position = decodeVarint(data, position)
+            value = data[position:position + length]
+            position += length
+        else:
+            raise ValueError(f"Unexpected wire type {wireType}")
+        fields.append((fieldNumber, value))
+    return fields
+
+def decodePacked(data):
+    """
+        Decodes a packed field of varints.
+
+        Input: Bytes data of the field
+
+        Output: List of integers
+    """
+    values = []
+    position = 0
+    while position < len(data):
+        value, position = decodeVarint(data, position)
+        values.append(value)
+    return values
+
+def decodeTile(tile):
+    """
+        Decodes a single-layer vector tile into its properties and points.
+
+        Input: Bytes of the tile
+
+        Output: Dict with the layer's "version", "name", "extent", and
+        "features" (list of (properties dict, geometry type, (x, y)))
+    """
+    [(layerField, layerData)] = decodeMessage(tile)
+    assert layerField == 3
+    layer = {"features": [], "keys": [], "values": []}
+    featureMessages = []
+    for fieldNumber, value in decodeMessage(layerData):
+        if fieldNumber == 15:
+            layer["version"] = value
+        elif fieldNumber == 1:
+            layer["name"] = value.decode()
+        elif fieldNumber == 2:
+            featureMessages.append(value)
+        elif fieldNumber == 3:
+            layer["keys"].append(value.decode())
+        elif fieldNumber == 4:
+            [(valueType, tileValue)] = decodeMessage(value)
+            layer["values"].append(tileValue.decode() if valueType == 1
+                                   else tileValue)
+        elif fieldNumber == 5:
+            layer["extent"] = value
+
+    for featureData in featureMessages:
+        feature = dict(decodeMessage(featureData))
+        tags = decodePacked(feature[2])
+        properties = {layer["keys"][tags[i]]: layer["values"][tags[i + 1]]
+                      for i in range(0, len(tags), 2)}
+        command, zigzagX, zigzagY = decodePacked(feature[4])
+        assert command == 1 | 1 << 3 # One MoveTo
+        point = ((zigzagX >> 1) ^ -(zigzagX & 1),
+                 (zigzagY >> 1) ^ -(zigzagY & 1))
+        layer["features"].append((properties, feature[3], point))
+    return layer
+
+## TESTS
+
+@pytest.mark.parametrize("value, encoded", [
+    (0, b"\x00"), (1, b"\x01"), (127, b"\x7f"), (128, b"\x80\x01"),
+    (300, b"\xac\x02"), (2 ** 32, b"\x80\x80\x80\x80\x10")])
+def testEncodeVarint(value, encoded):
+    assert eventAggregates.encodeVarint(value) == encoded
+    assert decodeVarint(encoded, 0) == (value, len(encoded))
+
+def testEncodeVectorTileRoundTrip():
+    cellBits = 2
+    tileX, tileY = 3, 5
+    tileRows = pd.DataFrame({
+        "cellX": [tileX << cellBits, (tileX << cellBits) + 3,
+                  (tileX << cellBits) + 1],
+        "cellY": [tileY << cellBits, (tileY << cellBits) + 2,
+                  (tileY << cellBits) + 3],
+        "category": ["Wildfires", "Volcanoes", "Wildfires"],
+        "timeBucket": ["2023-04", "2023-04", "2023-03"],
+        "count": [4, 1, 300],
+        "maxMagnitude": [np.nan, 2.5, 35.0]})
+    layer = decodeTile(eventAggregates.encodeVectorTile(tileRows, tileX,
+                                                        tileY, cellBits))
+
+    assert layer["version"] == 2
+    assert layer["name"] == eventAggregates.tileLayerName
+    assert layer["extent"] == eventAggregates.tileExtent
+    cellSize = eventAggregates.tileExtent // 2 ** cellBits
+    expected = [
+        ({"category": "Wildfires", "timeBucket": "2023-04", "count": 4},
+         (cellSize // 2, cellSize // 2)),
+        ({"category": "Volcanoes", "timeBucket": "2023-04", "count": 1,
+          "maxMagnitude": 2.5}, (3 * cellSize + cellSize // 2,
+                                 2 * cellSize + cellSize // 2)),
+        ({"category": "Wildfires", "timeBucket": "2023-03", "count": 300,
+          "maxMagnitude": 35.0}, (cellSize + cellSize // 2,
+                                  3 * cellSize + cellSize // 2))]
+    assert [(properties, point) for properties, _, point in
+            layer["features"]] == expected
+    assert all(geometryType == 1 for _, geometryType, _ in layer["features"])
+    assert layer["values"].count("Wildfires") == 1 # Values are shared
+
+def testEmptyTile():
+    tileRows = pd.DataFrame({"cellX": [], "cellY": [], "category": [],
+                             "timeBucket": [], "count": [],
+                             "maxMagnitude": []})
+    layer = decodeTile(eventAggregates.encodeVectorTile(tileRows, 0, 0))
+    assert layer["features"] == []
+    assert layer["name"] == eventAggregates.tileLayerName
+
+def testEveryZoomCountsEveryEvent(repoRoot):
+    import homogenizeEvents # Only this test needs a GeoDataFrame of events
+    parsedEONETData = homogenizeEvents.parseData(
+        homogenizeEvents.readData(str(repoRoot / "homogenize" / "data")))
+    homogenizedEvents = homogenizeEvents.improveReadability(
+        homogenizeEvents.homogenizeData(parsedEONETData), parsedEONETData)
+    aggregates = eventAggregates.aggregateEvents(homogenizedEvents,
+                                                 maxZoom=4)
+    assert sorted(aggregates) == list(range(5))
+    for zoom, bins in aggregates.items():
+        assert bins["count"].sum() == len(homogenizedEvents)
+        assert (bins["tileX"] < 2 ** zoom).all()
+        assert not bins.duplicated(eventAggregates.binKeys).any()
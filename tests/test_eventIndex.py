@@ -0,0 +1,122 @@
+"""
+    Description: Tests of "homogenize/eventIndex.py": bbox, time window, and
+    category queries and nearest-event searches over the bundled homogenized
+    output give the same rows as checking every event.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import json # For reading the bundled homogenized output
+
+import eventIndex # Code under test
+import numpy as np # For brute-force answers
+import pandas as pd # For parsing dates like the index does
+import pytest # For fixtures + tests
+
+## CONSTANTS
+homogenizedLocation = "homogenize/output/24-04-2023_T22-06-02"
+bboxes = [None, (-180, -90, 180, 90), (-125, 32, -114, 42),
+          (100, -50, 180, 10), (10.5, 10.5, 10.6, 10.6)]
+windows = [(None, None), ("2023-01-01", None), (None, "2023-03-01"),
+           ("2023-04-01", "2023-04-15")]
+
+## FIXTURES
+
+@pytest.fixture(scope="module")
+def events(repoRoot):
+    """
+        The bundled homogenized events as arrays.
+
+        Output: Dict of aligned "longitudes", "latitudes", "dates",
+        "categories", "ids" and "titles"
+    """
+    with open(repoRoot / homogenizedLocation /
+              "homogenizedEvents.geojson") as inFile:
+        features = json.load(inFile)["features"]
+    properties = [feature["properties"] for feature in features]
+    coordinates = np.array([feature["geometry"]["coordinates"]
+                            for feature in features])
+    return {"longitudes": coordinates[:, 0], "latitudes": coordinates[:, 1],
+            "dates": [eventProperties["date"]
+                      for eventProperties in properties],
+            "categories": [eventProperties["categories"][0]["id"]
+                           for eventProperties in properties],
+            "ids": [eventProperties["id"] for eventProperties in properties],
+            "titles": [eventProperties["title"]
+                       for eventProperties in properties]}
+
+@pytest.fixture(scope="module")
+def index(events):
+    """
+        Query index of the bundled homogenized events, with a coarse grid so
+        queries span several cells.
+
+        Output: Dict index from "buildEventIndexFromArrays"
+    """
+    return eventIndex.buildEventIndexFromArrays(
+        events["longitudes"], events["latitudes"], events["dates"],
+        events["categories"], events["ids"], events["titles"], cellSize=5.0)
+
+## HELPER FUNCTIONS
+
+def bruteForceRows(events, bbox, start, end, category):
+    """
+        Answers a query by checking every event.
+
+        Input: Events dict, then the filters of "queryEventIndex"
+
+        Output: Sorted array of matching row numbers
+    """
+    keep = np.ones(len(events["longitudes"]), dtype=bool)
+    if bbox is not None:
+        longitudes, latitudes = events["longitudes"], events["latitudes"]
+        keep &= (longitudes >= bbox[0]) & (longitudes <= bbox[2]) & \
+                (latitudes >= bbox[1]) & (latitudes <= bbox[3])
+    dates = pd.to_datetime(pd.Series(events["dates"]), utc=True)
+    if start is not None:
+        keep &= (dates >= pd.Timestamp(start, tz="UTC")).to_numpy()
+    if end is not None:
+        keep &= (dates < pd.Timestamp(end, tz="UTC")).to_numpy()
+    if category is not None:
+        keep &= np.array(events["categories"]) == category
+    return np.flatnonzero(keep)
+
+## TESTS
+
+@pytest.mark.parametrize("bbox", bboxes)
+@pytest.mark.parametrize("start, end", windows)
+@pytest.mark.parametrize("category", [None, "wildfires", "severeStorms",
+                                      "unknown"])
+def testQueryMatchesBruteForce(index, events, bbox, start, end, category):
+    rows = eventIndex.queryEventIndex(index, bbox, start, end, category)
+    expected = bruteForceRows(events, bbox, start, end, category)
+    np.testing.assert_array_equal(rows, expected)
+
+@pytest.mark.parametrize("longitude, latitude", [(0, 0), (-120, 37),
+                                                 (179.9, 60), (150, -85)])
+@pytest.mark.parametrize("category", [None, "volcanoes"])
+def testNearestEventsMatchesBruteForce(index, events, longitude, latitude,
+                                       category):
+    rows, distances = eventIndex.nearestEvents(index, longitude, latitude,
+                                               k=5, category=category)
+    candidates = bruteForceRows(events, None, None, None, category)
+    allDistances = eventIndex.greatCircleDistances(
+        events["longitudes"][candidates], events["latitudes"][candidates],
+        longitude, latitude)
+    np.testing.assert_allclose(distances, np.sort(allDistances)[:5])
+    np.testing.assert_allclose(eventIndex.greatCircleDistances(
+        events["longitudes"][rows], events["latitudes"][rows], longitude,
+        latitude), distances)
+
+def testSavedIndexAnswersTheSame(index, tmp_path):
+    eventIndex.saveEventIndex(index, tmp_path / "eventIndex")
+    loadedIndex = eventIndex.loadEventIndex(tmp_path / "eventIndex")
+    for bbox in bboxes:
+        np.testing.assert_array_equal(
+            eventIndex.queryEventIndex(loadedIndex, bbox, "2023-01-01",
+                                       None, "wildfires"),
+            eventIndex.queryEventIndex(index, bbox, "2023-01-01", None,
+                                       "wildfires"))
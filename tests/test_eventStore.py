@@ -0,0 +1,158 @@
+"""
+    Description: Tests of "eventStore.py": upserting the bundled events twice
+    stores them once, bbox/date/category/status queries give the same events
+    as checking every feature, and Point and LineString dates compare and
+    sort together.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import json # For reading the bundled events
+
+import eventStore # Code under test
+import homogenizeEvents # For the date format the store uses
+import pytest # For fixtures + tests
+
+## CONSTANTS
+bboxes = [None, (-180, -90, 180, 90), (-125, 32, -114, 42),
+          (100, -50, 180, 10)]
+windows = [(None, None), ("2023-01-01", None), (None, "2023-03-01"),
+           ("2023-04-01", "2023-04-15")]
+
+## FIXTURES
+
+@pytest.fixture(scope="module")
+def events(repoRoot):
+    """
+        The bundled EONET events (Points and LineStrings).
+
+        Output: GeoJSON FeatureCollection dict
+    """
+    with open(repoRoot / "homogenize" / "data" / "events.geojson") as inFile:
+        return json.load(inFile)
+
+@pytest.fixture(scope="module")
+def connection(events, tmp_path_factory):
+    """
+        Event store holding the bundled events.
+
+        Output: sqlite3 Connection from "openEventStore"
+    """
+    connection = eventStore.openEventStore(
+        str(tmp_path_factory.mktemp("store") / "events.sqlite"))
+    eventStore.upsertEvents(connection, events)
+    yield connection
+    connection.close()
+
+## HELPER FUNCTIONS
+
+def createFeature(eventId, geometryType, dates, closed=None):
+    """
+        Builds a minimal EONET Events feature.
+
+        Input: String eventId, string geometryType ("Point" or "LineString"),
+        list of string dates (one for a Point), optional string closed date
+
+        Output: GeoJSON feature dict
+    """
+    properties = {"id": eventId, "title": eventId, "closed": closed,
+                  "categories": [{"id": "wildfires"}]}
+    if geometryType == "Point":
+        properties["date"] = dates[0]
+        coordinates = [0.0, 0.0]
+    else:
+        properties["geometryDates"] = dates
+        coordinates = [[float(index), 0.0] for index in range(len(dates))]
+    return {"type": "Feature", "properties": properties,
+            "geometry": {"type": geometryType, "coordinates": coordinates}}
+
+def bruteForceKeys(events, bbox, start, end, category):
+    """
+        Answers a query by checking every feature.
+
+        Input: FeatureCollection dict events, then the filters of
+        "queryEvents"
+
+        Output: Sorted list of (event id, geometry date, geometry type)
+    """
+    keys = []
+    for feature in events["features"]:
+        properties = feature["properties"]
+        geometryDate = homogenizeEvents.normalizeDate(
+            properties.get("date") or properties["geometryDates"][0])
+        minLongitude, maxLongitude, minLatitude, maxLatitude = \
+            eventStore.geometryBounds(feature["geometry"])
+        if bbox is not None and (maxLongitude < bbox[0] or
+                                 minLongitude > bbox[2] or
+                                 maxLatitude < bbox[1] or
+                                 minLatitude > bbox[3]):
+            continue
+        if (start is not None and geometryDate < start) or \
+           (end is not None and geometryDate >= end):
+            continue
+        if category is not None and \
+           properties["categories"][0]["id"] != category:
+            continue
+        keys.append((properties["id"], geometryDate,
+                     feature["geometry"]["type"]))
+    return sorted(keys)
+
+## TESTS
+
+def testUpsertingTwiceStoresEventsOnce(connection, events):
+    eventStore.upsertEvents(connection, events)
+    [count] = connection.execute("SELECT COUNT(*) FROM events").fetchone()
+    [indexCount] = connection.execute(
+        "SELECT COUNT(*) FROM eventsIndex").fetchone()
+    assert count == indexCount == len(events["features"])
+
+@pytest.mark.parametrize("bbox", bboxes)
+@pytest.mark.parametrize("start, end", windows)
+@pytest.mark.parametrize("category", [None, "wildfires", "severeStorms"])
+def testQueryMatchesBruteForce(connection, events, bbox, start, end,
+                               category):
+    rows = eventStore.queryEvents(connection, bbox, start, end, category)
+    assert sorted((row["eventId"], row["geometryDate"], row["geometryType"])
+                  for row in rows) == \
+           bruteForceKeys(events, bbox, start, end, category)
+    dates = [row["geometryDate"] for row in rows]
+    assert dates == sorted(dates, reverse=True)
+
+def testPointAndLineStringDatesSortTogether(tmp_path):
+    connection = eventStore.openEventStore(str(tmp_path / "events.sqlite"))
+    eventStore.upsertEvents(connection, {"features": [
+        createFeature("A", "Point", ["2023-01-02T12:00:00Z"]),
+        createFeature("B", "LineString", ["2023-01-02 13:00:00",
+                                          "2023-01-03 00:00:00"]),
+        createFeature("C", "Point", ["2023-01-01T00:00:00Z"],
+                      closed="2023-01-05T00:00:00Z")]})
+
+    assert [row["eventId"] for row in
+            eventStore.queryEvents(connection)] == ["B", "A", "C"]
+    assert [row["eventId"] for row in eventStore.queryEvents(
+        connection, start="2023-01-02", end="2023-01-02T13:00:00Z")] == ["A"]
+    assert [row["eventId"] for row in
+            eventStore.queryEvents(connection, closed=True)] == ["C"]
+    assert [row["eventId"] for row in
+            eventStore.queryEvents(connection, closed=False)] == ["B", "A"]
+    connection.close()
+
+def testOldLineStringDatesAreNormalized(tmp_path):
+    storeLocation = str(tmp_path / "events.sqlite")
+    connection = eventStore.openEventStore(storeLocation)
+    line = createFeature("B", "LineString", ["2023-01-02 13:00:00"])
+    eventStore.upsertEvents(connection, {"features": [line]})
+    with connection: # As written before dates were normalized
+        connection.execute("UPDATE events SET geometryDate = "
+                           "'2023-01-02 13:00:00'")
+    connection.close()
+
+    connection = eventStore.openEventStore(storeLocation)
+    eventStore.upsertEvents(connection, {"features": [line]})
+    assert [tuple(row) for row in connection.execute(
+        "SELECT eventId, geometryDate FROM events")] == \
+           [("B", "2023-01-02T13:00:00Z")]
+    connection.close()
@@ -0,0 +1,178 @@
+"""
+    Description: Tests of "homogenize/homogenizeEvents.py": the light engine,
+    the geopandas engine, and "--stream" write the same homogenized events,
+    only new LineString vertices are kept, the incremental parser reads every
+    feature however the file is chunked, and columnar output reads back.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import copy # For making edge case features from bundled ones
+import gzip # For gzipped Events files
+import json # For reading + writing Events files
+import shutil # For copying the bundled data
+
+import homogenizeEvents # Code under test
+import pytest # For fixtures + tests
+
+## FIXTURES
+
+@pytest.fixture(scope="module")
+def dataLocation(repoRoot, tmp_path_factory):
+    """
+        Copy of the bundled data with edge cases added: a LineString whose
+        vertices are new, one whose vertices are all existing Points, and an
+        undated one that cannot be exploded.
+
+        Output: String location of the data folder
+    """
+    dataFolder = tmp_path_factory.mktemp("data")
+    for fileName in ("categories.json", "sources.json"):
+        shutil.copy(repoRoot / "homogenize" / "data" / fileName, dataFolder)
+    with open(repoRoot / "homogenize" / "data" / "events.geojson") as inFile:
+        events = json.load(inFile)
+
+    points = [feature for feature in events["features"]
+              if feature["geometry"]["type"] == "Point"]
+    template = copy.deepcopy(points[0])
+    template["properties"].pop("date", None)
+    template["properties"]["magnitudeValue"] = None
+    newLine = copy.deepcopy(template)
+    newLine["properties"]["geometryDates"] = ["2023-04-01 00:00:00",
+                                              "2023-04-02 00:00:00"]
+    newLine["geometry"] = {"type": "LineString",
+                           "coordinates": [[1.5, 2.5], [3.25, 4.75]]}
+    duplicateLine = copy.deepcopy(points[1])
+    duplicateLine["geometry"] = {"type": "LineString", "coordinates": [
+        points[1]["geometry"]["coordinates"]] * 2}
+    undatedLine = copy.deepcopy(template)
+    undatedLine["geometry"] = newLine["geometry"]
+    events["features"] += [newLine, duplicateLine, undatedLine]
+
+    with open(dataFolder / "events.geojson", "w") as outFile:
+        json.dump(events, outFile, indent=4)
+    return str(dataFolder)
+
+@pytest.fixture(scope="module")
+def parsedEONETData(dataLocation):
+    """
+        Parsed data of the edge case data folder.
+
+        Output: Dict of dicts from "parseData"
+    """
+    return homogenizeEvents.parseData(homogenizeEvents.readData(dataLocation))
+
+@pytest.fixture(scope="module")
+def homogenizedEvents(parsedEONETData):
+    """
+        Events homogenized by the geopandas engine.
+
+        Output: GeoDataFrame after "improveReadability"
+    """
+    return homogenizeEvents.improveReadability(
+        homogenizeEvents.homogenizeData(parsedEONETData), parsedEONETData)
+
+## TESTS
+
+def testEnginesWriteTheSameEvents(parsedEONETData, homogenizedEvents,
+                                  tmp_path):
+    lightFile = tmp_path / "light.geojson"
+    numFeatures = homogenizeEvents.writeFeatureCollection(
+        lightFile, homogenizeEvents.homogenizeFeatures(parsedEONETData))
+    assert numFeatures == len(homogenizedEvents)
+    assert lightFile.read_text() == \
+           homogenizedEvents.to_json(drop_id=True, indent=4)
+
+def testStreamWritesTheSameEvents(dataLocation, parsedEONETData,
+                                  homogenizedEvents, tmp_path):
+    streamFile = tmp_path / "stream.geojson"
+    counts = homogenizeEvents.streamHomogenizedEvents(
+        homogenizeEvents.locateData(dataLocation)["Events"], parsedEONETData,
+        str(streamFile))
+    assert counts["kept"] == len(homogenizedEvents)
+    assert streamFile.read_text() == \
+           homogenizedEvents.to_json(drop_id=True, indent=4)
+
+def testOnlyNewVerticesAreKept(dataLocation, parsedEONETData, tmp_path):
+    features = parsedEONETData["Events"]["features"]
+    explodedFeatures, vertexCounts = \
+        homogenizeEvents.explodeAndDeduplicate(features)
+    assert vertexCounts["new"] == 2 # Only the new LineString's vertices
+    assert vertexCounts["duplicate"] >= 2
+    assert [feature["geometry"]["coordinates"]
+            for feature in explodedFeatures[-2:]] == [[1.5, 2.5], [3.25, 4.75]]
+    assert [feature["properties"]["date"]
+            for feature in explodedFeatures[-2:]] == \
+           ["2023-04-01T00:00:00Z", "2023-04-02T00:00:00Z"]
+
+    counts = homogenizeEvents.streamHomogenizedEvents(
+        homogenizeEvents.locateData(dataLocation)["Events"], parsedEONETData,
+        str(tmp_path / "stream.geojson"))
+    assert counts["newVertices"] == 2
+    assert counts["duplicateVertices"] == vertexCounts["duplicate"]
+
+def testDroppingLinesKeepsOnlyPoints(parsedEONETData):
+    features = homogenizeEvents.homogenizeFeatures(parsedEONETData,
+                                                   explodeLines=False)
+    numPoints = sum(feature["geometry"]["type"] == "Point" for feature in
+                    parsedEONETData["Events"]["features"])
+    assert len(features) == numPoints
+    assert all(isinstance(feature["properties"]["magnitudeValue"], float)
+               for feature in features
+               if feature["properties"]["magnitudeValue"] is not None)
+
+def testUndatedLineIsNotExploded(parsedEONETData):
+    undatedLine = parsedEONETData["Events"]["features"][-1]
+    assert list(homogenizeEvents.explodeFeature(undatedLine)) == []
+
+@pytest.mark.parametrize("chunkSize", [7, 4096, 64 * 1024])
+@pytest.mark.parametrize("compress", [False, True])
+def testIterFeaturesReadsEveryFeature(dataLocation, tmp_path, monkeypatch,
+                                      chunkSize, compress):
+    with open(f"{dataLocation}/events.geojson") as inFile:
+        events = json.load(inFile)
+    bigFeature = copy.deepcopy(events["features"][0])
+    bigFeature["properties"]["description"] = "x" * 300000
+    events["features"].insert(1, bigFeature)
+
+    eventsFile = tmp_path / ("events.geojson.gz" if compress
+                             else "events.geojson")
+    openFile = gzip.open if compress else open
+    with openFile(eventsFile, "wt") as outFile:
+        json.dump(events, outFile, indent=2)
+    monkeypatch.setattr(homogenizeEvents, "streamChunkSize", chunkSize)
+    assert list(homogenizeEvents.iterFeatures(str(eventsFile))) == \
+           events["features"]
+
+def testIterFeaturesRejectsTruncatedFiles(tmp_path):
+    eventsFile = tmp_path / "events.geojson"
+    eventsFile.write_text('{"type": "FeatureCollection", "features": '
+                          '[{"type": "Feature", "properties": {"id": 1}}, '
+                          '{"type": "Feat')
+    with pytest.raises(json.JSONDecodeError):
+        list(homogenizeEvents.iterFeatures(str(eventsFile)))
+    eventsFile.write_text('{"type": "FeatureCollection"}')
+    with pytest.raises(ValueError):
+        list(homogenizeEvents.iterFeatures(str(eventsFile)))
+
+@pytest.mark.parametrize("eventsFormat", ["parquet", "feather"])
+def testColumnarEventsReadBack(homogenizedEvents, tmp_path, eventsFormat):
+    eventsFile = str(tmp_path / f"events.{eventsFormat}")
+    homogenizeEvents.writeColumnarEvents(eventsFile, homogenizedEvents,
+                                         eventsFormat)
+    readEvents = homogenizeEvents.readColumnarEvents(eventsFile)
+    assert len(readEvents) == len(homogenizedEvents)
+    assert sorted(readEvents["id"]) == sorted(homogenizedEvents["id"])
+
+    wildfires = homogenizeEvents.readColumnarEvents(
+        eventsFile, columns=["id", "simpleCategory"], category="Wildfires")
+    assert len(wildfires) == \
+           (homogenizedEvents["simpleCategory"] == "Wildfires").sum()
+
+    emptyFile = str(tmp_path / f"empty.{eventsFormat}")
+    homogenizeEvents.writeColumnarEvents(emptyFile, homogenizedEvents[:0],
+                                         eventsFormat)
+    assert len(homogenizeEvents.readColumnarEvents(emptyFile)) == 0
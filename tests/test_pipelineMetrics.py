@@ -0,0 +1,113 @@
+"""
+    Description: Tests of "pipelineMetrics.py": requests sent through the
+    scheduler are recorded (and malformed rate limit headers skipped instead
+    of failing the request), request totals keep counting across runs, and
+    stages are measured even when they fail.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import pipelineMetrics # Code under test
+import pytest # For fixtures + tests
+import requests # For sending requests to the stub + building responses
+import requestScheduler # For sending requests through the scheduler
+
+## FIXTURES
+
+@pytest.fixture(autouse=True)
+def freshMetrics(monkeypatch):
+    """
+        Gives every test its own module-wide metrics state, so runs started
+        by one test never leak into another.
+
+        Output: None
+    """
+    monkeypatch.setattr(pipelineMetrics, "activeRun", None)
+    monkeypatch.setattr(pipelineMetrics, "latestRun", None)
+    monkeypatch.setattr(pipelineMetrics, "requestTotals", {})
+
+## HELPER FUNCTIONS
+
+def createResponse(headers):
+    """
+        Builds a streamed 200 response with the given headers.
+
+        Input: Dict headers
+
+        Output: requests Response
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.headers.update(headers)
+    return response
+
+## TESTS
+
+def testNothingIsRecordedWithoutARun():
+    pipelineMetrics.recordRequest("http://stub/events", 1, 0.1)
+    pipelineMetrics.incrementCounter("dropped")
+    with pipelineMetrics.measureStage("reading"):
+        pass
+    assert pipelineMetrics.finishRun() is None
+
+def testMalformedHeadersAreSkipped():
+    run = pipelineMetrics.startRun("test", "run")
+    pipelineMetrics.recordRequest(
+        "http://stub/events", 1, 0.1,
+        createResponse({"X-RateLimit-Remaining": "10.0",
+                        "X-RateLimit-Limit": "lots",
+                        "Content-Length": "nan"}), streamed=True)
+    [request] = run["requests"]
+    assert request["status"] == 200
+    assert request["rateLimitRemaining"] == 10
+    assert request["rateLimitLimit"] is None
+    assert request["bytes"] is None
+
+def testSchedulerRequestsAreRecorded(startStub):
+    baseURL = startStub("--quota", "5")
+    scheduler = requestScheduler.createScheduler(ratePerSecond=1000.0,
+                                                 capacity=100)
+    pipelineMetrics.startRun("test", "run")
+    with requests.Session() as session:
+        for _ in range(2):
+            requestScheduler.sendRequest(scheduler, session,
+                                         f"{baseURL}/categories", 1, 0.01)
+    run = pipelineMetrics.finishRun(scheduler)
+
+    summary = pipelineMetrics.summarizeRequests(run)["/categories"]
+    assert summary["count"] == 2
+    assert summary["statuses"] == {"200": 2}
+    assert summary["rateLimitRemaining"] == 3
+    assert summary["rateLimitLimit"] == 5
+    assert summary["bytes"] > 0
+    assert run["scheduler"]["ratePerSecond"] < 1000.0 # Slowed by headroom
+
+def testRequestTotalsCountAcrossRuns():
+    for runId in ("first", "second"):
+        pipelineMetrics.startRun("test", runId)
+        pipelineMetrics.recordRequest(
+            "http://stub/events", 1, 0.5,
+            createResponse({"Content-Length": "100"}), streamed=True)
+        run = pipelineMetrics.finishRun()
+
+    assert run["requestTotals"]["/events"] == {
+        "statuses": {"200": 2}, "bytes": 200, "latencySum": 1.0, "count": 2}
+    prometheusText = pipelineMetrics.formatPrometheus(run)
+    assert 'eonet_requests_total{script="test",endpoint="/events",' \
+           'status="200"} 2' in prometheusText
+    assert 'eonet_request_latency_seconds_count{script="test",' \
+           'endpoint="/events"} 2' in prometheusText
+
+def testFailedStageIsRecorded():
+    run = pipelineMetrics.startRun("test", "run")
+    with pipelineMetrics.measureStage("parsing"):
+        with pytest.raises(ValueError):
+            with pipelineMetrics.measureStage("reading"):
+                raise ValueError("Bad data")
+    assert [(stage["name"], stage["failed"]) for stage in run["stages"]] == \
+           [("reading", True), ("parsing", False)]
+    assert all(stage["wallSeconds"] >= 0 for stage in run["stages"])
+    assert not run["openStages"]
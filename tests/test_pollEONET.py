@@ -0,0 +1,121 @@
+"""
+    Description: Tests of "pollEONET.py" against the stub EONET API: a cycle
+    with nothing new writes nothing, Categories and Sources come from the TTL
+    cache (and a 304 once it expires reuses the cached data), and metadata
+    that changed stays pending until a cycle manages to write it.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import os # For changing a served file's ETag
+import shutil # For copying the bundled data the stub serves
+
+import pipelineMetrics # For counting the requests of each cycle
+import pollEONET # Code under test
+import pullData # For the shared session
+import pytest # For fixtures + tests
+
+## FIXTURES
+
+@pytest.fixture
+def clock():
+    """
+        Clock for the TTL cache that only moves when a test moves it.
+
+        Output: Dict with the current time under "now" and the "clock"
+        function reading it
+    """
+    clock = {"now": 0.0}
+    clock["clock"] = lambda: clock["now"]
+    return clock
+
+@pytest.fixture
+def poll(startStub, fastScheduler, clock, repoRoot, tmp_path, monkeypatch):
+    """
+        Daemon state, session and arguments for polling a stub serving a copy
+        of the bundled data, with a 60 second metadata TTL.
+
+        Output: Dict with "dataFolder" the stub serves, the daemon "state"
+        and "arguments", and "cycle" running one cycle and returning its
+        result and the statuses of its requests per endpoint
+    """
+    monkeypatch.setattr(pipelineMetrics, "activeRun", None)
+    dataFolder = tmp_path / "data"
+    shutil.copytree(repoRoot / "homogenize" / "data", dataFolder)
+    baseURL = startStub("--data", str(dataFolder))
+    arguments = pollEONET.parseArguments(["--output", str(tmp_path / "latest"),
+                                          "--base-url", baseURL])
+    (tmp_path / "latest").mkdir()
+    state = {"cache": pollEONET.createMetadataCache(60.0, clock["clock"]),
+             "validators": None, "events": None}
+    session = pullData.createSession()
+
+    def cycle():
+        run = pipelineMetrics.startRun("pollEONET", "cycle")
+        try:
+            result = pollEONET.pollCycle(state, session, arguments, 1, 0.01)
+        finally:
+            pipelineMetrics.finishRun()
+        return result, {endpoint: summary["statuses"] for endpoint, summary
+                        in pipelineMetrics.summarizeRequests(run).items()}
+
+    yield {"dataFolder": dataFolder, "state": state, "arguments": arguments,
+           "cycle": cycle}
+    session.close()
+
+## TESTS
+
+def testUnchangedCyclesReuseCachedData(poll, clock, tmp_path):
+    numEvents, statuses = poll["cycle"]()
+    assert numEvents > 0
+    assert statuses == {"/categories": {"200": 1}, "/sources": {"200": 1},
+                        "/events/geojson": {"200": 1}}
+    outputFiles = sorted(path.name for path in
+                         (tmp_path / "latest").iterdir())
+    assert outputFiles == ["homogenizedEvents.geojson",
+                           "parsedCategories.json", "parsedSources.json"]
+    cachedData = {typeURL: entry["data"] for typeURL, entry in
+                  poll["state"]["cache"]["entries"].items()}
+
+    # Metadata still fresh, so only Events are requested
+    clock["now"] += 30
+    assert poll["cycle"]() == (None, {"/events/geojson": {"304": 1}})
+
+    # Metadata expired but unchanged; the 304s reuse the cached data
+    clock["now"] += 60
+    assert poll["cycle"]() == (None, {"/categories": {"304": 1},
+                                      "/sources": {"304": 1},
+                                      "/events/geojson": {"304": 1}})
+    for typeURL, entry in poll["state"]["cache"]["entries"].items():
+        assert entry["data"] is cachedData[typeURL]
+        assert entry["fetchedAt"] == 90
+        assert not entry["unwritten"]
+
+def testFailedWriteKeepsMetadataPending(poll, clock, monkeypatch):
+    poll["cycle"]()
+
+    # Categories change while Events do not, and writing the output fails
+    categoriesFile = poll["dataFolder"] / "categories.json"
+    modifiedTime = categoriesFile.stat().st_mtime_ns + 10 ** 9
+    os.utime(categoriesFile, ns=(modifiedTime, modifiedTime))
+    clock["now"] += 90
+    writeLatestData = pollEONET.writeLatestData
+    def failingWrite(*args):
+        raise OSError("Disk full")
+    monkeypatch.setattr(pollEONET, "writeLatestData", failingWrite)
+    with pytest.raises(OSError):
+        poll["cycle"]()
+    entries = poll["state"]["cache"]["entries"]
+    assert entries["Categories"]["unwritten"]
+    assert not entries["Sources"]["unwritten"]
+
+    # The next cycle writes the pending Categories from the fresh cache
+    monkeypatch.setattr(pollEONET, "writeLatestData", writeLatestData)
+    numEvents, statuses = poll["cycle"]()
+    assert numEvents > 0
+    assert statuses == {"/events/geojson": {"304": 1}}
+    assert not entries["Categories"]["unwritten"]
+    assert poll["cycle"]() == (None, {"/events/geojson": {"304": 1}})
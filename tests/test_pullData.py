@@ -0,0 +1,197 @@
+"""
+    Description: Tests of "pullData.py" against the stub EONET API:
+    concurrent requests (every endpoint at once over one shared Session),
+    streaming (gzipped files hold the served bytes, and a body cut off
+    mid-stream never replaces a file), the incremental sync (a second sync
+    with nothing new changes nothing) and backfill checkpoints (an
+    interrupted backfill only fetches the missing shards).
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import gzip # For reading streamed files back
+import json # For comparing merged events
+import threading # For telling the concurrent requests' threads apart
+import time # For timing concurrent requests
+
+import pullData # Code under test
+import pytest # For tests
+
+## CONSTANTS
+backfillStart, backfillEnd = "2023-01-01", "2023-04-30" # Bundled data's range
+
+## TESTS
+
+def testConcurrentRequestsShareOneSession(startStub, fastScheduler,
+                                          monkeypatch):
+    latency = 0.5
+    baseURL = startStub("--latency", str(latency))
+    sessions, calls = [], []
+    originalCreateSession = pullData.createSession
+    originalRequestHTTP = pullData.requestHTTP
+
+    def createSession(*args):
+        sessions.append(originalCreateSession(*args))
+        return sessions[-1]
+
+    def requestHTTP(URL, tryTimes, pauseTime, session=None, *args, **kwargs):
+        calls.append((threading.get_ident(), session))
+        return originalRequestHTTP(URL, tryTimes, pauseTime, session, *args,
+                                   **kwargs)
+
+    monkeypatch.setattr(pullData, "createSession", createSession)
+    monkeypatch.setattr(pullData, "requestHTTP", requestHTTP)
+    requestStart = time.perf_counter()
+    jsonData = pullData.requestEONETDataConcurrently(1, 0.01, 3, baseURL)
+    elapsed = time.perf_counter() - requestStart
+
+    assert list(jsonData) == ["Events", "Categories", "Sources"]
+    assert len(sessions) == 1
+    assert [session for _, session in calls] == sessions * 3
+    assert len({thread for thread, _ in calls}) == 3
+    assert elapsed < 2 * latency # One after another would take 3 latencies
+
+@pytest.mark.parametrize("maxWorkers", ["0", "-1"])
+def testMaxWorkersShouldBePositive(maxWorkers):
+    with pytest.raises(SystemExit):
+        pullData.parseArguments(["--concurrent", "--max-workers", maxWorkers])
+
+@pytest.mark.parametrize("chunks, error", [
+    ([b' {"a": "\xc3', b'\xa9"}\n'], None), # An e-acute split in two
+    ([b"[]"], None),
+    ([b'{"a": [1, 2'], "looks truncated"),
+    ([b"<html></html>"], "does not start like a JSON document"),
+    ([b"  "], "does not start like a JSON document"),
+    ([b'{"a": "\xc3'], "unexpected end of data")])
+def testJSONCheck(chunks, error):
+    checkState = pullData.startJSONCheck()
+    for chunk in chunks:
+        pullData.checkJSONChunk(checkState, chunk)
+    if error is None:
+        pullData.finishJSONCheck(checkState)
+    else:
+        with pytest.raises(ValueError, match=error):
+            pullData.finishJSONCheck(checkState)
+    assert checkState["size"] == sum(len(chunk) for chunk in chunks)
+
+def testStreamWritesGzippedBody(startStub, fastScheduler, repoRoot,
+                                tmp_path):
+    baseURL = startStub()
+    fileLocation = tmp_path / "events.geojson.gz"
+    size = pullData.streamHTTPJSON(f"{baseURL}/events/geojson",
+                                   str(fileLocation), 1, 0.01, compress=True)
+    servedBytes = (repoRoot / "homogenize" / "data" /
+                   "events.geojson").read_bytes()
+    assert size == len(servedBytes)
+    assert gzip.decompress(fileLocation.read_bytes()) == servedBytes
+    assert list(tmp_path.iterdir()) == [fileLocation]
+
+@pytest.mark.parametrize("compress", [False, True])
+def testCutOffStreamKeepsPreviousFile(startStub, fastScheduler, tmp_path,
+                                      compress):
+    baseURL = startStub("--cut-off", "0.5")
+    fileLocation = tmp_path / "events.geojson"
+    fileLocation.write_bytes(b"previous")
+    with pytest.raises(ValueError, match="looks truncated"):
+        pullData.streamHTTPJSON(f"{baseURL}/events/geojson",
+                                str(fileLocation), 1, 0.01,
+                                compress=compress)
+    assert fileLocation.read_bytes() == b"previous"
+    assert list(tmp_path.iterdir()) == [fileLocation] # No temporary file
+
+def testSyncThenNoOpSync(startStub, fastScheduler, tmp_path):
+    baseURL = startStub()
+    syncFolder = pullData.createSyncFolder(str(tmp_path))
+
+    changedTypes = pullData.syncEONETData(syncFolder, 1, 0.01, baseURL)
+    assert changedTypes == ["Events", "Categories", "Sources"]
+    state = pullData.readSyncState(syncFolder)
+    assert state["watermark"] is not None
+    assert set(state["validators"]) == {"Events", "Categories", "Sources"}
+    eventsFile = tmp_path / "output" / "sync" / "events.geojson"
+    syncedEvents = eventsFile.read_bytes()
+
+    # Unchanged Categories + Sources answer 304s, and the Events delta since
+    # the watermark is empty, so nothing is rewritten
+    assert pullData.syncEONETData(syncFolder, 1, 0.01, baseURL) == []
+    assert eventsFile.read_bytes() == syncedEvents
+    assert pullData.readSyncState(syncFolder)["validators"] == \
+           state["validators"]
+
+def testBackfillResumesFromCheckpoints(startStub, fastScheduler, tmp_path):
+    baseURL = startStub()
+    backfillFolder = pullData.createBackfillFolder(
+        backfillStart, backfillEnd, outputLocation=str(tmp_path))
+    events, counts = pullData.backfillEONETData(
+        backfillFolder, backfillStart, backfillEnd, windowDays=30,
+        tryTimes=1, pauseTime=0.01, baseURL=baseURL)
+    shardFiles = sorted((tmp_path / "output" / "backfill").glob("*/shards/*"))
+    assert counts == {"fetched": len(shardFiles), "resumed": 0}
+    assert len(shardFiles) == len(pullData.determineWindows(
+        backfillStart, backfillEnd, 30))
+    assert events["features"]
+
+    # Lose one shard, as if the backfill was interrupted, and run it again
+    shardFiles[-1].unlink()
+    resumedEvents, counts = pullData.backfillEONETData(
+        backfillFolder, backfillStart, backfillEnd, windowDays=30,
+        tryTimes=1, pauseTime=0.01, baseURL=baseURL)
+    assert counts == {"fetched": 1, "resumed": len(shardFiles) - 1}
+    assert json.dumps(resumedEvents) == json.dumps(events)
+
+def testBackfillFolderDependsOnSettings(tmp_path):
+    folders = {pullData.createBackfillFolder(
+                   backfillStart, backfillEnd, categories, windowDays, limit,
+                   str(tmp_path))
+               for categories, windowDays, limit in [
+                   (None, 30, None), (None, 7, None), (None, 30, 50),
+                   (["wildfires"], 30, None)]}
+    assert len(folders) == 4
+
+def testDetermineWindowsCoversRange():
+    windows = pullData.determineWindows("2023-01-01", "2023-03-05", 30)
+    assert windows == [("2023-01-01", "2023-01-30"),
+                       ("2023-01-31", "2023-03-01"),
+                       ("2023-03-02", "2023-03-05")]
+
+def testMergeEventsUpsertsByEventAndDate():
+    def feature(eventId, date, closed=None):
+        return {"type": "Feature", "geometry": None,
+                "properties": {"id": eventId, "date": date,
+                               "closed": closed}}
+    previousEvents = {"type": "FeatureCollection",
+                      "features": [feature("A", "1"), feature("A", "2"),
+                                   feature("B", "1")]}
+    changedEvents = {"type": "FeatureCollection",
+                     "features": [feature("A", "2", "3"), feature("C", "1")]}
+    mergedEvents = pullData.mergeEvents(previousEvents, changedEvents)
+    assert [(feature["properties"]["id"], feature["properties"]["date"],
+             feature["properties"]["closed"])
+            for feature in mergedEvents["features"]] == \
+           [("A", "2", "3"), ("C", "1", None), ("A", "1", "3"),
+            ("B", "1", None)]
+
+def testMergeEventsReplacesGrownLineString():
+    def track(dates, closed=None):
+        return {"type": "Feature",
+                "geometry": {"type": "LineString",
+                             "coordinates": [[index, index]
+                                             for index in range(len(dates))]},
+                "properties": {"id": "A", "geometryDates": dates,
+                               "closed": closed}}
+    point = {"type": "Feature",
+             "geometry": {"type": "Point", "coordinates": [0, 0]},
+             "properties": {"id": "A", "date": "1", "closed": None}}
+    previousEvents = {"type": "FeatureCollection",
+                      "features": [track(["1", "2"]), point]}
+    changedEvents = {"type": "FeatureCollection",
+                     "features": [track(["1", "2", "3"], "4")]}
+    mergedEvents = pullData.mergeEvents(previousEvents, changedEvents)
+    assert [(feature["geometry"]["type"],
+             len(feature["geometry"]["coordinates"]),
+             feature["properties"]["closed"])
+            for feature in mergedEvents["features"]] == \
+           [("LineString", 3, "4"), ("Point", 2, "4")]
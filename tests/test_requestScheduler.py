@@ -0,0 +1,195 @@
+"""
+    Description: Tests of "requestScheduler.py": backoff delays, Retry-After
+    parsing, the circuit breaker (with a fake clock, so nothing really
+    waits), and retrying throttled requests against the stub EONET API.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+from datetime import datetime, timezone # For HTTP-date Retry-After values
+from email.utils import format_datetime # For HTTP-date Retry-After values
+import threading # For requests waiting on a half-open trial
+import time # For bounding how long waiting threads take
+
+import pytest # For tests
+import requests # For sending requests to the stub
+import requestScheduler # Code under test
+
+## HELPER FUNCTIONS
+
+class FakeClock:
+    """
+        Clock whose sleep moves time forward instead of waiting.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def createFakeScheduler(**settings):
+    """
+        Creates a scheduler on a fake clock.
+
+        Input: Keyword arguments for "createScheduler"
+
+        Output: Tuple of (scheduler dict, FakeClock)
+    """
+    fakeClock = FakeClock()
+    scheduler = requestScheduler.createScheduler(clock=fakeClock.clock,
+                                                 sleep=fakeClock.sleep,
+                                                 **settings)
+    return scheduler, fakeClock
+
+## TESTS
+
+def testBackoffDelayStaysWithinBounds():
+    scheduler, _ = createFakeScheduler(maxDelay=10.0)
+    for attempt in range(8):
+        ceiling = min(10.0, 0.5 * 2 ** attempt)
+        delays = [requestScheduler.backoffDelay(scheduler, attempt, 0.5)
+                  for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+    assert max(requestScheduler.backoffDelay(scheduler, 20, 0.5)
+               for _ in range(200)) <= 10.0
+
+@pytest.mark.parametrize("value, expected", [
+    ("120", 120.0), ("1.5", 1.5), ("-3", 0.0), ("", None), (None, None),
+    ("soon", None)])
+def testParseRetryAfterSeconds(value, expected):
+    assert requestScheduler.parseRetryAfter(value) == expected
+
+def testParseRetryAfterHTTPDate():
+    now = datetime(2026, 10, 17, 12, 0, 0, tzinfo=timezone.utc).timestamp()
+    later = format_datetime(datetime(2026, 10, 17, 12, 1, 30,
+                                     tzinfo=timezone.utc), usegmt=True)
+    assert requestScheduler.parseRetryAfter(later, now) == 90.0
+    assert requestScheduler.parseRetryAfter(later, now + 600) == 0.0
+
+def testTokenBucketPacesRequests():
+    scheduler, fakeClock = createFakeScheduler(ratePerSecond=2.0, capacity=1)
+    for _ in range(3):
+        requestScheduler.acquireToken(scheduler)
+    assert fakeClock.now == pytest.approx(1001.0) # Two waits of 0.5 seconds
+    assert scheduler["stats"]["requests"] == 3
+
+def testConfigureSchedulerChangesRate():
+    scheduler, fakeClock = createFakeScheduler(ratePerSecond=1.0, capacity=1)
+    requestScheduler.configureScheduler(scheduler, 10.0)
+    assert scheduler["ratePerSecond"] == scheduler["baseRatePerSecond"] == 10.0
+    requestScheduler.acquireToken(scheduler)
+    requestScheduler.acquireToken(scheduler)
+    assert fakeClock.now == pytest.approx(1000.1)
+
+def testBreakerOpensThenClosesAfterSuccessfulTrial():
+    scheduler, fakeClock = createFakeScheduler(failureThreshold=3,
+                                               cooldown=30.0)
+    for _ in range(3):
+        requestScheduler.recordOutcome(scheduler, isFailure=True)
+    assert scheduler["breaker"] == "open"
+    assert scheduler["stats"]["breakerTrips"] == 1
+    with pytest.raises(requestScheduler.CircuitOpenError):
+        requestScheduler.acquireToken(scheduler)
+
+    # After the cooldown one trial goes out; its success closes the breaker
+    fakeClock.now += 30.0
+    requestScheduler.acquireToken(scheduler)
+    assert scheduler["breaker"] == "halfOpen"
+    assert scheduler["trialInFlight"]
+    requestScheduler.recordOutcome(scheduler, isFailure=False)
+    assert scheduler["breaker"] == "closed"
+    assert scheduler["consecutiveFailures"] == 0
+
+def testFailedTrialReopensBreaker():
+    scheduler, fakeClock = createFakeScheduler(failureThreshold=1,
+                                               cooldown=30.0)
+    requestScheduler.recordOutcome(scheduler, isFailure=True)
+    fakeClock.now += 30.0
+    requestScheduler.acquireToken(scheduler)
+    requestScheduler.recordOutcome(scheduler, isFailure=True)
+    assert scheduler["breaker"] == "open"
+    assert scheduler["breakerOpenUntil"] == fakeClock.now + 30.0
+    assert scheduler["stats"]["breakerTrips"] == 2
+
+@pytest.mark.parametrize("trialFails", [False, True])
+def testRequestsWaitForHalfOpenTrial(trialFails):
+    clockNow = [0.0]
+    scheduler = requestScheduler.createScheduler(
+        ratePerSecond=1000.0, capacity=10, failureThreshold=1, cooldown=5.0,
+        clock=lambda: clockNow[0])
+    requestScheduler.recordOutcome(scheduler, isFailure=True)
+    clockNow[0] = 5.0
+    requestScheduler.acquireToken(scheduler) # The trial
+
+    outcomes = []
+    def waitForToken():
+        try:
+            requestScheduler.acquireToken(scheduler)
+            outcomes.append("sent")
+        except requestScheduler.CircuitOpenError:
+            outcomes.append("refused")
+    waiters = [threading.Thread(target=waitForToken) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    time.sleep(4 * requestScheduler.trialPollInterval)
+    assert outcomes == [] # Nobody goes out while the trial is in flight
+
+    requestScheduler.recordOutcome(scheduler, isFailure=trialFails)
+    for waiter in waiters:
+        waiter.join(timeout=5)
+    assert outcomes == ["refused" if trialFails else "sent"] * 3
+
+def testSendRequestHonorsRetryAfter(startStub):
+    baseURL = startStub("--throttle-rate", "1", "--retry-after", "7")
+    scheduler, fakeClock = createFakeScheduler(ratePerSecond=1000.0)
+    with requests.Session() as session:
+        response = requestScheduler.sendRequest(
+            scheduler, session, f"{baseURL}/categories", tryTimes=3,
+            pauseTime=0.01)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert scheduler["stats"]["retries"] == 2
+    assert scheduler["stats"]["throttled"] == 2
+    assert fakeClock.now - 1000.0 >= 14.0 # Paused twice for Retry-After
+
+def testLongRetryAfterFailsFast(startStub):
+    baseURL = startStub("--throttle-rate", "1", "--retry-after", "120")
+    scheduler, fakeClock = createFakeScheduler(ratePerSecond=1000.0,
+                                               maxDelay=60.0)
+    with requests.Session() as session:
+        with pytest.raises(requestScheduler.RetryAfterTooLongError):
+            requestScheduler.sendRequest(scheduler, session,
+                                         f"{baseURL}/categories", 3, 0.01)
+    assert scheduler["stats"]["requests"] == 1 # No early retries
+    assert fakeClock.now - 1000.0 < 1.0
+
+def testExhaustedQuotaPausesBeforeThrottling(startStub):
+    baseURL = startStub("--quota", "1", "--window", "0.5")
+    scheduler = requestScheduler.createScheduler(ratePerSecond=1000.0)
+    with requests.Session() as session:
+        first = requestScheduler.sendRequest(
+            scheduler, session, f"{baseURL}/categories", 1, 0.01)
+        pausedAt = time.monotonic()
+        second = requestScheduler.sendRequest(
+            scheduler, session, f"{baseURL}/categories", 1, 0.01)
+    assert first.headers["X-RateLimit-Remaining"] == "0"
+    assert second.status_code == 200 # Waited for the reset instead of a 429
+    assert time.monotonic() - pausedAt >= 0.9
+    assert scheduler["stats"]["throttled"] == 0
+
+def testSendRequestRaisesAfterConnectionErrors():
+    scheduler, fakeClock = createFakeScheduler(ratePerSecond=1000.0,
+                                               failureThreshold=10)
+    with pytest.raises(requests.ConnectionError):
+        requestScheduler.sendRequest(scheduler, requests,
+                                     "http://127.0.0.1:9/categories", 2, 0.01)
+    assert scheduler["consecutiveFailures"] == 2
+    assert scheduler["stats"]["retries"] == 1
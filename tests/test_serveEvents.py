@@ -0,0 +1,172 @@
+"""
+    Description: Tests of "serveEvents.py" over a copy of the bundled
+    homogenized output: paging with cursors, cached responses and their
+    ETags, reloading a new snapshot (and refusing cursors of the old one),
+    and conditional requests over HTTP.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import gzip # For decompressing responses
+from http.server import ThreadingHTTPServer # For serving over HTTP
+import json # For reading responses
+import os # For replacing the events file like pollEONET.py does
+import shutil # For copying the bundled output
+import threading # For serving while a test runs
+import urllib.error # For non-200 responses
+import urllib.request # For HTTP requests
+
+import pytest # For fixtures + tests
+import serveEvents # Code under test
+
+## CONSTANTS
+homogenizedLocation = "homogenize/output/24-04-2023_T22-06-02"
+
+## FIXTURES
+
+@pytest.fixture
+def dataLocation(repoRoot, tmp_path):
+    """
+        Copy of the bundled homogenized output the service can be pointed at
+        (and that tests may replace files in).
+
+        Output: String location of the data folder
+    """
+    dataFolder = tmp_path / "latest"
+    shutil.copytree(repoRoot / homogenizedLocation, dataFolder)
+    return str(dataFolder)
+
+@pytest.fixture
+def service(dataLocation):
+    """
+        Service over the data folder that checks for a new snapshot on every
+        request.
+
+        Output: Service dict from "createService"
+    """
+    return serveEvents.createService(dataLocation, cacheSize=4,
+                                     checkInterval=0.0)
+
+## HELPER FUNCTIONS
+
+def getJSON(service, path, queryString=""):
+    """
+        Answers a request through the service, uncompressed.
+
+        Input: Service dict, string path, string queryString
+
+        Output: Tuple of (parsed JSON body, string ETag)
+    """
+    snapshot = serveEvents.refreshSnapshot(service)
+    status, body, etag, _ = serveEvents.respond(service, snapshot, path,
+                                                queryString, "identity")
+    assert status == 200
+    return json.loads(body), etag
+
+def replaceEvents(dataLocation, numFeatures):
+    """
+        Replaces the events file with one holding only its first features,
+        atomically like pollEONET.py.
+
+        Input: String dataLocation, integer numFeatures to keep
+
+        Output: None
+    """
+    eventsFile = os.path.join(dataLocation, "homogenizedEvents.geojson")
+    with open(eventsFile) as inFile:
+        events = json.load(inFile)
+    events["features"] = events["features"][:numFeatures]
+    with open(f"{eventsFile}.tmp", "w") as outFile:
+        json.dump(events, outFile)
+    os.replace(f"{eventsFile}.tmp", eventsFile)
+
+## TESTS
+
+def testPagesCoverEveryMatchOnce(service):
+    everything, _ = getJSON(service, "/events", "category=wildfires")
+    assert everything["numberReturned"] == everything["numberMatched"]
+    assert everything["next"] is None
+
+    featureIds = []
+    queryString = "category=wildfires&limit=50"
+    while True:
+        page, _ = getJSON(service, "/events", queryString)
+        assert page["numberMatched"] == everything["numberMatched"]
+        featureIds += [(feature["properties"]["id"],
+                        feature["properties"]["date"])
+                       for feature in page["features"]]
+        if page["next"] is None:
+            break
+        queryString = f"category=wildfires&limit=50&cursor={page['next']}"
+    assert featureIds == [(feature["properties"]["id"],
+                           feature["properties"]["date"])
+                          for feature in everything["features"]]
+
+def testCursorRoundTrip():
+    cursor = serveEvents.encodeCursor("abc123", 41)
+    assert serveEvents.decodeCursor(cursor, "abc123") == 41
+    with pytest.raises(serveEvents.RequestError) as error:
+        serveEvents.decodeCursor("not a cursor", "abc123")
+    assert error.value.status == 400
+
+@pytest.mark.parametrize("queryString", ["bbox=1,2,3", "bbox=5,0,1,1",
+                                         "limit=0", "limit=x",
+                                         "start=yesterday"])
+def testBadQueriesAre400s(service, queryString):
+    snapshot = serveEvents.refreshSnapshot(service)
+    with pytest.raises(serveEvents.RequestError) as error:
+        serveEvents.respond(service, snapshot, "/events", queryString,
+                            "identity")
+    assert error.value.status == 400
+
+def testEqualQueriesShareCacheEntryAndETag(service):
+    snapshot = serveEvents.refreshSnapshot(service)
+    first = serveEvents.respond(service, snapshot, "/events",
+                                "category=volcanoes&limit=5", "gzip")
+    second = serveEvents.respond(service, snapshot, "/events",
+                                 "limit=5&category=volcanoes", "gzip")
+    assert second == first
+    assert service["stats"] == {"hits": 1, "misses": 1, "reloads": 1}
+    assert first[3] == "gzip"
+    assert json.loads(gzip.decompress(first[1]))["numberReturned"] == 5
+    identity = serveEvents.respond(service, snapshot, "/events",
+                                   "category=volcanoes&limit=5", "identity")
+    assert identity[2] != first[2] # Each encoding has its own ETag
+
+def testNewSnapshotReloadsAndRefusesOldCursors(service, dataLocation):
+    page, etag = getJSON(service, "/events", "limit=10")
+    replaceEvents(dataLocation, 100)
+    newPage, newETag = getJSON(service, "/events", "limit=10")
+    assert newPage["numberMatched"] == 100
+    assert newETag != etag
+    assert service["stats"]["reloads"] == 2
+
+    snapshot = serveEvents.refreshSnapshot(service)
+    with pytest.raises(serveEvents.RequestError) as error:
+        serveEvents.respond(service, snapshot, "/events",
+                            f"limit=10&cursor={page['next']}", "identity")
+    assert error.value.status == 410
+
+def testConditionalRequestsOverHTTP(service):
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 serveEvents.createHandler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    URL = f"http://127.0.0.1:{server.server_address[1]}/events?limit=3"
+    try:
+        with urllib.request.urlopen(URL) as response:
+            etag = response.headers["ETag"]
+            assert json.loads(response.read())["numberReturned"] == 3
+        request = urllib.request.Request(URL,
+                                         headers={"If-None-Match": etag})
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request)
+        assert error.value.code == 304
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(URL.replace("/events", "/nowhere"))
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,115 @@
+"""
+    Description: Tests of "snapshotStore.py": per-event deltas rebuild the
+    exact Events they were made from, and runs saved to a store are checked
+    out byte for byte like pullData.py would have written them.
+
+    Input: None
+
+    Output: pytest results
+"""
+
+## IMPORTS
+import copy # For changing events without touching the originals
+import hashlib # For the digest of a blob
+import json # For reading the bundled data
+
+import pytest # For fixtures + tests
+import snapshotStore # Code under test
+
+## FIXTURES
+
+@pytest.fixture(scope="module")
+def EONETData(repoRoot):
+    """
+        The bundled Events, Categories, and Sources.
+
+        Output: Dict of type of EONET data to its JSON data
+    """
+    return {typeData: json.loads((repoRoot / "homogenize" / "data" /
+                                  fileName).read_text())
+            for typeData, fileName in snapshotStore.snapshotFileNames.items()}
+
+## HELPER FUNCTIONS
+
+def changeEvents(events):
+    """
+        Makes a next run's Events: one event closed, one removed, one added,
+        and the first two features swapped.
+
+        Input: GeoJSON FeatureCollection dict events
+
+        Output: Changed copy of events
+    """
+    events = copy.deepcopy(events)
+    features = events["features"]
+    features[5]["properties"]["closed"] = "2023-04-25T00:00:00Z"
+    removedId = features[10]["properties"]["id"]
+    features[:] = [feature for feature in features
+                   if feature["properties"]["id"] != removedId]
+    newFeature = copy.deepcopy(features[0])
+    newFeature["properties"]["id"] = "EONET_TEST"
+    features.append(newFeature)
+    features[0], features[1] = features[1], features[0]
+    return events
+
+## TESTS
+
+def testKeyframeRoundTrip(EONETData):
+    events = EONETData["Events"]
+    delta = snapshotStore.diffEvents(None, events)
+    assert delta["removed"] == []
+    assert snapshotStore.applyEventsDelta(None, delta) == events
+
+def testDeltaRoundTrip(EONETData):
+    previousEvents = EONETData["Events"]
+    events = changeEvents(previousEvents)
+    delta = snapshotStore.diffEvents(previousEvents, events)
+    assert len(delta["removed"]) == 1
+    assert "EONET_TEST" in delta["changed"]
+    assert len(delta["changed"]) <= 4 # Only the events that changed
+    assert "collection" not in delta
+    assert snapshotStore.applyEventsDelta(previousEvents, delta) == events
+
+def testUnchangedEventsGiveEmptyDelta(EONETData):
+    events = EONETData["Events"]
+    assert snapshotStore.diffEvents(events, copy.deepcopy(events)) == \
+           {"removed": [], "changed": {}}
+
+def testSaveAndCheckoutRuns(EONETData, tmp_path):
+    storeLocation = str(tmp_path / "snapshots")
+    secondData = dict(EONETData, Events=changeEvents(EONETData["Events"]))
+    firstManifest = snapshotStore.saveSnapshot(storeLocation, EONETData,
+                                               "run1")
+    secondManifest = snapshotStore.saveSnapshot(storeLocation, secondData,
+                                                "run2")
+    assert firstManifest["eventsBase"] is None
+    assert secondManifest["eventsBase"] == "run1"
+    assert secondManifest["blobs"]["Categories"] == \
+           firstManifest["blobs"]["Categories"] # Stored once
+    with pytest.raises(FileExistsError):
+        snapshotStore.saveSnapshot(storeLocation, EONETData, "run1")
+
+    for runId, data in (("run1", EONETData), ("run2", secondData)):
+        assert snapshotStore.loadSnapshot(storeLocation, runId) == data
+        fileLocations = snapshotStore.checkoutSnapshot(
+            storeLocation, runId, str(tmp_path / runId))
+        for typeData, fileLocation in fileLocations.items():
+            with open(fileLocation, "rb") as inFile:
+                assert inFile.read() == \
+                       snapshotStore.serializeJSON(data[typeData])
+    assert snapshotStore.loadSnapshot(storeLocation) == secondData # HEAD
+
+def testLeftoverTempBlobsAreIgnored(EONETData, tmp_path):
+    storeLocation = str(tmp_path / "snapshots")
+    data = snapshotStore.serializeJSON(EONETData["Categories"])
+    digest = hashlib.sha256(data).hexdigest()
+    _, extension = snapshotStore.compressBlob(data)
+    blobFolder = tmp_path / "snapshots" / "blobs" / digest[:2]
+    blobFolder.mkdir(parents=True)
+    (blobFolder / f"{digest}{extension}.tmp").write_bytes(b"partial")
+
+    with pytest.raises(FileNotFoundError):
+        snapshotStore.readBlob(storeLocation, digest)
+    assert snapshotStore.writeBlob(storeLocation, data) == digest
+    assert (blobFolder / f"{digest}{extension}").is_file()
+    assert snapshotStore.readBlob(storeLocation, digest) == data